@@ -0,0 +1,97 @@
+# bench/bench_adaptive.py
+"""Bot API calls per completed test with and without early stopping.
+
+Simulated users answer with their own preferred style with probability
+--consistency and with another random style otherwise. Every mode replays
+the same answer sequences against the fake API, so the reports show both
+the calls saved and how often the shortened test picks the same style as
+the full one.
+
+Run from the repository root: python -m bench.bench_adaptive
+"""
+import argparse
+import asyncio
+import random
+
+from bench.fake_api import FakeBotAPI, make_bot
+from bench.updates import message_update, callback_update
+from scoring import EarlyStop, dominant_style
+from sessions import STYLE_CODES
+import main
+
+BASE_USER_ID = 5_000_000
+
+
+def answer_sequences(users, consistency, rng):
+    sequences = []
+    for _ in range(users):
+        preferred = rng.choice(STYLE_CODES)
+        others = [code for code in STYLE_CODES if code != preferred]
+        sequences.append([
+            preferred if rng.random() < consistency else rng.choice(others)
+            for _ in range(main.content.questions)
+        ])
+    return sequences
+
+
+async def run_mode(api, bot, early_stop, sequences):
+    main.early_stop = early_stop
+    update_ids = iter(range(1, 10 ** 9))
+    results = []
+    answered = 0
+    calls = 0
+    for n, answers in enumerate(sequences):
+        user_id = BASE_USER_ID + n
+        # api.last_question просматривает журнал вызовов, держим его коротким
+        api.reset()
+        await main.dp.feed_webhook_update(bot, message_update(next(update_ids), '/test', user_id))
+        taps = []
+        for code in answers:
+            if user_id not in main.user_data:
+                break
+            data = next(item for item in api.last_question(user_id) if item.endswith(f':{code}'))
+            update_id = next(update_ids)
+            await main.dp.feed_webhook_update(bot, callback_update(update_id, data, api.last_message_ids[user_id], user_id))
+            taps.append(code)
+        answered += len(taps)
+        calls += sum(api.counts.values())
+        results.append(dominant_style({code: taps.count(code) for code in STYLE_CODES}))
+    return calls / len(sequences), answered / len(sequences), results
+
+
+async def run(args):
+    sequences = answer_sequences(args.users, args.consistency, random.Random(args.seed))
+    total = main.content.questions
+    modes = [
+        ('full test', None),
+        ('stop when decided', EarlyStop(total, confidence=2)),
+        (f'adaptive, confidence {args.confidence}', EarlyStop(total, args.confidence, args.min_answers)),
+    ]
+    api = await FakeBotAPI().start()
+    bot = make_bot(api.url)
+    try:
+        reference = None
+        for name, early_stop in modes:
+            calls, questions, results = await run_mode(api, bot, early_stop, sequences)
+            if reference is None:
+                reference = results
+            same = sum(a == b for a, b in zip(results, reference)) / len(results)
+            print(f"{name:32} {calls:5.2f} API calls and {questions:5.2f} answers per completed test, "
+                  f"same style as full test: {same:.1%}")
+    finally:
+        await bot.session.close()
+        await api.stop()
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=300)
+    parser.add_argument('--consistency', type=float, default=0.6, help="chance to answer with the preferred style")
+    parser.add_argument('--confidence', type=float, default=main.DEFAULT_CONFIDENCE)
+    parser.add_argument('--min-answers', type=int, default=main.DEFAULT_MIN_ANSWERS)
+    parser.add_argument('--seed', type=int, default=1)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main_()
@@ -0,0 +1,77 @@
+# bench/bench_analytics.py
+"""Batch analytics over millions of completed results.
+
+Fills a ResultsSink with synthetic results and times analytics.analyze on
+its columns against a plain Python pass over the same rows.
+
+Run from the repository root: python -m bench.bench_analytics [results]
+"""
+import sys
+import time
+
+import numpy as np
+
+from analytics import analyze_sink, STYLES
+from results import ResultsSink, NO_ANSWER
+
+QUESTIONS = 15
+
+
+def synthetic_sink(count, rng):
+    sink = ResultsSink(QUESTIONS, max_rows=count)
+    choices = rng.integers(0, STYLES, size=(count, QUESTIONS), dtype=np.uint8)
+    positions = rng.integers(0, STYLES, size=(count, QUESTIONS), dtype=np.uint8)
+    # Часть тестов остановлена досрочно
+    answered = rng.integers(8, QUESTIONS + 1, size=count)
+    skipped = np.arange(QUESTIONS) >= answered[:, None]
+    choices[skipped] = NO_ANSWER
+    positions[skipped] = NO_ANSWER
+    sink.styles.frombytes(rng.integers(0, STYLES, size=count, dtype=np.uint8).tobytes())
+    sink.choices.frombytes(choices.tobytes())
+    sink.positions.frombytes(positions.tobytes())
+    sink.total = count
+    return sink
+
+
+def python_pass(sink):
+    style_counts = [0] * STYLES
+    choice_counts = [[0] * STYLES for _ in range(QUESTIONS)]
+    position_counts = [[0] * STYLES for _ in range(QUESTIONS)]
+    for row, style in enumerate(sink.styles):
+        style_counts[style] += 1
+        start = row * QUESTIONS
+        for q_index in range(QUESTIONS):
+            choice = sink.choices[start + q_index]
+            if choice == NO_ANSWER:
+                continue
+            choice_counts[q_index][choice] += 1
+            position_counts[q_index][sink.positions[start + q_index]] += 1
+    return style_counts, choice_counts, position_counts
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    sink = synthetic_sink(count, np.random.default_rng(1))
+
+    started = time.perf_counter()
+    report = analyze_sink(sink)
+    elapsed = time.perf_counter() - started
+    print(f"NumPy: {count} results in {elapsed * 1e3:.0f} ms ({elapsed / count * 1e9:.0f} ns/result)")
+    print(f"  answers per test {report['answers_per_test']:.2f}, "
+          f"max position chi-square {report['position_bias_chi_square'].max():.2f}")
+
+    subset = synthetic_sink(min(count, 200_000), np.random.default_rng(1))
+    started = time.perf_counter()
+    style_counts, choice_counts, _ = python_pass(subset)
+    elapsed = time.perf_counter() - started
+    print(f"Python loop: {len(subset)} results in {elapsed * 1e3:.0f} ms ({elapsed / len(subset) * 1e9:.0f} ns/result)")
+
+    # Оба способа считают одно и то же
+    check = analyze_sink(subset)
+    assert check['choice_share'][0].tolist() == [
+        count / sum(choice_counts[0]) for count in choice_counts[0]
+    ]
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+# bench/bench_callback.py
+"""Counts Bot API calls per /test and per answer tap against the fake API.
+
+Run from the repository root: python -m bench.bench_callback
+"""
+import asyncio
+import random
+
+from bench.fake_api import FakeBotAPI, make_bot
+from bench.updates import message_update, callback_update
+import main
+
+USER_ID = 1000
+
+
+async def run():
+    api = await FakeBotAPI().start()
+    bot = make_bot(api.url)
+    try:
+        await main.dp.feed_webhook_update(bot, message_update(1, '/test', USER_ID))
+        old_message_id = api.last_message_ids[USER_ID]
+        print(f"/test: {dict(api.counts)}")
+        api.counts.clear()
+
+        taps = 0
+        update_id = 2
+        while USER_ID in main.user_data:
+            data = api.last_question()
+            update = callback_update(update_id, random.choice(data), api.last_message_ids[USER_ID], USER_ID)
+            await main.dp.feed_webhook_update(bot, update)
+            update_id += 1
+            taps += 1
+        total = sum(api.counts.values())
+        print(f"{taps} taps: {dict(api.counts)}; {total / taps:.2f} calls per tap")
+
+        # Нажатие на кнопку первого теста с теми же данными, что у нового вопроса, и двойное нажатие
+        api.reset()
+        await main.dp.feed_webhook_update(bot, message_update(update_id, '/test', USER_ID))
+        data = api.last_question()
+        message_id = api.last_message_ids[USER_ID]
+        update_id += 1
+        await main.dp.feed_webhook_update(bot, callback_update(update_id, data[0], old_message_id, USER_ID))
+        for _ in range(2):
+            update_id += 1
+            await main.dp.feed_webhook_update(bot, callback_update(update_id, data[0], message_id, USER_ID))
+        print(f"/test + stale tap + double tap: {dict(api.counts)}")
+    finally:
+        await bot.session.close()
+        await api.stop()
+
+
+if __name__ == '__main__':
+    asyncio.run(run())
@@ -0,0 +1,72 @@
+# bench/bench_flood.py
+"""A class of users starting /test at once against a fake API with flood limits.
+
+Compares calling the Bot API directly with going through OutboundScheduler,
+and shows the scheduler recovering via RetryAfter from a stricter server.
+Run from the repository root: python -m bench.bench_flood [users] [taps]
+"""
+import asyncio
+import logging
+import random
+import sys
+import time
+
+from bench.fake_api import FakeBotAPI, make_bot
+from bench.updates import message_update, callback_update
+from outbound import OutboundScheduler
+import main
+
+
+async def feed(bot, update, failures):
+    try:
+        await main.dp.feed_raw_update(bot, update)
+    except Exception:
+        failures.append(update['update_id'])
+
+
+async def run_user(bot, api, user_id, taps, update_ids, failures):
+    await feed(bot, message_update(next(update_ids), '/test', user_id), failures)
+    for _ in range(taps):
+        data = api.last_question(user_id)
+        if not data:
+            return
+        await feed(bot, callback_update(next(update_ids), random.choice(data), api.last_message_ids[user_id], user_id), failures)
+
+
+async def run(users, taps, scheduled, chat_limit=3):
+    api = await FakeBotAPI(global_limit=30, chat_limit=chat_limit).start()
+    bot = make_bot(api.url)
+    scheduler = None
+    if scheduled:
+        scheduler = OutboundScheduler()
+        bot.session.middleware(scheduler)
+    update_ids = iter(range(1, 10 ** 9))
+    failures = []
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(run_user(bot, api, 10_000 + i, taps, update_ids, failures) for i in range(users)))
+        if scheduler is not None:
+            await scheduler.close()
+    finally:
+        elapsed = time.perf_counter() - started
+        await bot.session.close()
+        await api.stop()
+    expected = users * (1 + 2 * taps)
+    delivered = api.counts['sendMessage'] + api.counts['editMessageReplyMarkup']
+    label = 'scheduler' if scheduled else 'direct'
+    label += f", {users} users, {chat_limit}/s per chat"
+    print(f"{label}: delivered {delivered}/{expected}, failed updates {len(failures)}, "
+          f"429s {sum(api.flooded.values())}, {elapsed:.1f} s"
+          + (f", {scheduler.stats()}" if scheduler else ""))
+
+
+if __name__ == '__main__':
+    logging.disable(logging.ERROR)
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    taps = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    asyncio.run(run(users, taps, scheduled=False))
+    main.user_data._sessions.clear()
+    asyncio.run(run(users, taps, scheduled=True))
+    # Сервер строже, чем настройки планировщика: проверяем повторы по RetryAfter
+    main.user_data._sessions.clear()
+    asyncio.run(run(5, taps, scheduled=True, chat_limit=1))
@@ -0,0 +1,66 @@
+# bench/bench_keyboards.py
+"""Per-tap keyboard CPU cost: building markup per tap vs. the compiled question bank.
+
+Run from the repository root: python -m bench.bench_keyboards
+"""
+import json
+import os
+import random
+import timeit
+
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from catalog import DEFAULT_CONTENT_DIR, DEFAULT_LOCALE
+from question_bank import QuestionBank
+
+with open(os.path.join(DEFAULT_CONTENT_DIR, f'{DEFAULT_LOCALE}.json'), encoding='utf-8') as f:
+    questions = json.load(f)['questions']
+
+TAPS = 20000
+
+
+def legacy_tap(q_index, answer):
+    # Клавиатуры так, как они строились до компиляции банка вопросов
+    question = questions[q_index]
+    buttons = []
+    for option, mapping in zip(question['options'], question['mapping']):
+        text = f"✅ {option}" if mapping == answer else f"⬜ <s>{option}</s>"
+        buttons.append([InlineKeyboardButton(text=text, callback_data=f"answer:{mapping}")])
+    answered = InlineKeyboardMarkup(inline_keyboard=buttons)
+
+    next_q = questions[(q_index + 1) % len(questions)]
+    options_with_mapping = list(zip(next_q['options'], next_q['mapping']))
+    random.shuffle(options_with_mapping)
+    buttons = [[InlineKeyboardButton(text=option, callback_data=f"answer:{mapping}")]
+               for option, mapping in options_with_mapping]
+    return answered, InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+def compiled_tap(bank, q_index, answer):
+    return bank.answered_keyboard(q_index, answer), bank.keyboard((q_index + 1) % len(bank), 0)
+
+
+def main():
+    started = timeit.default_timer()
+    bank = QuestionBank(questions)
+    compile_time = timeit.default_timer() - started
+
+    taps = [(random.randrange(len(questions)), random.choice('ABCDE')) for _ in range(TAPS)]
+
+    started = timeit.default_timer()
+    for q_index, answer in taps:
+        legacy_tap(q_index, answer)
+    legacy = (timeit.default_timer() - started) / TAPS
+
+    started = timeit.default_timer()
+    for q_index, answer in taps:
+        compiled_tap(bank, q_index, answer)
+    compiled = (timeit.default_timer() - started) / TAPS
+
+    print(f"compile once: {compile_time * 1e3:.1f} ms")
+    print(f"per tap, built: {legacy * 1e6:.2f} us")
+    print(f"per tap, compiled: {compiled * 1e6:.2f} us ({legacy / compiled:.0f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+# bench/bench_logging.py
+"""Per-update cost of logging on the event loop thread.
+
+Replays the log calls one /test update made before and after the queued
+logging pipeline: the old f-string lines, full payload dump, print() and
+aiohttp's access line written synchronously, against lazy %-formatting, a
+sampled payload dump, the access line skipped below DEBUG and a background
+writer. Output goes to /dev/null unless --output is set.
+
+Run from the repository root: python -m bench.bench_logging
+"""
+import argparse
+import contextlib
+import logging
+import time
+
+from aiohttp import web
+from aiohttp.test_utils import make_mocked_request
+from aiohttp.web_log import AccessLogger
+
+from bench.updates import message_update
+from logging_setup import setup_logging, PayloadLog, stop_logging, LOG_FORMAT, DEFAULT_PAYLOAD_SAMPLE
+
+logger = logging.getLogger('main')
+event_logger = logging.getLogger('aiogram.event')
+# Тот же журнал доступа, что aiohttp создаёт для каждого соединения
+access_logger = AccessLogger(logging.getLogger('aiohttp.access'), AccessLogger.LOG_FORMAT)
+webhook_request = make_mocked_request('POST', '/webhook', headers={'User-Agent': 'TelegramBot (like TwitterBot)'})
+webhook_response = web.Response(text="OK")
+
+
+def log_access():
+    # Как web_protocol: проверка enabled, затем строка собирается в цикле событий
+    if access_logger.enabled:
+        access_logger.log(webhook_request, webhook_response, 0.003)
+
+
+def legacy_update(update, user_id):
+    logger.info("Получен вебхук запрос")
+    logger.info(f"Содержимое запроса: {update}")
+    logger.info(f"Получена команда /test от пользователя {user_id}")
+    print("Write /reset to restart the test")
+    logger.info(f"Тест начат для пользователя {user_id}")
+    event_logger.info("Update id=%s is handled. Duration %d ms by bot id=%d", update['update_id'], 3, 1)
+    logger.info("Запрос успешно обработан")
+    log_access()
+
+
+def pipeline_update(update, user_id, log_payload):
+    logger.debug("Получен вебхук запрос")
+    log_payload(update)
+    logger.info("Получена команда /test от пользователя %s", user_id)
+    logger.info("Тест начат для пользователя %s", user_id)
+    event_logger.info("Update id=%s is handled. Duration %d ms by bot id=%d", update['update_id'], 3, 1)
+    logger.debug("Запрос успешно обработан")
+    log_access()
+
+
+def measure(run, updates):
+    wall = time.perf_counter()
+    cpu = time.thread_time()
+    for update in updates:
+        run(update)
+    return time.perf_counter() - wall, time.thread_time() - cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--updates', type=int, default=50000)
+    parser.add_argument('--output', default='/dev/null', help="file the log lines are written to")
+    parser.add_argument('--sample', type=int, default=DEFAULT_PAYLOAD_SAMPLE, help="payload sample rate")
+    args = parser.parse_args()
+
+    updates = [message_update(update_id, '/test', 1000 + update_id % 500) for update_id in range(args.updates)]
+    user_ids = [update['message']['from']['id'] for update in updates]
+    pairs = list(zip(updates, user_ids))
+
+    with open(args.output, 'a') as output:
+        logging.basicConfig(level=logging.INFO, format=LOG_FORMAT, stream=output, force=True)
+        with contextlib.redirect_stdout(output):
+            wall, cpu = measure(lambda pair: legacy_update(*pair), pairs)
+        print(f"synchronous f-string logging: {wall / args.updates * 1e6:.1f} µs wall, "
+              f"{cpu / args.updates * 1e6:.1f} µs CPU per update on the loop thread")
+
+        listener = setup_logging(level=logging.INFO, stream=output)
+        log_payload = PayloadLog(logger, args.sample)
+        wall, cpu = measure(lambda pair: pipeline_update(*pair, log_payload), pairs)
+        drain = time.perf_counter()
+        stop_logging(listener)
+        drain = time.perf_counter() - drain
+        print(f"queued lazy logging:          {wall / args.updates * 1e6:.1f} µs wall, "
+              f"{cpu / args.updates * 1e6:.1f} µs CPU per update on the loop thread "
+              f"(+{drain * 1e3:.0f} ms for the writer to drain)")
+
+
+if __name__ == '__main__':
+    main()
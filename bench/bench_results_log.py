@@ -0,0 +1,70 @@
+# bench/bench_results_log.py
+"""Write, startup and export cost of the append-only results log.
+
+Appends synthetic results through a ResultsSink, then times reopening
+the log after a clean shutdown (checkpoint, nothing to scan) and after a
+crash (no checkpoint, every record is scanned), and a streaming CSV export.
+
+Run from the repository root: python -m bench.bench_results_log [results]
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+from results import ResultsSink
+from results_log import ResultsLog, export
+
+QUESTIONS = 15
+
+
+async def reopen(path):
+    started = time.perf_counter()
+    sink = ResultsSink(QUESTIONS, log=ResultsLog(path, QUESTIONS))
+    await sink.open()
+    elapsed = time.perf_counter() - started
+    await sink.log.close()
+    return sink, elapsed
+
+
+async def run(count):
+    rng = random.Random(1)
+    answers = [bytes(rng.randrange(5) | rng.randrange(5) << 4 for _ in range(QUESTIONS)) for _ in range(1000)]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'results.log')
+        sink = ResultsSink(QUESTIONS, max_rows=10_000, log=ResultsLog(path, QUESTIONS))
+        await sink.open()
+        started = time.perf_counter()
+        for n in range(count):
+            sink.add(n, n % 5, answers[n % len(answers)])
+            if n % 1024 == 0:
+                # Даём фоновой задаче сбросить накопленное
+                await asyncio.sleep(0)
+        added = time.perf_counter() - started
+        await sink.close()
+        print(f"add: {added / count * 1e6:.1f} µs/result on the event loop, "
+              f"{sink.log.flushes} fsync batches, {os.path.getsize(path) / 2 ** 20:.1f} MiB")
+
+        _, elapsed = await reopen(path)
+        print(f"startup after clean shutdown: {elapsed * 1e3:.1f} ms")
+        os.remove(f'{path}.counters')
+        restored, elapsed = await reopen(path)
+        print(f"startup after a crash: {elapsed * 1e3:.0f} ms to scan {restored.replayed} records")
+        assert restored.counters() == sink.counters()
+
+        started = time.perf_counter()
+        with open(os.devnull, 'w') as output:
+            exported = export([path], output)
+        elapsed = time.perf_counter() - started
+        print(f"CSV export: {exported} records in {elapsed:.2f} s ({exported / elapsed:.0f} records/s)")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    asyncio.run(run(count))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# bench/bench_sessions.py
+"""Per-session memory footprint of the session store.
+
+Run from the repository root: python -m bench.bench_sessions [sessions]
+"""
+import asyncio
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+
+from sessions import SessionStore
+
+BASE_USER_ID = 5_000_000_000
+
+
+def legacy(count):
+    # Хранилище в том виде, в каком оно было до SessionStore
+    user_data = defaultdict(lambda: {"current_q": 0, "answers": []})
+    for user_id in range(BASE_USER_ID, BASE_USER_ID + count):
+        user_data[user_id] = {"current_q": 7, "answers": ['A', 'B', 'C', 'D', 'E', 'A', 'B']}
+    return user_data
+
+
+def compact(count):
+    async def fill():
+        store = SessionStore(max_size=count)
+        for user_id in range(BASE_USER_ID, BASE_USER_ID + count):
+            session = await store.start(user_id)
+            for code in 'ABCDEAB':
+                session.record(code)
+        return store
+    return asyncio.run(fill())
+
+
+def measure(build, count):
+    tracemalloc.start()
+    started = time.perf_counter()
+    data = build(count)
+    elapsed = time.perf_counter() - started
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return data, used, elapsed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    _, used, elapsed = measure(legacy, count)
+    print(f"defaultdict: {used / count:.0f} B/session, {used / 2 ** 20:.0f} MiB total, {elapsed:.2f} s")
+    store, used, elapsed = measure(compact, count)
+    print(f"SessionStore: {used / count:.0f} B/session, {used / 2 ** 20:.0f} MiB total, {elapsed:.2f} s")
+    print(f"SessionStore.stats(): {store.stats()}")
+
+    store.max_size = count // 2
+    started = time.perf_counter()
+    evicted = store.evict()
+    print(f"evicting {evicted} sessions over max_size: {time.perf_counter() - started:.2f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+# bench/bench_startup.py
+"""Cold start of the webhook service: import time and time to first response.
+
+For ``main.py`` and ``boot.py`` it starts the bot against the local fake
+Bot API and measures, from process launch, when ``/`` first answers 200
+and when the reply to a /start update sent at that moment arrives. Then
+it boots twice with WEBHOOK_URL set and counts the webhook calls of each
+boot: the second one is served from the getWebhookInfo cache.
+
+Run from the repository root: python -m bench.bench_startup [--runs 3]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+from bench.fake_api import FakeBotAPI
+from bench.updates import message_update
+
+USER_ID = 5_000_000
+WEBHOOK_METHODS = ('getWebhookInfo', 'setWebhook', 'deleteWebhook')
+
+
+def import_time(module, env):
+    started = time.perf_counter()
+    subprocess.run([sys.executable, '-c', f'import {module}'], env=env, check=True)
+    return time.perf_counter() - started
+
+
+async def boot(entry, api, env, port):
+    """(seconds to the first 200 on /, seconds to the reply to /start), both from launch"""
+    messages = api.chat_messages(USER_ID)
+    started = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, entry, env=dict(env, PORT=str(port)),
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+    )
+    try:
+        async with aiohttp.ClientSession() as http:
+            while True:
+                if process.returncode is not None:
+                    raise RuntimeError(f'{entry} exited with {process.returncode}')
+                try:
+                    async with http.get(f'http://127.0.0.1:{port}/') as response:
+                        if response.status == 200:
+                            break
+                except aiohttp.ClientError:
+                    pass
+                await asyncio.sleep(0.005)
+            first_response = time.perf_counter() - started
+            await http.post(f'http://127.0.0.1:{port}/webhook', json=message_update(1, '/start', USER_ID))
+            await asyncio.wait_for(messages.get(), 120)
+            first_reply = time.perf_counter() - started
+    finally:
+        process.send_signal(2)
+        await process.wait()
+    return first_response, first_reply
+
+
+async def run(args):
+    api = await FakeBotAPI(record_calls=False).start()
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ, TELEGRAM_API_URL=api.url, RESULTS_LOG='', LOG_LEVEL='WARNING',
+                   WEBHOOK_URL='', WEBHOOK_CACHE=os.path.join(directory, 'webhook.json'))
+        env.pop('WEB_WORKERS', None)
+        try:
+            for module in ('main', 'boot'):
+                times = [import_time(module, env) for _ in range(args.runs)]
+                print(f"import {module}: {statistics.median(times):.2f} s")
+            for entry in ('main.py', 'boot.py'):
+                results = [await boot(entry, api, env, args.port) for _ in range(args.runs)]
+                first_response = statistics.median(result[0] for result in results)
+                first_reply = statistics.median(result[1] for result in results)
+                print(f"{entry}: / answers after {first_response:.2f} s, first reply after {first_reply:.2f} s")
+
+            env['WEBHOOK_URL'] = 'https://example.com/webhook'
+            for attempt in ('first boot', 'second boot'):
+                before = {method: api.counts[method] for method in WEBHOOK_METHODS}
+                await boot('boot.py', api, env, args.port)
+                calls = {method: api.counts[method] - before[method] for method in WEBHOOK_METHODS}
+                print(f"{attempt} with WEBHOOK_URL: webhook calls {calls}")
+        finally:
+            await api.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--port', type=int, default=18081)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
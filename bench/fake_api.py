@@ -0,0 +1,211 @@
+# bench/fake_api.py
+"""Local stand-in for the Telegram Bot API that records every call."""
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter, defaultdict, deque
+
+from aiohttp import web
+
+
+class FakeBotAPI:
+    """Records calls; optionally answers 429 like Telegram flood control.
+
+    ``global_limit`` and ``chat_limit`` are the number of chat-addressed
+    calls allowed per second overall and per chat; calls over the limit get
+    a 429 with ``retry_after`` seconds. ``latency`` (plus up to ``jitter``)
+    seconds are added to every call and ``error_rate`` of the calls fail
+    with a 500. ``record_calls=False`` keeps only the per-method counts.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, global_limit=None, chat_limit=None, retry_after=1,
+                 latency=0.0, jitter=0.0, error_rate=0.0, record_calls=True):
+        self.host = host
+        self.port = port
+        self.global_limit = global_limit
+        self.chat_limit = chat_limit
+        self.retry_after = retry_after
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.record_calls = record_calls
+        self.calls = []
+        self.counts = Counter()
+        self.flooded = Counter()
+        self.errors = Counter()
+        self._chat_messages = {}
+        self.last_message_ids = {}
+        self.updates = []
+        self.webhook = {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+        self._new_updates = asyncio.Event()
+        self._message_ids = itertools.count(1)
+        self._recent = deque()
+        self._recent_by_chat = defaultdict(deque)
+        self._runner = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def push_update(self, update):
+        """Queues an update for getUpdates"""
+        self.updates.append(update)
+        self._new_updates.set()
+
+    async def _get_updates(self, params):
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        timeout = float(params.get('timeout') or 0)
+        # Как и Telegram, offset подтверждает все более ранние обновления
+        self.updates = [update for update in self.updates if update['update_id'] >= offset]
+        if not self.updates and timeout:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.updates[:limit]
+
+    def chat_messages(self, chat_id):
+        """Queue of sendMessage parameters addressed to the chat"""
+        queue = self._chat_messages.get(chat_id)
+        if queue is None:
+            queue = self._chat_messages[chat_id] = asyncio.Queue()
+        return queue
+
+    def last_question(self, chat_id=None):
+        """callback_data of the buttons of the last question sent (to ``chat_id``)"""
+        for method, params in reversed(self.calls):
+            if chat_id is not None and str(params.get('chat_id')) != str(chat_id):
+                continue
+            if method == 'sendMessage' and params.get('reply_markup'):
+                markup = params['reply_markup']
+                if isinstance(markup, str):
+                    markup = json.loads(markup)
+                return [row[0]['callback_data'] for row in markup['inline_keyboard']]
+        return None
+
+    def reset(self):
+        self.calls.clear()
+        self.counts.clear()
+        self.flooded.clear()
+        self.errors.clear()
+
+    @staticmethod
+    def _over_limit(recent, limit, now):
+        while recent and now - recent[0] >= 1.0:
+            recent.popleft()
+        if len(recent) >= limit:
+            return True
+        recent.append(now)
+        return False
+
+    def _flood(self, params):
+        chat_id = params.get('chat_id')
+        if chat_id is None:
+            return False
+        now = time.monotonic()
+        if self.chat_limit is not None and self._over_limit(self._recent_by_chat[chat_id], self.chat_limit, now):
+            return True
+        if self.global_limit is not None and self._over_limit(self._recent, self.global_limit, now):
+            return True
+        return False
+
+    def _result(self, method, params):
+        if method == 'getMe':
+            return {"id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+        if method == 'sendMessage':
+            message_id = self.last_message_ids[int(params.get('chat_id', 0))] = next(self._message_ids)
+            return {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": int(params.get('chat_id', 0)), "type": "private"},
+                "text": params.get('text', ''),
+            }
+        if method == 'getWebhookInfo':
+            return self.webhook
+        if method == 'setWebhook':
+            allowed_updates = params.get('allowed_updates')
+            if isinstance(allowed_updates, str):
+                allowed_updates = json.loads(allowed_updates)
+            self.webhook = dict(self.webhook, url=params.get('url', ''), allowed_updates=allowed_updates or [])
+        if method == 'deleteWebhook':
+            self.webhook = dict(self.webhook, url='', allowed_updates=[])
+        return True
+
+    async def handle(self, request):
+        method = request.match_info['method']
+        params = dict(await request.post())
+        if request.content_type == 'application/json':
+            params = await request.json()
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + random.random() * self.jitter)
+        if self.error_rate and method != 'getUpdates' and random.random() < self.error_rate:
+            self.errors[method] += 1
+            return web.json_response({
+                "ok": False, "error_code": 500, "description": "Internal Server Error"
+            }, status=500)
+        if self._flood(params):
+            self.flooded[method] += 1
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }, status=429)
+        if self.record_calls:
+            self.calls.append((method, params))
+        self.counts[method] += 1
+        if method == 'getUpdates':
+            return web.json_response({"ok": True, "result": await self._get_updates(params)})
+        result = self._result(method, params)
+        if method == 'sendMessage':
+            # К этому моменту last_message_ids уже указывает на это сообщение
+            queue = self._chat_messages.get(int(params.get('chat_id', 0)))
+            if queue is not None:
+                queue.put_nowait(params)
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def make_bot(api_url, token='123456:TEST'):
+    """Bot bound to a fake API server instead of api.telegram.org"""
+    from aiogram import Bot
+    from aiogram.client.default import DefaultBotProperties
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+
+    session = AiohttpSession(api=TelegramAPIServer.from_base(api_url))
+    return Bot(token=token, session=session, default=DefaultBotProperties(parse_mode='HTML'))
+
+
+async def _serve(port):
+    api = await FakeBotAPI(port=port).start()
+    print(f"Fake Bot API on {api.url}")
+    try:
+        while True:
+            await asyncio.sleep(3600)
+    finally:
+        print(json.dumps(api.counts))
+        await api.stop()
+
+
+if __name__ == '__main__':
+    import sys
+    asyncio.run(_serve(int(sys.argv[1]) if len(sys.argv) > 1 else 8081))
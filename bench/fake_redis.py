@@ -0,0 +1,89 @@
+# bench/fake_redis.py
+"""Local RESP server with the handful of commands RedisBackend uses."""
+import asyncio
+import time
+
+
+class FakeRedis:
+    """Keeps its data across stop() and start(), like a restarted Redis with persistence"""
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.host = host
+        self.port = port
+        self.data = {}
+        self.commands = 0
+        self._server = None
+        self._writers = set()
+
+    @property
+    def url(self):
+        return f"redis://{self.host}:{self.port}/0"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self._server.close()
+        # Как при перезапуске сервера: открытые соединения рвутся
+        for writer in list(self._writers):
+            writer.close()
+        await self._server.wait_closed()
+
+    async def _read_command(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        count = int(line[1:-2])
+        args = []
+        for _ in range(count):
+            length = int((await reader.readline())[1:-2])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    def _get(self, key):
+        value = self.data.get(key)
+        if value is None:
+            return None
+        data, expires = value
+        if expires is not None and expires < time.monotonic():
+            del self.data[key]
+            return None
+        return data
+
+    def _execute(self, args):
+        command = args[0].upper()
+        self.commands += 1
+        if command in (b'PING', b'SELECT', b'AUTH'):
+            return b'+OK\r\n'
+        if command == b'GET':
+            data = self._get(args[1])
+            if data is None:
+                return b'$-1\r\n'
+            return b'$%d\r\n%s\r\n' % (len(data), data)
+        if command == b'SET':
+            expires = None
+            if len(args) >= 5 and args[3].upper() == b'EX':
+                expires = time.monotonic() + int(args[4])
+            self.data[args[1]] = (args[2], expires)
+            return b'+OK\r\n'
+        if command == b'DEL':
+            removed = sum(1 for key in args[1:] if self.data.pop(key, None) is not None)
+            return b':%d\r\n' % removed
+        return b'-ERR unknown command\r\n'
+
+    async def _serve(self, reader, writer):
+        self._writers.add(writer)
+        try:
+            while True:
+                args = await self._read_command(reader)
+                if args is None:
+                    break
+                writer.write(self._execute(args))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
@@ -0,0 +1,247 @@
+# bench/loadtest.py
+"""End-to-end load test of main.py against a local fake Bot API.
+
+Starts the fake API, runs ``main.py`` as a subprocess pointed at it via
+TELEGRAM_API_URL, and drives simulated users through /start, /test and
+the answer buttons, either by POSTing to /webhook or by queueing updates
+for getUpdates (--mode polling). Environment variables of this process
+(WEBHOOK_MODE, SESSION_BACKEND, ...) are passed through to the bot.
+
+Run from the repository root:
+    python -m bench.loadtest --users 2000 --concurrency 200
+    python -m bench.loadtest --users 2000 --workers 4
+    WEBHOOK_MODE=queue python -m bench.loadtest --users 2000
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+import aiohttp
+
+from bench.fake_api import FakeBotAPI
+from bench.updates import message_update, callback_update
+
+BASE_USER_ID = 7_000_000
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def rss_bytes(pid):
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def buttons(params):
+    markup = params.get('reply_markup')
+    if not markup:
+        return None
+    if isinstance(markup, str):
+        markup = json.loads(markup)
+    return [row[0]['callback_data'] for row in markup['inline_keyboard']]
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.api = FakeBotAPI(latency=args.latency, jitter=args.jitter,
+                              error_rate=args.error_rate, record_calls=False)
+        self.update_ids = itertools.count(1)
+        self.port = args.port
+        self.ack_latency = []
+        self.reply_latency = []
+        self.updates = 0
+        self.completed = 0
+        self.failed = 0
+        self.process = None
+        self.http = None
+
+    async def send(self, update):
+        self.updates += 1
+        if self.args.mode == 'polling':
+            self.api.push_update(update)
+            return
+        started = time.perf_counter()
+        async with self.http.post(f'http://127.0.0.1:{self.port}/webhook', json=update) as response:
+            await response.read()
+        self.ack_latency.append(time.perf_counter() - started)
+
+    async def request(self, user_id, update):
+        """Sends the update and waits for the bot's next message to the user"""
+        messages = self.api.chat_messages(user_id)
+        started = time.perf_counter()
+        await self.send(update)
+        params = await asyncio.wait_for(messages.get(), self.args.timeout)
+        self.reply_latency.append(time.perf_counter() - started)
+        return params
+
+    async def start_user(self, user_id):
+        await self.request(user_id, message_update(next(self.update_ids), '/start', user_id))
+        return await self.request(user_id, message_update(next(self.update_ids), '/test', user_id))
+
+    async def finish_user(self, user_id, question):
+        while True:
+            data = buttons(question)
+            if data is None:
+                self.completed += 1
+                return
+            if self.args.think_time:
+                await asyncio.sleep(random.random() * self.args.think_time)
+            message_id = self.api.last_message_ids[user_id]
+            update = callback_update(next(self.update_ids), random.choice(data), message_id, user_id)
+            question = await self.request(user_id, update)
+
+    async def run_users(self, coroutine, items):
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+        results = {}
+
+        async def run(user_id, *args):
+            async with semaphore:
+                try:
+                    results[user_id] = await coroutine(user_id, *args)
+                except Exception:
+                    self.failed += 1
+
+        await asyncio.gather(*(run(*item) for item in items))
+        return results
+
+    async def start_bot(self):
+        # Вебхук из .env нельзя регистрировать на имитации API: кеш регистрации остался бы за реальным ботом
+        env = dict(os.environ, TELEGRAM_API_URL=self.api.url, PORT=str(self.port), WEBHOOK_URL='')
+        if not self.args.telegram_limits:
+            # Лимиты Telegram ограничили бы тест скоростью планировщика
+            env.setdefault('OUTBOUND_GLOBAL_RATE', '1000000')
+            env.setdefault('OUTBOUND_GLOBAL_BURST', '1000000')
+            env.setdefault('OUTBOUND_CHAT_RATE', '1000000')
+            env.setdefault('OUTBOUND_CHAT_BURST', '1000000')
+        command = [sys.executable, 'main.py']
+        if self.args.mode == 'polling':
+            command += ['--mode', 'polling']
+        elif self.args.workers > 1:
+            command += ['--workers', str(self.args.workers)]
+        self.process = await asyncio.create_subprocess_exec(
+            *command, env=env,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=None if self.args.verbose else asyncio.subprocess.DEVNULL
+        )
+        deadline = time.monotonic() + 120
+        while time.monotonic() < deadline:
+            if self.process.returncode is not None:
+                raise RuntimeError(f'main.py exited with {self.process.returncode}')
+            if self.args.mode == 'polling':
+                if self.api.counts['getUpdates']:
+                    return
+            else:
+                try:
+                    async with self.http.get(f'http://127.0.0.1:{self.port}/') as response:
+                        if response.status == 200:
+                            return
+                except aiohttp.ClientError:
+                    pass
+            await asyncio.sleep(0.05)
+        raise RuntimeError('main.py did not start in time')
+
+    async def stop_bot(self):
+        if self.process is not None and self.process.returncode is None:
+            self.process.send_signal(2)
+            try:
+                await asyncio.wait_for(self.process.wait(), 30)
+            except asyncio.TimeoutError:
+                self.process.kill()
+                await self.process.wait()
+
+    async def run(self):
+        await self.api.start()
+        self.http = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.args.concurrency))
+        try:
+            await self.start_bot()
+            baseline_rss = rss_bytes(self.process.pid)
+            calls_before = sum(self.api.counts.values())
+            users = range(BASE_USER_ID, BASE_USER_ID + self.args.users)
+
+            started = time.perf_counter()
+            # Фаза 1: все пользователи начинают тест, сессии активны одновременно
+            questions = await self.run_users(self.start_user, [(user_id,) for user_id in users])
+            active_rss = rss_bytes(self.process.pid)
+            # Фаза 2: пользователи отвечают на все вопросы
+            await self.run_users(self.finish_user, list(questions.items()))
+            elapsed = time.perf_counter() - started
+            calls = sum(self.api.counts.values()) - calls_before
+        finally:
+            await self.stop_bot()
+            await self.http.close()
+            await self.api.stop()
+
+        report = {
+            'mode': self.args.mode,
+            'webhook_mode': os.getenv('WEBHOOK_MODE', 'sync'),
+            'workers': self.args.workers,
+            'users': self.args.users,
+            'completed_tests': self.completed,
+            'failed_users': self.failed,
+            'updates': self.updates,
+            'elapsed_s': round(elapsed, 3),
+            'updates_per_s': round(self.updates / elapsed, 1) if elapsed else 0.0,
+            'reply_latency_ms': {
+                'p50': round(percentile(self.reply_latency, 50) * 1e3, 2),
+                'p99': round(percentile(self.reply_latency, 99) * 1e3, 2),
+                'mean': round(statistics.fmean(self.reply_latency) * 1e3, 2) if self.reply_latency else 0.0,
+            },
+            'bot_api_calls': dict(self.api.counts),
+            'bot_api_errors_injected': sum(self.api.errors.values()),
+            'bot_api_calls_per_completed_test': round(calls / self.completed, 2) if self.completed else None,
+        }
+        if self.ack_latency:
+            report['webhook_ack_latency_ms'] = {
+                'p50': round(percentile(self.ack_latency, 50) * 1e3, 2),
+                'p99': round(percentile(self.ack_latency, 99) * 1e3, 2),
+            }
+        if baseline_rss is not None and active_rss is not None:
+            report['rss_baseline_mib'] = round(baseline_rss / 2 ** 20, 1)
+            report['rss_active_mib'] = round(active_rss / 2 ** 20, 1)
+            report['rss_per_active_session_bytes'] = round((active_rss - baseline_rss) / max(1, len(questions)))
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=200, help="users in flight at once")
+    parser.add_argument('--mode', choices=('webhook', 'polling'), default='webhook')
+    parser.add_argument('--port', type=int, default=18080, help="port for main.py in webhook mode")
+    parser.add_argument('--workers', type=int, default=1, help="bot worker processes in webhook mode")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every Bot API call")
+    parser.add_argument('--jitter', type=float, default=0.0, help="up to this many extra seconds per call")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of Bot API calls failing with 500")
+    parser.add_argument('--think-time', type=float, default=0.0, help="up to this many seconds between taps")
+    parser.add_argument('--timeout', type=float, default=30.0, help="seconds to wait for each bot reply")
+    parser.add_argument('--telegram-limits', action='store_true', help="keep the bot's flood-limit pacing")
+    parser.add_argument('--json', help="also write the report to this file")
+    parser.add_argument('--verbose', action='store_true', help="show the bot's log output")
+    args = parser.parse_args()
+
+    report = asyncio.run(LoadTest(args).run())
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump(report, output, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+# bench/updates.py
+"""Synthetic Telegram updates shaped like real webhook payloads."""
+import time
+
+
+def message_update(update_id, text, user_id):
+    """Raw webhook update with a private-chat command"""
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "User"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}],
+        },
+    }
+
+
+def callback_update(update_id, data, message_id, user_id):
+    """Raw webhook update with a tap on an inline button"""
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "chat_instance": "1",
+            "from": {"id": user_id, "is_bot": False, "first_name": "User"},
+            "message": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "text": "question",
+            },
+            "data": data,
+        },
+    }
@@ -0,0 +1,132 @@
+# boot.py
+"""Fast-starting entry point of the webhook service.
+
+Binds the port with nothing but aiohttp imported and answers the ``/``
+health check right away, then imports ``main`` (aiogram, handlers,
+content) in a worker thread and runs its startup hooks. Webhook requests
+that arrive meanwhile wait until the bot is ready. With WEB_WORKERS > 1
+the cluster front starts the same way and never imports aiogram;
+BOT_MODE=polling simply runs ``main``.
+
+    python boot.py
+"""
+import asyncio
+import importlib
+import os
+import signal
+import sys
+import time
+import traceback
+
+from aiohttp import web
+from dotenv import load_dotenv
+
+STARTED = time.monotonic()
+
+
+class Boot:
+    """Serves ``/`` at once and hands the other routes to ``main`` once it is loaded"""
+
+    def __init__(self):
+        self.main = None
+        self.failed = False
+        self.ready = asyncio.Event()
+        self._loading = None
+        self.app = web.Application()
+        self.app.router.add_get('/', self.health)
+        self.app.router.add_post('/webhook', self.webhook)
+        self.app.router.add_get('/metrics', self.metrics)
+        self.app.router.add_get('/debug/{name}', self.debug)
+        self.app.on_startup.append(self.start_loading)
+        self.app.on_shutdown.append(self.shutdown)
+        self.app.on_cleanup.append(self.cleanup)
+
+    async def start_loading(self, app):
+        # Только запускаем загрузку: aiohttp открывает порт после хуков on_startup
+        self._loading = asyncio.create_task(self.load(app))
+
+    async def load(self, app):
+        try:
+            module = await asyncio.to_thread(importlib.import_module, 'main')
+            loaded = time.monotonic()
+            for hook in module.STARTUP_HOOKS:
+                await hook(app)
+        except Exception:
+            traceback.print_exc()
+            self.failed = True
+            # Без бота сервис бесполезен: завершаемся, чтобы платформа перезапустила его
+            os.kill(os.getpid(), signal.SIGTERM)
+            return
+        self.main = module
+        self.ready.set()
+        module.logger.info("Бот готов: импорт за %.2f с, запуск за %.2f с от старта процесса",
+                           loaded - STARTED, time.monotonic() - STARTED)
+
+    async def health(self, request):
+        if self.main is None:
+            return web.Response(text="Bot is starting")
+        return await self.main.health(request)
+
+    async def webhook(self, request):
+        await self.ready.wait()
+        if self.main is None:
+            return web.Response(text="Bot is not running", status=503)
+        return await self.main.webhook(request)
+
+    async def metrics(self, request):
+        await self.ready.wait()
+        if self.main is None:
+            return web.Response(text="Bot is not running", status=503)
+        return await self.main.metrics_handler(request)
+
+    async def debug(self, request):
+        await self.ready.wait()
+        if self.main is None or self.main.debug_endpoints is None:
+            raise web.HTTPNotFound()
+        return await self.main.debug_endpoints.handle(request)
+
+    async def shutdown(self, app):
+        if self.main is None:
+            if self._loading is not None:
+                self._loading.cancel()
+            # Ожидающие запросы получают 503, Telegram доставит их повторно
+            self.ready.set()
+            return
+        for hook in self.main.SHUTDOWN_HOOKS:
+            await hook(app)
+
+    async def cleanup(self, app):
+        if self.main is not None:
+            for hook in self.main.CLEANUP_HOOKS:
+                await hook(app)
+
+
+def run_cluster(workers, host, port):
+    from cluster import Cluster
+    from logging_setup import setup_logging
+
+    setup_logging(level=os.getenv('LOG_LEVEL', 'INFO').upper())
+    main_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+    cluster = Cluster([sys.executable, main_path, '--mode', 'webhook'], workers=workers)
+    asyncio.run(cluster.serve(host, port))
+
+
+def main():
+    # Порт, режим и число воркеров тоже могут быть заданы в .env
+    load_dotenv()
+    host, port = '0.0.0.0', int(os.getenv('PORT', 8000))
+    if os.getenv('BOT_MODE', 'webhook') != 'webhook':
+        importlib.import_module('main').main()
+        return
+    workers = int(os.getenv('WEB_WORKERS', 1))
+    if workers > 1:
+        run_cluster(workers, host, port)
+        return
+    boot = Boot()
+    web.run_app(boot.app, host=host, port=port, print=None)
+    if boot.failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+# catalog.py
+import asyncio
+import json
+import logging
+import os
+import random
+import traceback
+import zlib
+from collections import OrderedDict
+from types import MappingProxyType
+
+from question_bank import QuestionBank
+from sessions import STYLE_CODES
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONTENT_DIR = 'content'
+DEFAULT_LOCALE = 'en'
+DEFAULT_RELOAD_INTERVAL = 2.0
+# Сколько прежних версий контента держим для начатых на них тестов
+DEFAULT_HISTORY = 8
+# Версия хранится в сессии двумя байтами; 0 не бывает версией и означает текущий контент
+VERSION_SPACE = 1 << 16
+
+TEXT_KEYS = ('start', 'info', 'resources', 'styles_header', 'result', 'reset_done', 'reset_none', 'no_session')
+
+
+class Catalog:
+    """Content of one locale compiled into ready-to-send HTML texts and keyboards"""
+
+    __slots__ = ('locale', 'version', 'texts', 'style_names', 'results', 'questions')
+
+    def __init__(self, locale, version, content):
+        texts = content['texts']
+        styles = content['styles']
+        missing = [key for key in TEXT_KEYS if key not in texts] + [code for code in STYLE_CODES if code not in styles]
+        if missing:
+            raise ValueError(f"{locale}: нет текстов {', '.join(missing)}")
+        self.locale = locale
+        self.version = version
+        self.style_names = MappingProxyType({code: styles[code]['name'] for code in STYLE_CODES})
+        compiled = {key: texts[key] for key in TEXT_KEYS}
+        compiled['styles'] = texts['styles_header'] + ''.join(
+            f"{styles[code]['description']}\n\n" for code in STYLE_CODES
+        )
+        self.texts = MappingProxyType(compiled)
+        self.results = MappingProxyType({
+            code: texts['result'].format(
+                name=styles[code]['name'],
+                description=styles[code]['description'],
+                advice=styles[code]['advice'],
+            )
+            for code in STYLE_CODES
+        })
+        # Сессия хранит номер перемешанного порядка, поэтому пул должен совпадать
+        # в каждом процессе и после перезапуска: он зависит только от версии
+        self.questions = QuestionBank(content['questions'], rng=random.Random(version))
+
+
+def _parse(name, data):
+    if name.endswith('.json'):
+        return json.loads(data)
+    return yaml.safe_load(data)
+
+
+class ContentStore:
+    """Catalogs of every locale in a content directory, reloaded when the files change.
+
+    Every ``<locale>.json`` (or ``.yaml`` with PyYAML installed) is compiled
+    into a ``Catalog`` off the event loop, and the set of catalogs is swapped
+    in with a single assignment, so a handler sees either the old content or
+    the new one. The version is derived from the file contents, so it stays
+    the same across restarts and processes. Sessions remember the version
+    they started with and keep getting it while it is among the last
+    ``history`` versions. The number of questions is fixed for the lifetime
+    of the process; content with a different count is rejected.
+    """
+
+    def __init__(self, directory=DEFAULT_CONTENT_DIR, default_locale=DEFAULT_LOCALE,
+                 reload_interval=DEFAULT_RELOAD_INTERVAL, history=DEFAULT_HISTORY):
+        self.directory = directory
+        self.default_locale = default_locale
+        self.reload_interval = reload_interval
+        self.history = history
+        self.version = 0
+        self.current = {}
+        self.questions = None
+        self.reloads = 0
+        self.reload_errors = 0
+        self._versions = OrderedDict()
+        self._stamp = None
+        self._task = None
+
+    def _files(self):
+        extensions = ('.json', '.yaml', '.yml') if yaml is not None else ('.json',)
+        return sorted(name for name in os.listdir(self.directory) if name.endswith(extensions))
+
+    def _scan(self):
+        stamp = []
+        for name in self._files():
+            stat = os.stat(os.path.join(self.directory, name))
+            stamp.append((name, stat.st_mtime_ns, stat.st_size))
+        return tuple(stamp)
+
+    def _compile(self):
+        stamp = self._scan()
+        sources = {}
+        checksum = 0
+        for name, _, _ in stamp:
+            with open(os.path.join(self.directory, name), 'rb') as f:
+                data = f.read()
+            checksum = zlib.crc32(name.encode() + data, checksum)
+            sources[name.rsplit('.', 1)[0]] = _parse(name, data)
+        if self.default_locale not in sources:
+            raise ValueError(f"{self.directory}: нет контента для локали {self.default_locale}")
+        version = checksum % (VERSION_SPACE - 1) + 1
+        catalogs = {locale: Catalog(locale, version, content) for locale, content in sources.items()}
+        counts = {len(catalog.questions) for catalog in catalogs.values()}
+        expected = self.questions if self.questions is not None else len(catalogs[self.default_locale].questions)
+        if counts != {expected}:
+            raise ValueError(f"Число вопросов должно быть {expected} во всех локалях, а не {sorted(counts)}")
+        return stamp, version, catalogs
+
+    def _install(self, stamp, version, catalogs):
+        self._stamp = stamp
+        if version == self.version:
+            return False
+        self.current = catalogs
+        self.version = version
+        self.questions = len(catalogs[self.default_locale].questions)
+        self._versions[version] = catalogs
+        self._versions.move_to_end(version)
+        while len(self._versions) > self.history:
+            self._versions.popitem(last=False)
+        return True
+
+    def load(self):
+        """Loads the content synchronously; used once at startup"""
+        return self._install(*self._compile())
+
+    def catalog(self, language_code=None, version=0):
+        """Catalog for the user's language from ``version``, or from the current content"""
+        catalogs = self._versions.get(version, self.current) if version else self.current
+        locale = (language_code or '').split('-', 1)[0].lower()
+        return catalogs.get(locale) or catalogs[self.default_locale]
+
+    async def reload(self):
+        """Recompiles the content if any file changed; returns True when a new version is live"""
+        stamp = await asyncio.to_thread(self._scan)
+        if stamp == self._stamp:
+            return False
+        try:
+            compiled = await asyncio.to_thread(self._compile)
+        except Exception as e:
+            # Ошибочный файл не трогаем повторно, пока его не изменят
+            self._stamp = stamp
+            self.reload_errors += 1
+            logger.error("Контент из %s не загружен, остаётся версия %s: %s", self.directory, self.version, e)
+            return False
+        if not self._install(*compiled):
+            return False
+        self.reloads += 1
+        logger.info("Загружена версия контента %s: %s", self.version, ', '.join(sorted(self.current)))
+        return True
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                await self.reload()
+            except Exception as e:
+                logger.error("Ошибка при проверке контента: %s", e)
+                logger.error("Traceback: %s", traceback.format_exc())
+
+    def start(self):
+        if self.reload_interval and self._task is None:
+            self._task = asyncio.create_task(self._watch())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self):
+        return {
+            'version': self.version,
+            'locales': sorted(self.current),
+            'versions_kept': len(self._versions),
+            'reloads': self.reloads,
+            'reload_errors': self.reload_errors,
+        }
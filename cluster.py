@@ -0,0 +1,375 @@
+# cluster.py
+import asyncio
+import json
+import logging
+import os
+import shutil
+import signal
+import tempfile
+import time
+
+import aiohttp
+from aiohttp import web
+
+from dispatch import update_user_id
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 1
+DEFAULT_HEALTH_INTERVAL = 5.0
+DEFAULT_HEALTH_TIMEOUT = 2.0
+DEFAULT_START_TIMEOUT = 60.0
+DEFAULT_STOP_TIMEOUT = 30.0
+DEFAULT_FORWARD_TIMEOUT = 60.0
+# Мультипликативное хеширование: id, идущие подряд или с общим делителем, расходятся по
+# воркерам, а внутри воркера UpdateDispatcher (hash(id) % workers) загружает все очереди
+_HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+_HASH_MASK = (1 << 64) - 1
+
+
+def worker_index(user_id, workers):
+    """Worker that owns the user; stays the same while the number of workers does"""
+    return (((user_id * _HASH_MULTIPLIER) & _HASH_MASK) >> 32) % workers
+
+
+class WorkerProcess:
+    """One ``main.py`` process serving the webhook app on a Unix socket"""
+
+    def __init__(self, index, socket_path, process, forward_timeout=DEFAULT_FORWARD_TIMEOUT):
+        self.index = index
+        self.socket_path = socket_path
+        self.process = process
+        self.started = time.monotonic()
+        self.healthy = False
+        self.health_latency = None
+        self.stopping = False
+        self.http = aiohttp.ClientSession(
+            connector=aiohttp.UnixConnector(path=socket_path),
+            timeout=aiohttp.ClientTimeout(total=forward_timeout)
+        )
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+    async def check(self, timeout=DEFAULT_HEALTH_TIMEOUT):
+        """Asks the worker's ``/`` route; returns True when it answered 200 in time"""
+        started = time.perf_counter()
+        try:
+            async with self.http.get('http://worker/', timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                await response.read()
+                self.healthy = response.status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self.healthy = False
+        self.health_latency = time.perf_counter() - started
+        return self.healthy
+
+    async def wait_ready(self, timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.returncode is not None:
+                raise RuntimeError(f"воркер {self.index} завершился с кодом {self.process.returncode}")
+            if await self.check():
+                return
+            await asyncio.sleep(0.05)
+        raise RuntimeError(f"воркер {self.index} не запустился за {timeout} с")
+
+    async def stop(self, timeout=DEFAULT_STOP_TIMEOUT):
+        """SIGTERM and wait: aiohttp finishes running requests and the shutdown hooks drain queues"""
+        self.stopping = True
+        if self.process.returncode is None:
+            self.process.send_signal(signal.SIGTERM)
+            try:
+                await asyncio.wait_for(self.process.wait(), timeout)
+            except asyncio.TimeoutError:
+                logger.error("Воркер %s (pid %s) не остановился за %s с, завершаем принудительно",
+                             self.index, self.pid, timeout)
+                self.process.kill()
+                await self.process.wait()
+        await self.http.close()
+        try:
+            os.unlink(self.socket_path)
+        except OSError:
+            pass
+
+
+class Slot:
+    """Routing state of one worker index; the process behind it can be replaced"""
+
+    def __init__(self, index):
+        self.index = index
+        self.worker = None
+        self.ready = asyncio.Event()
+        self.in_flight = 0
+        self.drained = asyncio.Event()
+        self.drained.set()
+        self.forwarded = 0
+        self.failed = 0
+        self.held = 0
+        self.restarts = 0
+
+    def acquire(self):
+        self.in_flight += 1
+        self.drained.clear()
+
+    def release(self):
+        self.in_flight -= 1
+        if not self.in_flight:
+            self.drained.set()
+
+
+class Cluster:
+    """Front process that spreads webhook updates over worker processes by user.
+
+    Each worker is a full bot process (``main.py --worker-socket``) on its
+    own core. The front parses only the update JSON, picks the worker by
+    hashing the sender's id and forwards the raw body over a Unix socket,
+    so all updates of a user reach the same process and its in-memory
+    sessions stay valid without shared storage. Changing the number of
+    workers remaps users; tests in progress then need a persistent session
+    backend. So does a rolling restart: with the default memory backend
+    every test in progress on a restarted worker is lost.
+
+    SIGHUP restarts the workers one by one: the replacement starts and
+    passes its health check first, then updates for that worker are held
+    while its requests finish and the old process shuts down, so a user is
+    never served by two processes at once. A worker that dies is started
+    again. The port is bound before the workers start; until they are up
+    ``/`` answers that the bot is starting and updates wait for their
+    worker. Then ``/`` reports the health of every worker and answers 200
+    while at least one of them is healthy.
+    """
+
+    def __init__(self, command, workers=DEFAULT_WORKERS, env=None, health_interval=DEFAULT_HEALTH_INTERVAL,
+                 start_timeout=DEFAULT_START_TIMEOUT, stop_timeout=DEFAULT_STOP_TIMEOUT,
+                 forward_timeout=DEFAULT_FORWARD_TIMEOUT):
+        self.command = command
+        self.workers = workers
+        self.env = env if env is not None else os.environ
+        self.health_interval = health_interval
+        self.start_timeout = start_timeout
+        self.stop_timeout = stop_timeout
+        self.forward_timeout = forward_timeout
+        self.slots = [Slot(index) for index in range(workers)]
+        self.rejected = 0
+        self.rolling_restarts = 0
+        self._generation = 0
+        self._socket_dir = None
+        self._restarting = None
+        self._tasks = set()
+        self._health_task = None
+        self._closing = False
+
+    async def _spawn(self, index):
+        self._generation += 1
+        socket_path = os.path.join(self._socket_dir, f'worker-{index}-{self._generation}.sock')
+        process = await asyncio.create_subprocess_exec(
+            *self.command, '--worker-socket', socket_path,
+            env=dict(self.env, WORKER_INDEX=str(index))
+        )
+        worker = WorkerProcess(index, socket_path, process, self.forward_timeout)
+        try:
+            await worker.wait_ready(self.start_timeout)
+        except BaseException:
+            await worker.stop(self.stop_timeout)
+            raise
+        self._background(self._watch_exit(worker))
+        logger.info("Воркер %s запущен: pid %s", index, worker.pid)
+        return worker
+
+    def _background(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _watch_exit(self, worker):
+        code = await worker.process.wait()
+        if worker.stopping or self._closing:
+            return
+        slot = self.slots[worker.index]
+        logger.error("Воркер %s (pid %s) неожиданно завершился с кодом %s, перезапуск", worker.index, worker.pid, code)
+        # Обновления этого воркера ждут замены, а не уходят в закрытый сокет
+        slot.ready.clear()
+        while not self._closing:
+            try:
+                await self._replace(slot)
+                return
+            except Exception as e:
+                logger.error("Не удалось перезапустить воркер %s: %s", worker.index, e)
+                await asyncio.sleep(self.health_interval)
+
+    async def _replace(self, slot):
+        """Starts a new process for the slot, then retires the old one"""
+        worker = await self._spawn(slot.index)
+        old = slot.worker
+        slot.ready.clear()
+        try:
+            await slot.drained.wait()
+            if old is not None:
+                await old.stop(self.stop_timeout)
+        finally:
+            slot.worker = worker
+            if old is not None:
+                slot.restarts += 1
+            slot.ready.set()
+
+    async def start(self):
+        self._socket_dir = tempfile.mkdtemp(prefix='conflictbot-')
+        await asyncio.gather(*(self._replace(slot) for slot in self.slots))
+        self._health_task = asyncio.create_task(self._health_loop())
+
+    async def close(self):
+        self._closing = True
+        if self._health_task is not None:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+        if self._restarting is not None:
+            self._restarting.cancel()
+            await asyncio.gather(self._restarting, return_exceptions=True)
+        await asyncio.gather(*(slot.worker.stop(self.stop_timeout) for slot in self.slots if slot.worker is not None))
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._socket_dir is not None:
+            shutil.rmtree(self._socket_dir, ignore_errors=True)
+
+    def rolling_restart(self):
+        if self._restarting is not None and not self._restarting.done():
+            logger.info("Перезапуск воркеров уже идёт")
+            return
+        self._restarting = asyncio.create_task(self._rolling_restart())
+
+    async def _rolling_restart(self):
+        logger.info("Поочерёдный перезапуск %s воркеров", self.workers)
+        for slot in self.slots:
+            try:
+                await self._replace(slot)
+            except Exception as e:
+                # Остальные воркеры не трогаем: новая версия не запускается
+                logger.error("Перезапуск остановлен на воркере %s: %s", slot.index, e)
+                return
+        self.rolling_restarts += 1
+        logger.info("Все воркеры перезапущены")
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            checks = [slot.worker.check() for slot in self.slots if slot.ready.is_set()]
+            try:
+                await asyncio.gather(*checks)
+            except Exception as e:
+                logger.error("Ошибка при проверке воркеров: %s", e)
+
+    async def forward(self, request):
+        body = await request.read()
+        try:
+            update = json.loads(body)
+        except ValueError:
+            return web.Response(text="Invalid update format", status=400)
+        if not isinstance(update, dict):
+            return web.Response(text="Invalid update format", status=400)
+        slot = self.slots[worker_index(update_user_id(update), self.workers)]
+        if not slot.ready.is_set():
+            slot.held += 1
+            try:
+                await asyncio.wait_for(slot.ready.wait(), self.start_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                return web.Response(text="Worker is restarting", status=503)
+        worker = slot.worker
+        slot.acquire()
+        try:
+            async with worker.http.post('http://worker/webhook', data=body,
+                                        headers={'Content-Type': 'application/json'}) as response:
+                payload = await response.read()
+                status = response.status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # Telegram повторит доставку, к тому времени воркер будет перезапущен
+            slot.failed += 1
+            logger.error("Воркер %s не принял update %s: %s", slot.index, update.get('update_id'), e)
+            return web.Response(text="Worker unavailable", status=503)
+        finally:
+            slot.release()
+        slot.forwarded += 1
+        return web.Response(body=payload, status=status)
+
+    async def health(self, request):
+        if all(slot.worker is None for slot in self.slots):
+            # Порт открыт до запуска воркеров, обновления ждут их готовности
+            return web.Response(text="Bot is starting")
+        lines = []
+        healthy = 0
+        for slot in self.slots:
+            worker = slot.worker
+            if worker is None:
+                lines.append(f"worker {slot.index}: starting")
+                continue
+            ok = slot.ready.is_set() and worker.healthy and worker.process.returncode is None
+            healthy += ok
+            latency = f"{worker.health_latency * 1e3:.1f} ms" if worker.health_latency is not None else "-"
+            lines.append(
+                f"worker {slot.index}: pid {worker.pid}, {'healthy' if ok else 'unhealthy'}, {latency}, "
+                f"up {time.monotonic() - worker.started:.0f} s, {slot.forwarded} updates, "
+                f"{slot.failed} failed, {slot.restarts} restarts"
+            )
+        # Пока отвечает хотя бы один воркер, сервис жив: платформа не должна
+        # перезапускать весь кластер из-за одного воркера, его поднимет фронт
+        status = 200 if healthy else 503
+        text = f"Bot is running: {healthy}/{len(self.slots)} workers healthy\n" + '\n'.join(lines)
+        return web.Response(text=text, status=status)
+
+    async def worker_proxy(self, request):
+        """GET of a worker's own route, e.g. /workers/0/metrics or /workers/1/debug/memory"""
+        try:
+            slot = self.slots[int(request.match_info['index'])]
+        except (ValueError, IndexError):
+            raise web.HTTPNotFound()
+        if slot.worker is None:
+            return web.Response(text="Worker is starting", status=503)
+        headers = {'Authorization': request.headers['Authorization']} if 'Authorization' in request.headers else {}
+        try:
+            async with slot.worker.http.get(f"http://worker/{request.match_info['path']}", params=request.query,
+                                            headers=headers) as response:
+                return web.Response(body=await response.read(), status=response.status,
+                                    headers={'Content-Type': response.headers.get('Content-Type', 'text/plain')})
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return web.Response(text="Worker unavailable", status=503)
+
+    def create_app(self):
+        app = web.Application()
+        app.router.add_post('/webhook', self.forward)
+        app.router.add_get('/', self.health)
+        app.router.add_get('/workers/{index}/{path:.*}', self.worker_proxy)
+        return app
+
+    async def serve(self, host, port):
+        """Runs the workers and the front server until SIGINT or SIGTERM; SIGHUP restarts the workers"""
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        loop.add_signal_handler(signal.SIGHUP, self.rolling_restart)
+        runner = web.AppRunner(self.create_app())
+        try:
+            await runner.setup()
+            await web.TCPSite(runner, host, port).start()
+            logger.info("Фронт на %s:%s, запуск воркеров: %s", host, port, self.workers)
+            await self.start()
+            logger.info("Воркеры запущены")
+            await stop.wait()
+        finally:
+            logger.info("Остановка кластера: %s", self.stats())
+            # Сначала дожидаемся пересылаемых запросов, потом останавливаем воркеры
+            await runner.cleanup()
+            await self.close()
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'forwarded': sum(slot.forwarded for slot in self.slots),
+            'failed': sum(slot.failed for slot in self.slots),
+            'held': sum(slot.held for slot in self.slots),
+            'rejected': self.rejected,
+            'restarts': sum(slot.restarts for slot in self.slots),
+            'rolling_restarts': self.rolling_restarts,
+        }
@@ -0,0 +1,338 @@
+# diagnostics.py
+import asyncio
+import cProfile
+import hmac
+import io
+import json
+import logging
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+import traceback
+from collections import Counter
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROFILE_SECONDS = 5.0
+# Запрос проходит через фронт кластера, поэтому профиль короче его таймаута
+MAX_PROFILE_SECONDS = 30.0
+DEFAULT_SAMPLE_INTERVAL = 0.005
+DEFAULT_TOP = 25
+DEFAULT_LAG_INTERVAL = 0.1
+# Для PYTHONTRACEMALLOC и /debug/memory?start=1: глубина стека каждого выделения
+TRACEMALLOC_FRAMES = 10
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f'{code.co_filename.rsplit("/", 1)[-1]}:{code.co_name}:{frame.f_lineno}'
+
+
+def _stack(frame):
+    """Stack of ``frame`` as file:function:line labels, from the loop iteration that runs it"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        if frame.f_code.co_name == '_run_once':
+            # Выше только запуск приложения, он одинаков у всех стеков
+            break
+        frame = frame.f_back
+    labels.reverse()
+    return tuple(labels)
+
+
+def sample_stacks(thread_id, seconds, interval=DEFAULT_SAMPLE_INTERVAL):
+    """Counts the stacks seen in thread ``thread_id`` every ``interval`` seconds; run it in another thread"""
+    stacks = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        if frame is not None:
+            stacks[_stack(frame)] += 1
+        del frame
+        time.sleep(interval)
+    return stacks
+
+
+class LoopLagMonitor:
+    """Logs event loop stalls longer than ``threshold`` seconds.
+
+    A task wakes up every ``interval`` seconds and measures how late it
+    was. A watchdog thread notices a stall while it lasts and logs the
+    stack the loop is stuck in. A zero threshold disables the monitor and
+    nothing is started.
+    """
+
+    def __init__(self, threshold, interval=DEFAULT_LAG_INTERVAL):
+        self.threshold = threshold
+        self.interval = min(interval, threshold) if threshold else interval
+        self.stalls = 0
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+        self._beat = 0.0
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def enabled(self):
+        return self.threshold > 0
+
+    def start(self):
+        if not self.enabled or self._task is not None:
+            return
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._measure())
+        self._thread = threading.Thread(
+            target=self._watch, args=(threading.get_ident(),), name='loop-lag-watchdog', daemon=True
+        )
+        self._thread.start()
+
+    async def close(self):
+        if self._task is None:
+            return
+        self._stop.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await asyncio.to_thread(self._thread.join)
+        self._thread = None
+
+    async def _measure(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            self._beat = now = time.monotonic()
+            lag = now - expected
+            self.last_lag = lag
+            if lag > self.max_lag:
+                self.max_lag = lag
+            if lag > self.threshold:
+                self.stalls += 1
+                logger.warning("Цикл событий был занят %.3f с (порог %.3f с)", lag, self.threshold)
+
+    def _watch(self, loop_thread_id):
+        reported = None
+        while not self._stop.wait(self.threshold / 2):
+            beat = self._beat
+            if beat == reported or time.monotonic() - beat <= self.threshold + self.interval:
+                continue
+            # Стек снимаем, пока цикл ещё занят, иначе виновника уже не видно
+            reported = beat
+            frame = sys._current_frames().get(loop_thread_id)
+            if frame is not None:
+                logger.warning("Цикл событий занят дольше %.3f с, стек:\n%s",
+                               self.threshold, ''.join(traceback.format_stack(frame)))
+            del frame
+
+    def stats(self):
+        return {
+            'threshold': self.threshold,
+            'stalls': self.stalls,
+            'max_lag': round(self.max_lag, 6),
+            'last_lag': round(self.last_lag, 6),
+        }
+
+
+def _session_breakdown(store):
+    """Measured memory of the sessions cached by a SessionStore and their progress"""
+    sessions = store._sessions
+    objects = tallies = keys = 0
+    progress = Counter()
+    for user_id, session in sessions.items():
+        objects += sys.getsizeof(session) + sys.getsizeof(session.touched)
+        tallies += sys.getsizeof(session.tally)
+        keys += sys.getsizeof(user_id)
+        progress[session.current_q] += 1
+    index = sys.getsizeof(sessions)
+    total = objects + tallies + keys + index
+    return {
+        'sessions': len(sessions),
+        'bytes': {'session_objects': objects, 'tallies': tallies, 'keys': keys, 'index': index, 'total': total},
+        'bytes_per_session': total // len(sessions) if sessions else 0,
+        'by_question': dict(sorted(progress.items())),
+        'loading': len(store._loading),
+    }
+
+
+def _column_bytes(sink):
+    columns = {
+        name: len(column) * column.itemsize
+        for name, column in (('user_ids', sink.user_ids), ('timestamps', sink.timestamps), ('styles', sink.styles),
+                             ('choices', sink.choices), ('positions', sink.positions))
+    }
+    columns['total'] = sum(columns.values())
+    return columns
+
+
+class DebugEndpoints:
+    """``/debug/profile`` and ``/debug/memory`` behind an ``Authorization: Bearer`` token.
+
+    Nothing runs until a request comes in: the profiler is attached only
+    for the requested seconds and tracemalloc traces only after it is
+    started with ``/debug/memory?start=1`` (or PYTHONTRACEMALLOC).
+    """
+
+    def __init__(self, token, user_data=None, results=None, loop_monitor=None):
+        self.token = token
+        self.user_data = user_data
+        self.results = results
+        self.loop_monitor = loop_monitor
+        self._profiling = False
+        self._handlers = {'profile': self.profile, 'memory': self.memory}
+
+    def _authorized(self, request):
+        # Только заголовок: строка запроса попадает в журналы доступа и прокси
+        header = request.headers.get('Authorization', '')
+        if not header.startswith('Bearer '):
+            return False
+        return hmac.compare_digest(header[7:].encode(), self.token.encode())
+
+    async def handle(self, request):
+        handler = self._handlers.get(request.match_info['name'])
+        if handler is None:
+            raise web.HTTPNotFound()
+        if not self._authorized(request):
+            return web.Response(text="Unauthorized", status=401, headers={'WWW-Authenticate': 'Bearer'})
+        try:
+            return await handler(request)
+        except ValueError as e:
+            return web.Response(text=f"Bad request: {e}", status=400)
+
+    @staticmethod
+    def _top(request):
+        return max(1, int(request.query.get('top', DEFAULT_TOP)))
+
+    async def profile(self, request):
+        """Hottest stacks of the event loop thread over ``seconds``.
+
+        ``mode=sample`` (default) samples the loop's stack from another
+        thread every ``interval`` seconds; ``mode=cprofile`` attaches
+        cProfile to the loop thread and returns functions sorted by ``sort``
+        (cumulative or tottime).
+        """
+        seconds = min(float(request.query.get('seconds', DEFAULT_PROFILE_SECONDS)), MAX_PROFILE_SECONDS)
+        if seconds <= 0:
+            raise ValueError("seconds должно быть больше нуля")
+        mode = request.query.get('mode', 'sample')
+        if mode not in ('sample', 'cprofile'):
+            raise ValueError("mode: sample или cprofile")
+        top = self._top(request)
+        if self._profiling:
+            return web.Response(text="A profile is already running", status=409)
+        self._profiling = True
+        logger.info("Профилирование %s на %.1f с", mode, seconds)
+        try:
+            if mode == 'sample':
+                interval = max(0.001, float(request.query.get('interval', DEFAULT_SAMPLE_INTERVAL)))
+                stacks = await asyncio.to_thread(sample_stacks, threading.get_ident(), seconds, interval)
+                text = self._format_stacks(stacks, top)
+            else:
+                text = await self._cprofile(seconds, request.query.get('sort', 'cumulative'), top)
+        finally:
+            self._profiling = False
+        return web.Response(text=text)
+
+    @staticmethod
+    def _format_stacks(stacks, top):
+        samples = sum(stacks.values())
+        lines = [f"{samples} samples"]
+        # Стек, который заканчивается в select, означает простой цикла
+        for stack, count in stacks.most_common(top):
+            lines.append(f"\n{count} ({count / samples:.1%})")
+            lines.extend(f"  {label}" for label in stack)
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    async def _cprofile(seconds, sort, top):
+        if sort not in ('cumulative', 'tottime'):
+            raise ValueError("sort: cumulative или tottime")
+        profiler = cProfile.Profile()
+        # Профилируется только поток цикла событий, то есть все обработчики
+        profiler.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats(sort).print_stats(top)
+        return output.getvalue()
+
+    async def memory(self, request):
+        """tracemalloc top allocators plus the size of sessions and results.
+
+        ``start=1`` begins tracing, ``stop=1`` ends it and frees its memory;
+        ``group`` is lineno, filename or traceback.
+        """
+        if request.query.get('start') and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            logger.info("tracemalloc включён")
+        report = {'rss_bytes': _rss_bytes()}
+        if tracemalloc.is_tracing():
+            group = request.query.get('group', 'lineno')
+            if group not in ('lineno', 'filename', 'traceback'):
+                raise ValueError("group: lineno, filename или traceback")
+            report['tracemalloc'] = await self._allocators(group, self._top(request))
+        else:
+            report['tracemalloc'] = "off; start it with ?start=1"
+        if request.query.get('stop') and tracemalloc.is_tracing():
+            tracemalloc.stop()
+            logger.info("tracemalloc выключен")
+        if self.user_data is not None:
+            report['user_data'] = _session_breakdown(self.user_data)
+            report['user_data']['estimate'] = self.user_data.stats()
+        if self.results is not None:
+            report['results'] = {'rows': len(self.results.styles), 'column_bytes': _column_bytes(self.results)}
+        if self.loop_monitor is not None and self.loop_monitor.enabled:
+            report['loop_lag'] = self.loop_monitor.stats()
+        return web.json_response(report, dumps=_dumps)
+
+    @staticmethod
+    async def _allocators(group, top):
+        current, peak = tracemalloc.get_traced_memory()
+
+        def statistics():
+            filtered = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+            ))
+            return filtered.statistics(group)[:top]
+
+        # Снимок и его группировка тяжёлые, цикл событий их не ждёт
+        stats = await asyncio.to_thread(statistics)
+        return {
+            'traced_bytes': current,
+            'peak_bytes': peak,
+            'overhead_bytes': tracemalloc.get_tracemalloc_memory(),
+            'top': [
+                {
+                    'size': stat.size,
+                    'count': stat.count,
+                    'where': [f'{frame.filename}:{frame.lineno}' for frame in stat.traceback],
+                }
+                for stat in stats
+            ],
+        }
+
+
+def _dumps(value):
+    return json.dumps(value, indent=2)
+
+
+def _rss_bytes():
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
@@ -0,0 +1,182 @@
+# dispatch.py
+import asyncio
+import logging
+import traceback
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 8
+DEFAULT_CAPACITY = 1024
+DEFAULT_ENQUEUE_TIMEOUT = 1.0
+DEFAULT_DEDUP_WINDOW = 4096
+
+
+def update_user_id(update):
+    """User the raw update belongs to, used to keep that user's updates in order"""
+    for key in ('message', 'callback_query', 'edited_message', 'inline_query', 'my_chat_member'):
+        event = update.get(key)
+        if isinstance(event, dict):
+            sender = event.get('from')
+            if isinstance(sender, dict) and 'id' in sender:
+                return sender['id']
+            chat = event.get('chat')
+            if isinstance(chat, dict) and 'id' in chat:
+                return chat['id']
+    return update.get('update_id', 0)
+
+
+class UpdateDeduplicator:
+    """Drops redelivered updates by update_id in O(1).
+
+    Remembers the last ``window`` ids in a set backed by a ring buffer.
+    Telegram issues update ids in increasing order, so an id that is older
+    than the high-water mark minus the window has already been handled.
+    """
+
+    def __init__(self, window=DEFAULT_DEDUP_WINDOW):
+        self.window = window
+        self.high_water = None
+        self.accepted = 0
+        self.duplicates = 0
+        self.too_old = 0
+        self._seen = set()
+        self._ring = deque()
+
+    def seen(self, update_id):
+        """Returns True for a duplicate, otherwise remembers the id"""
+        if update_id in self._seen:
+            self.duplicates += 1
+            return True
+        if self.high_water is not None and update_id <= self.high_water - self.window:
+            self.duplicates += 1
+            self.too_old += 1
+            return True
+        if len(self._ring) >= self.window:
+            self._seen.discard(self._ring.popleft())
+        self._ring.append(update_id)
+        self._seen.add(update_id)
+        if self.high_water is None or update_id > self.high_water:
+            self.high_water = update_id
+        self.accepted += 1
+        return False
+
+    def forget(self, update_id):
+        """Lets a redelivery of an update through again, e.g. when it was not queued or failed"""
+        if update_id not in self._seen:
+            return
+        self._seen.discard(update_id)
+        # Иначе устаревшая запись кольца позже выкинет из _seen уже повторно принятый id
+        self._ring.remove(update_id)
+
+    def stats(self):
+        return {
+            'window': self.window,
+            'high_water': self.high_water,
+            'accepted': self.accepted,
+            'duplicates': self.duplicates,
+            'too_old': self.too_old,
+        }
+
+
+class UpdateDispatcher:
+    """Bounded background processing of incoming updates.
+
+    Updates are sharded over the workers by user id: each worker owns its
+    own queue, so one user's updates are handled strictly in order while
+    different users are processed in parallel. ``key`` maps an update to its
+    user; ``enqueue_timeout=None`` makes enqueue wait for room instead of
+    rejecting.
+    """
+
+    def __init__(self, process, workers=DEFAULT_WORKERS, capacity=DEFAULT_CAPACITY,
+                 enqueue_timeout=DEFAULT_ENQUEUE_TIMEOUT, key=update_user_id):
+        self.process = process
+        self.key = key
+        self.workers = workers
+        self.capacity = capacity
+        self.enqueue_timeout = enqueue_timeout
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.waited = 0
+        self.max_depth = 0
+        self._queues = [asyncio.Queue(max(1, capacity // workers)) for _ in range(workers)]
+        self._tasks = []
+        self._closing = False
+
+    @property
+    def depth(self):
+        return sum(queue.qsize() for queue in self._queues)
+
+    def start(self):
+        self._closing = False
+        self._tasks = [asyncio.create_task(self._worker(queue)) for queue in self._queues]
+
+    async def enqueue(self, update):
+        """Queues the update; returns False when the queue stayed full or is closing"""
+        if self._closing:
+            self.rejected += 1
+            return False
+        queue = self._queues[hash(self.key(update)) % self.workers]
+        try:
+            queue.put_nowait(update)
+        except asyncio.QueueFull:
+            self.waited += 1
+            try:
+                await asyncio.wait_for(queue.put(update), self.enqueue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                return False
+        self.enqueued += 1
+        depth = self.depth
+        if depth > self.max_depth:
+            self.max_depth = depth
+        return True
+
+    async def _worker(self, queue):
+        while True:
+            update = await queue.get()
+            try:
+                await self.process(update)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error("Ошибка при обработке update %s: %s", self._update_id(update), e)
+                logger.error("Traceback: %s", traceback.format_exc())
+            finally:
+                queue.task_done()
+
+    @staticmethod
+    def _update_id(update):
+        if isinstance(update, dict):
+            return update.get('update_id')
+        return getattr(update, 'update_id', None)
+
+    async def close(self, timeout=10.0):
+        """Stops accepting updates and drains what is already queued"""
+        self._closing = True
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(queue.join() for queue in self._queues)), timeout
+            )
+        except asyncio.TimeoutError:
+            logger.error("Очередь не опустела за %s с, потеряно обновлений: %s", timeout, self.depth)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'capacity': self.capacity,
+            'depth': self.depth,
+            'max_depth': self.max_depth,
+            'enqueued': self.enqueued,
+            'processed': self.processed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'waited': self.waited,
+        }
@@ -0,0 +1,92 @@
+# http_session.py
+from aiohttp import ClientSession, ClientTimeout, TCPConnector, TraceConfig
+
+from aiogram import __version__ as aiogram_version
+from aiogram.client.session.aiohttp import AiohttpSession, SERVER_SOFTWARE, USER_AGENT
+
+DEFAULT_LIMIT = 100
+DEFAULT_LIMIT_PER_HOST = 0
+DEFAULT_KEEPALIVE = 60.0
+DEFAULT_DNS_TTL = 300
+DEFAULT_TIMEOUT = 15.0
+DEFAULT_CONNECT_TIMEOUT = 5.0
+
+
+class TunedAiohttpSession(AiohttpSession):
+    """aiogram session with a tuned connection pool and connection counters.
+
+    Keeps idle connections to the Bot API open for ``keepalive`` seconds,
+    caches DNS answers for ``dns_ttl`` seconds and bounds each request by
+    ``timeout`` seconds in total and ``connect_timeout`` for connecting.
+    Counters tell how many requests reused a pooled connection and how many
+    had to open a new one.
+    """
+
+    def __init__(self, limit=DEFAULT_LIMIT, limit_per_host=DEFAULT_LIMIT_PER_HOST,
+                 keepalive=DEFAULT_KEEPALIVE, dns_ttl=DEFAULT_DNS_TTL,
+                 timeout=DEFAULT_TIMEOUT, connect_timeout=DEFAULT_CONNECT_TIMEOUT, **kwargs):
+        super().__init__(limit=limit, timeout=timeout, **kwargs)
+        self.connect_timeout = connect_timeout
+        self._connector_init.update(
+            limit_per_host=limit_per_host,
+            keepalive_timeout=keepalive,
+            use_dns_cache=True,
+            ttl_dns_cache=dns_ttl,
+        )
+        self.connections_opened = 0
+        self.connections_reused = 0
+        self.dns_cache_hits = 0
+        self.dns_cache_misses = 0
+        self._timeouts = {}
+        self._trace = TraceConfig()
+        self._trace.on_connection_create_end.append(self._on_connection_opened)
+        self._trace.on_connection_reuseconn.append(self._on_connection_reused)
+        self._trace.on_dns_cache_hit.append(self._on_dns_cache_hit)
+        self._trace.on_dns_cache_miss.append(self._on_dns_cache_miss)
+
+    async def _on_connection_opened(self, session, context, params):
+        self.connections_opened += 1
+
+    async def _on_connection_reused(self, session, context, params):
+        self.connections_reused += 1
+
+    async def _on_dns_cache_hit(self, session, context, params):
+        self.dns_cache_hits += 1
+
+    async def _on_dns_cache_miss(self, session, context, params):
+        self.dns_cache_misses += 1
+
+    async def create_session(self):
+        if self._should_reset_connector:
+            await self.close()
+
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(
+                connector=self._connector_type(**self._connector_init),
+                headers={
+                    USER_AGENT: f"{SERVER_SOFTWARE} aiogram/{aiogram_version}",
+                },
+                trace_configs=[self._trace],
+            )
+            self._should_reset_connector = False
+
+        return self._session
+
+    async def make_request(self, bot, method, timeout=None):
+        total = self.timeout if timeout is None else timeout
+        client_timeout = self._timeouts.get(total)
+        if client_timeout is None:
+            client_timeout = self._timeouts[total] = ClientTimeout(total=total, sock_connect=self.connect_timeout)
+        return await super().make_request(bot, method, timeout=client_timeout)
+
+    def stats(self):
+        connector = self._session.connector if self._session is not None else None
+        return {
+            'connections_opened': self.connections_opened,
+            'connections_reused': self.connections_reused,
+            'dns_cache_hits': self.dns_cache_hits,
+            'dns_cache_misses': self.dns_cache_misses,
+            'limit': self._connector_init['limit'],
+            'keepalive': self._connector_init['keepalive_timeout'],
+            'open': isinstance(connector, TCPConnector) and not connector.closed,
+        }
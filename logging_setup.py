@@ -0,0 +1,74 @@
+# logging_setup.py
+import atexit
+import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# Каждое какое по счёту тело запроса попадает в журнал на уровне INFO; 0 отключает
+DEFAULT_PAYLOAD_SAMPLE = 1000
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Queue handler that leaves %-formatting to the listener thread.
+
+    The stock ``QueueHandler.prepare`` formats the message in the caller's
+    thread, i.e. on the event loop. Here the record is queued as is, so log
+    arguments must not be mutated after the call; the bot only logs ids,
+    exceptions and parsed update dicts that nothing changes afterwards.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def setup_logging(level=logging.INFO, stream=None, fmt=LOG_FORMAT):
+    """Routes all records through a queue to a background thread that formats and writes them"""
+    records = queue.SimpleQueue()
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(logging.Formatter(fmt))
+    listener = QueueListener(records, handler, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(DeferredQueueHandler(records))
+    root.setLevel(level)
+    # aiohttp собирает строку журнала доступа через % прямо в цикле событий, до очереди,
+    # на каждый запрос; поэтому она включена только при DEBUG
+    logging.getLogger('aiohttp.access').setLevel(logging.INFO if root.level <= logging.DEBUG else logging.WARNING)
+
+    listener.start()
+    atexit.register(stop_logging, listener)
+    return listener
+
+
+def stop_logging(listener):
+    """Writes out what is left in the queue and stops the writer thread; safe to call twice"""
+    if listener._thread is not None:
+        listener.stop()
+
+
+class PayloadLog:
+    """Level-gated, sampled logging of raw update payloads.
+
+    At DEBUG every payload is logged; at INFO only one in ``sample_every``,
+    and none when it is 0. Skipped payloads cost a counter increment.
+    """
+
+    def __init__(self, logger, sample_every=DEFAULT_PAYLOAD_SAMPLE):
+        self.logger = logger
+        self.sample_every = sample_every
+        self._skipped = 0
+
+    def __call__(self, payload):
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Содержимое запроса: %s", payload)
+            return
+        if not self.sample_every:
+            return
+        self._skipped += 1
+        if self._skipped >= self.sample_every:
+            self._skipped = 0
+            self.logger.info("Содержимое запроса (1 из %s): %s", self.sample_every, payload)
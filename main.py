@@ -2,251 +2,155 @@
 import asyncio
 from aiogram import Bot, Dispatcher, F
 from aiogram.client.default import DefaultBotProperties
-from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command
-from collections import defaultdict
 from aiohttp import web
 from dotenv import load_dotenv
+from http_session import (TunedAiohttpSession, DEFAULT_LIMIT, DEFAULT_LIMIT_PER_HOST, DEFAULT_KEEPALIVE,
+                          DEFAULT_DNS_TTL, DEFAULT_TIMEOUT, DEFAULT_CONNECT_TIMEOUT)
+from outbound import (OutboundBatch, OutboundScheduler, DEFAULT_GLOBAL_RATE, DEFAULT_GLOBAL_BURST,
+                      DEFAULT_CHAT_RATE, DEFAULT_CHAT_BURST)
+from catalog import ContentStore, DEFAULT_CONTENT_DIR, DEFAULT_LOCALE, DEFAULT_RELOAD_INTERVAL
+from scoring import EarlyStop, dominant_style, DEFAULT_CONFIDENCE, DEFAULT_MIN_ANSWERS
+from sessions import SessionStore, STYLE_CODES, STYLE_INDEX, DEFAULT_TTL, DEFAULT_MAX_SIZE
+from results import ResultsSink, DEFAULT_MAX_ROWS
+from results_log import ResultsLog
+from session_backends import create_backend
+from polling import PollingRunner, polled_user_id
+from dispatch import UpdateDispatcher, UpdateDeduplicator, DEFAULT_WORKERS, DEFAULT_CAPACITY, DEFAULT_DEDUP_WINDOW
+from metrics import Registry, HandlerMetrics, BotAPIMetrics, CONTENT_TYPE
+from webhook_setup import WebhookRegistration, DEFAULT_CACHE_PATH, DEFAULT_CACHE_TTL
+from diagnostics import DebugEndpoints, LoopLagMonitor
+from logging_setup import setup_logging, PayloadLog, LOG_FORMAT, DEFAULT_PAYLOAD_SAMPLE
+from cluster import Cluster, DEFAULT_WORKERS as DEFAULT_WEB_WORKERS
+import argparse
 import os
+import signal
 import sys
 import logging
 import traceback
-import random
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# .env читается до всего, что настраивается из окружения, включая журнал
+load_dotenv()
+
+# Номер процесса-воркера, когда бот запущен фронтом кластера (--workers)
+WORKER_INDEX = os.getenv('WORKER_INDEX')
+# Записи форматируются и пишутся в фоновом потоке, а не в цикле событий
+setup_logging(
+    level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+    fmt=f'[worker {WORKER_INDEX}] {LOG_FORMAT}' if WORKER_INDEX is not None else LOG_FORMAT
 )
 logger = logging.getLogger(__name__)
-
-load_dotenv()
+log_payload = PayloadLog(logger, int(os.getenv('LOG_PAYLOAD_SAMPLE', DEFAULT_PAYLOAD_SAMPLE)))
 
 API_TOKEN = '7579169408:AAFWHKaSr5ifhCFx3AmSUYFhpSLtZCdQqjY'
 if not API_TOKEN:
     logger.error("Ошибка: BOT_TOKEN не найден в переменных окружения!")
     sys.exit(1)
-logger.info(f"Токен загружен: {API_TOKEN[:10]}...")
-bot = Bot(token=API_TOKEN, default=DefaultBotProperties(parse_mode='HTML'))
+logger.info("Токен загружен: %s...", API_TOKEN[:10])
+# Локальный Bot API сервер (или его имитация для нагрузочных тестов)
+API_URL = os.getenv('TELEGRAM_API_URL')
+session_options = {'api': TelegramAPIServer.from_base(API_URL)} if API_URL else {}
+session = TunedAiohttpSession(
+    limit=int(os.getenv('BOT_HTTP_LIMIT', DEFAULT_LIMIT)),
+    limit_per_host=int(os.getenv('BOT_HTTP_LIMIT_PER_HOST', DEFAULT_LIMIT_PER_HOST)),
+    keepalive=float(os.getenv('BOT_HTTP_KEEPALIVE', DEFAULT_KEEPALIVE)),
+    dns_ttl=int(os.getenv('BOT_HTTP_DNS_TTL', DEFAULT_DNS_TTL)),
+    timeout=float(os.getenv('BOT_HTTP_TIMEOUT', DEFAULT_TIMEOUT)),
+    connect_timeout=float(os.getenv('BOT_HTTP_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT)),
+    **session_options
+)
+bot = Bot(token=API_TOKEN, session=session, default=DefaultBotProperties(parse_mode='HTML'))
+outbound_scheduler = OutboundScheduler(
+    global_rate=float(os.getenv('OUTBOUND_GLOBAL_RATE', DEFAULT_GLOBAL_RATE)),
+    global_burst=int(os.getenv('OUTBOUND_GLOBAL_BURST', DEFAULT_GLOBAL_BURST)),
+    chat_rate=float(os.getenv('OUTBOUND_CHAT_RATE', DEFAULT_CHAT_RATE)),
+    chat_burst=int(os.getenv('OUTBOUND_CHAT_BURST', DEFAULT_CHAT_BURST))
+)
+bot.session.middleware(outbound_scheduler)
+# Вебхук ставится при запуске, только если Telegram знает другой адрес
+webhook_registration = WebhookRegistration(
+    bot,
+    os.getenv('WEBHOOK_URL'),
+    cache_path=os.getenv('WEBHOOK_CACHE', DEFAULT_CACHE_PATH),
+    cache_ttl=float(os.getenv('WEBHOOK_CACHE_TTL', DEFAULT_CACHE_TTL))
+)
+
+metrics = Registry()
+handler_latency = metrics.histogram(
+    'bot_handler_duration_seconds', "Time spent in a command or callback handler", ('handler',)
+)
+api_latency = metrics.histogram(
+    'bot_api_request_duration_seconds', "Duration of outgoing Bot API calls", ('method',)
+)
+api_errors = metrics.counter('bot_api_request_errors', "Failed outgoing Bot API calls", ('method',))
+tests_completed = metrics.counter('bot_tests_completed', "Completed assessments by dominant style", ('style',))
+# Регистрируется после планировщика, чтобы мерить сам HTTP-запрос без ожидания очереди
+bot.session.middleware(BotAPIMetrics(api_latency, api_errors))
+
 dp = Dispatcher()
-styles = {
-    'A': 'Avoiding',
-    'B': 'Accommodating',
-    'C': 'Compromising',
-    'D': 'Collaborating',
-    'E': 'Competing'
-}
-
-style_descriptions = {
-    'A': '❌ <b>Avoiding</b>: You prefer to sidestep conflict, hoping it resolves itself or disappears.\n<i>Useful when issue is trivial or tensions are high.</i>',
-    'B': '🤝 <b>Accommodating</b>: You prioritize relationships, often yielding to others.\n<i>Useful when preserving harmony matters more than winning.</i>',
-    'C': '⚖️ <b>Compromising</b>: You seek a quick, fair middle ground.\n<i>Useful when time is limited or both sides hold equal power.</i>',
-    'D': '🤔 <b>Collaborating</b>: You aim for a win-win by deeply exploring all needs.\n<i>Useful for complex, long-term solutions.</i>',
-    'E': '🏆 <b>Competing</b>: You assert your position to achieve your goal.\n<i>Useful when quick action is critical or principle is at stake.</i>'
-}
-
-user_data = defaultdict(lambda: {"current_q": 0, "answers": []})
-
-questions = [
-    {
-        'text': """<b>Scenario 1 — Team Conflict</b>
-
-You're working on a critical group project where team tensions are rising. Two members frequently argue over technical decisions, slowing progress and frustrating everyone else. The deadline is fast approaching, and morale is dropping.
-
-<b>How do you handle the situation?</b>""",
-        'options': ['Avoid involvement', 'Support one person', 'Blend approaches', 'Organize discussion',
-                    'Choose best idea yourself'],
-        'mapping': ['A', 'B', 'C', 'D', 'E']
-    },
-    {
-        'text': """<b>Scenario 2 — Manager's Disagreement</b>
-
-You and a colleague disagree about how to divide tasks on a complex assignment.  
-Your manager is unavailable for guidance, and the project is time-sensitive.
-
-<b>What is your approach?</b>""",
-        'options': ['Let them take over', 'Agree to avoid conflict', 'Split tasks equally',
-                    'Discuss pros/cons of both ideas', 'Insist on your idea'],
-        'mapping': ['A', 'B', 'C', 'D', 'E']
-    },
-    {
-        'text': """<b>Scenario 3 — Disengaged Group Member</b>
-
-In a class project, one teammate consistently misses meetings and fails to deliver their part on time, jeopardizing the group's grade.  
-The rest of the team is frustrated, but no one has confronted them directly yet.
-
-<b>What do you do?</b>""",
-        'options': ['Ignore their behavior', 'Cover for them', 'Reassign tasks', 'Organize team meeting',
-                    'Confront them directly'],
-        'mapping': ['A', 'B', 'C', 'D', 'E']
-    },
-    {
-        'text': """<b>Scenario 4 — Public Mistake</b>
-
-During a high-stakes class presentation, you make a factual error that is immediately noticed by a professor. Your group looks concerned, and you feel embarrassed.
-
-<b>How do you react?</b>""",
-        'options': ['Step back silently', 'Acknowledge mistake quickly', 'Clarify error is minor',
-                    'Correct openly and follow up', 'Defend original statement'],
-        'mapping': ['A', 'B', 'C', 'D', 'E']
-    },
-    {
-        'text': """<b>Scenario 5 — Personal Boundary</b>
-
-A classmate often asks to borrow your notes and resources, but rarely reciprocates or helps you in return.  
-It's becoming inconvenient, and you feel the relationship is one-sided.
-
-<b>What do you do?</b>""",
-        'options': ['Keep sharing', 'Reduce sharing quietly', 'Suggest sharing equally', 'Discuss unfair dynamic',
-                    'Refuse to share anymore'],
-        'mapping': ['A', 'B', 'C', 'D', 'E']
-    },
-    {
-        'text': """<b>Scenario 6 — Overloaded with Tasks</b>
-
-You're part of a volunteer team organizing a university event. The team leader assigns you multiple time-consuming tasks while others have lighter workloads.  
-You're feeling overwhelmed and falling behind in your studies.
-
-<b>How do you handle the situation?</b>""",
-        'options': ['Accept all tasks quietly', 'Hint you`re overloaded', 'Ask for redistribution',
-                    'Propose transparent discussion', 'Refuse extra tasks'],
-        'mapping': ['A', 'B', 'C', 'D', 'E']
-    },
-    {
-        'text': """<b>Scenario 7 — Roommate Conflict</b>
-
-Your roommate frequently hosts loud gatherings late at night, disrupting your sleep and study schedule.  
-Although you've hinted at your discomfort, nothing has changed.
-
-<b>How do you act?</b>""",
-        'options': ['Ignore noise', 'Use earplugs', 'Propose quiet hours', 'Express clearly how it affects you',
-                    'Demand gatherings stop'],
-        'mapping': ['A', 'B', 'C', 'D', 'E']
-    },
-    {
-        'text': """<b>Scenario 8 — Unmet Expectations</b>
-
-You agreed to collaborate on a side project with a friend, but they consistently miss deadlines, leaving you to complete most of the work alone.
-
-<b>What is your response?</b>""",
-        'options': ['Work alone silently', 'Do it and hope they improve', 'Adjust project scope',
-                    'Discuss rebalancing tasks', 'Continue without them'],
-        'mapping': ['A', 'B', 'C', 'D', 'E']
-    },
-    {
-        'text': """<b>Scenario 9 — Family Obligation vs Academic Duty</b>
-
-Your family asks you to visit for an important celebration, but it coincides with a critical group project deadline. Your team is relying on you.
-
-<b>What do you do?</b>""",
-        'options': ['Skip project work', 'Go home & rush tasks', 'Redistribute tasks',
-                    'Discuss balance with both sides', 'Decline family invite'],
-        'mapping': ['A', 'B', 'C', 'D', 'E']
-    },
-    {
-        'text': """<b>Scenario 10 — Team Member With Personal Issues</b>
-
-A teammate confides in you that they are going through personal difficulties, which is why their performance has declined.  
-The rest of the team is frustrated and unaware of this.
-
-<b>What's your approach?</b>""",
-        'options': ['Say nothing', 'Quietly cover for them', 'Ask team to accommodate them', 'Encourage transparency',
-                    'Tell leader to redistribute tasks'],
-        'mapping': ['A', 'B', 'C', 'D', 'E']
-    },
-    {
-        'text': """<b>Scenario 11 — Supervisor Micromanagement</b>
-
-Your supervisor gives you detailed instructions and constantly checks on your progress, limiting your ability to work independently.
-
-<b>What do you do?</b>""",
-        'options': ['Follow exactly', 'Follow but show initiative', 'Suggest periodic check-ins',
-                    'Discuss need for autonomy', 'Push back and ask full control'],
-        'mapping': ['A', 'B', 'C', 'D', 'E']
-    },
-    {
-        'text': """<b>Scenario 12 — Handling Criticism</b>
-
-During a peer-review session, a fellow student critiques your work very harshly and dismissively, leaving you demotivated.  
-The feedback contains both valid and exaggerated points.
-
-<b>How do you respond?</b>""",
-        'options': ['Stay silent', 'Thank & avoid them', 'Accept valid points only', 'Engage in dialogue',
-                    'Challenge criticism'],
-        'mapping': ['A', 'B', 'C', 'D', 'E']
-    },
-    {
-        'text': """<b>Scenario 13 — Conflicting Deadlines</b>
-
-Two professors assign conflicting deadlines for major assignments. Both require a large amount of work in a short timeframe.
-
-<b>How do you handle it?</b>""",
-        'options': ['Prioritize one task', 'Focus on easier task first', 'Split effort evenly',
-                    'Discuss extensions with both professors', 'Choose most rewarding task'],
-        'mapping': ['A', 'B', 'C', 'D', 'E']
-    },
-    {
-        'text': """<b>Scenario 14 — Overheard Gossip</b>
-
-You overhear classmates spreading false rumors about another student, who is unaware of it.  
-You dislike gossip but don't know whether to intervene.
-
-<b>What do you do?</b>""",
-        'options': ['Ignore it', 'Distance yourself silently', 'Talk privately to gossiper', 'Warn the person targeted',
-                    'Confront gossipers directly'],
-        'mapping': ['A', 'B', 'C', 'D', 'E']
-    },
-    {
-        'text': """<b>Scenario 15 — Resource Allocation</b>
-
-Your team has limited budget/resources, and two project ideas are competing for them. Both sides are passionate and won't easily compromise.
-
-<b>How do you respond?</b>""",
-        'options': ['Avoid the argument', 'Support one project quietly', 'Split budget evenly',
-                    'Facilitate group negotiation', 'Push for your preferred project'],
-        'mapping': ['A', 'B', 'C', 'D', 'E']
-    }
-]
-
-
-def get_question_keyboard(question_index):
-    question = questions[question_index]
-    buttons = []
-    options_with_mapping = list(zip(question['options'], question['mapping']))
-    random.shuffle(options_with_mapping)
-
-    for option, mapping in options_with_mapping:
-        buttons.append([InlineKeyboardButton(
-            text=option,
-            callback_data=f"answer:{mapping}"
-        )])
-    return InlineKeyboardMarkup(inline_keyboard=buttons)
-
-
-def get_style_summary(scores):
-    """Determine user's dominant style"""
-    result = max(scores, key=scores.get)
-    desc = style_descriptions[result]
-    return result, desc
+dp.message.middleware(HandlerMetrics(handler_latency))
+dp.callback_query.middleware(HandlerMetrics(handler_latency))
+# Счётчики создаются заранее, чтобы завершение теста ничего не выделяло
+style_completions = {code: tests_completed.labels(code) for code in STYLE_CODES}
+
+SESSION_TTL = int(os.getenv('SESSION_TTL', DEFAULT_TTL))
+user_data = SessionStore(
+    ttl=SESSION_TTL,
+    max_size=int(os.getenv('SESSION_MAX_SIZE', DEFAULT_MAX_SIZE)),
+    backend=create_backend(
+        os.getenv('SESSION_BACKEND', 'memory'),
+        ttl=SESSION_TTL,
+        sqlite_path=os.getenv('SESSION_DB', 'sessions.db'),
+        redis_url=os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+    )
+)
+
+# Тексты, стили и вопросы лежат в content/<locale>.json и перезагружаются без перезапуска
+content = ContentStore(
+    os.getenv('CONTENT_DIR', DEFAULT_CONTENT_DIR),
+    default_locale=os.getenv('CONTENT_LOCALE', DEFAULT_LOCALE),
+    reload_interval=float(os.getenv('CONTENT_RELOAD_INTERVAL', DEFAULT_RELOAD_INTERVAL))
+)
+content.load()
+# Журнал всех завершённых тестов; пустой RESULTS_LOG отключает запись на диск
+RESULTS_LOG = RESULTS_LOG_BASE = os.getenv('RESULTS_LOG', 'results.log')
+if RESULTS_LOG and WORKER_INDEX is not None:
+    # Каждый воркер пишет свой журнал, один файл на несколько процессов не делится;
+    # results_log.py и analytics.analyze_logs читают их вместе (results_log.log_paths)
+    RESULTS_LOG = f'{RESULTS_LOG}.{WORKER_INDEX}'
+results = ResultsSink(
+    content.questions,
+    max_rows=int(os.getenv('RESULTS_MAX_ROWS', DEFAULT_MAX_ROWS)),
+    log=ResultsLog(RESULTS_LOG, content.questions) if RESULTS_LOG else None
+)
+# Telegram id администраторов через запятую, им доступна команда /stats
+ADMIN_IDS = {int(user_id) for user_id in os.getenv('ADMIN_IDS', '').split(',') if user_id.strip()}
+# Задержки цикла событий дольше LOOP_LAG_THRESHOLD секунд попадают в журнал со стеком; 0 отключает
+loop_monitor = LoopLagMonitor(float(os.getenv('LOOP_LAG_THRESHOLD', 0)))
+# /debug/profile и /debug/memory есть только при заданном DEBUG_TOKEN
+DEBUG_TOKEN = os.getenv('DEBUG_TOKEN')
+debug_endpoints = DebugEndpoints(DEBUG_TOKEN, user_data, results, loop_monitor) if DEBUG_TOKEN else None
+
+# adaptive: тест заканчивается, как только доминирующий стиль определён
+TEST_MODE = os.getenv('TEST_MODE', 'full')
+early_stop = EarlyStop(
+    content.questions,
+    confidence=float(os.getenv('ADAPTIVE_CONFIDENCE', DEFAULT_CONFIDENCE)),
+    min_answers=int(os.getenv('ADAPTIVE_MIN_ANSWERS', DEFAULT_MIN_ANSWERS))
+) if TEST_MODE == 'adaptive' else None
 
 
 @dp.message(Command("start"))
 async def cmd_start(message: Message):
     try:
-        logger.info(f"Получена команда /start от пользователя {message.from_user.id}")
-        text = (
-            "<b>Welcome to the Conflict Resolution Style Test Bot!</b>\n\n"
-            "🛠️ This is a soft skills portfolio project by <b>Bohdan Sharloimov</b>\n"
-            "Student ID: <b>104936</b>\n\n"
-            "Use /info to get in detail about this project.\n"
-            "Use /test to start the assessment!\n"
-            "Or /styles to learn about all conflict styles."
-            "Or /resources to get in know with useful literature"
-        )
-        await message.answer(text)
-        logger.info(f"Ответ на команду /start отправлен пользователю {message.from_user.id}")
+        logger.info("Получена команда /start от пользователя %s", message.from_user.id)
+        await message.answer(content.catalog(message.from_user.language_code).texts['start'])
+        logger.info("Ответ на команду /start отправлен пользователю %s", message.from_user.id)
     except Exception as e:
-        logger.error(f"Ошибка при обработке команды /start: {e}")
-        logger.error(f"Traceback: {traceback.format_exc()}")
+        logger.error("Ошибка при обработке команды /start: %s", e)
+        logger.error("Traceback: %s", traceback.format_exc())
         try:
             await message.answer("Произошла ошибка при обработке команды. Пожалуйста, попробуйте позже.")
         except:
@@ -256,15 +160,12 @@ async def cmd_start(message: Message):
 @dp.message(Command("styles"))
 async def cmd_styles(message: Message):
     try:
-        logger.info(f"Получена команда /styles от пользователя {message.from_user.id}")
-        text = "<b>Conflict Resolution Styles Overview:</b>\n\n"
-        for desc in style_descriptions.values():
-            text += f"{desc}\n\n"
-        await message.answer(text)
-        logger.info(f"Ответ на команду /styles отправлен пользователю {message.from_user.id}")
+        logger.info("Получена команда /styles от пользователя %s", message.from_user.id)
+        await message.answer(content.catalog(message.from_user.language_code).texts['styles'])
+        logger.info("Ответ на команду /styles отправлен пользователю %s", message.from_user.id)
     except Exception as e:
-        logger.error(f"Ошибка при обработке команды /styles: {e}")
-        logger.error(f"Traceback: {traceback.format_exc()}")
+        logger.error("Ошибка при обработке команды /styles: %s", e)
+        logger.error("Traceback: %s", traceback.format_exc())
         try:
             await message.answer("Произошла ошибка при обработке команды. Пожалуйста, попробуйте позже.")
         except:
@@ -274,29 +175,12 @@ async def cmd_styles(message: Message):
 @dp.message(Command("info"))
 async def cmd_info(message: Message):
     try:
-        logger.info(f"Получена команда /info от пользователя {message.from_user.id}")
-        text = (
-            "<b>ℹ️ About This Bot</b>\n\n"
-            "This bot is designed to help users identify their dominant <b>Conflict Resolution Style</b> through an interactive assessment.\n\n"
-            "💡 <b>Purpose:</b>\n"
-            "• Raise awareness of different conflict-handling strategies.\n"
-            "• Provide users with actionable insights on how they approach conflicts.\n"
-            "• Offer guidance on how to leverage their preferred style effectively.\n\n"
-            "🛠️ <b>Developed by:</b> Bohdan Sharloimov\n"
-            "🎓 <b>University Soft Skills Portfolio Project</b>\n"
-            "🆔 <b>Student ID:</b> 104936\n\n"
-            "<b>Key Features:</b>\n"
-            "• 15 scenario-based questions\n"
-            "• Clear descriptions of all 5 conflict styles\n"
-            "• Tailored recommendations based on results\n"
-            "• User-friendly interface with intuitive buttons\n\n"
-            "Use /test to start the assessment, /styles to learn about all styles! or /resources to learn about all conflict styles."
-        )
-        await message.answer(text)
-        logger.info(f"Ответ на команду /info отправлен пользователю {message.from_user.id}")
+        logger.info("Получена команда /info от пользователя %s", message.from_user.id)
+        await message.answer(content.catalog(message.from_user.language_code).texts['info'])
+        logger.info("Ответ на команду /info отправлен пользователю %s", message.from_user.id)
     except Exception as e:
-        logger.error(f"Ошибка при обработке команды /info: {e}")
-        logger.error(f"Traceback: {traceback.format_exc()}")
+        logger.error("Ошибка при обработке команды /info: %s", e)
+        logger.error("Traceback: %s", traceback.format_exc())
         try:
             await message.answer("Произошла ошибка при обработке команды. Пожалуйста, попробуйте позже.")
         except:
@@ -306,41 +190,12 @@ async def cmd_info(message: Message):
 @dp.message(Command("resources"))
 async def cmd_resources(message: Message):
     try:
-        logger.info(f"Получена команда /resources от пользователя {message.from_user.id}")
-        text = (
-            "<b>📚 Useful Resources for Conflict Resolution</b>\n\n"
-            "<b>📖 Books:</b>\n"
-            "• <i>«Difficult Conversations»</i> - Douglas Stone\n"
-            "• <i>«Don't Shoot the Dog»</i> - Karen Pryor\n"
-            "• <i>«The Power of a Positive No»</i> - William Ury\n\n"
-            "<b>🌐 Articles and Blogs:</b>\n"
-            "• Harvard Business Review - Conflict Management Section\n"
-            "• Psychology Today - Communication Articles\n"
-            "• MindTools - Conflict Resolution Guides\n\n"
-            "<b>🎯 Practical Exercises:</b>\n"
-            "1. <b>Active Listening:</b>\n"
-            "   • Practice paraphrasing\n"
-            "   • Ask clarifying questions\n"
-            "   • Use mirroring technique\n\n"
-            "2. <b>Emotional Intelligence:</b>\n"
-            "   • Keep an emotion journal\n"
-            "   • Practice empathy\n"
-            "   • Develop self-awareness\n\n"
-            "3. <b>Mediation:</b>\n"
-            "   • Role-playing exercises\n"
-            "   • De-escalation techniques\n"
-            "   • Practice neutral language\n\n"
-            "<b>🎓 Online Courses:</b>\n"
-            "• Coursera: «Conflict Management»\n"
-            "• edX: «Effective Communication»\n"
-            "• Udemy: «Workplace Conflict Resolution»\n\n"
-            "<i>Keep updating your knowledge and practicing new techniques!</i>"
-        )
-        await message.answer(text)
-        logger.info(f"Ответ на команду /resources отправлен пользователю {message.from_user.id}")
+        logger.info("Получена команда /resources от пользователя %s", message.from_user.id)
+        await message.answer(content.catalog(message.from_user.language_code).texts['resources'])
+        logger.info("Ответ на команду /resources отправлен пользователю %s", message.from_user.id)
     except Exception as e:
-        logger.error(f"Ошибка при обработке команды /resources: {e}")
-        logger.error(f"Traceback: {traceback.format_exc()}")
+        logger.error("Ошибка при обработке команды /resources: %s", e)
+        logger.error("Traceback: %s", traceback.format_exc())
         try:
             await message.answer("Произошла ошибка при обработке команды. Пожалуйста, попробуйте позже.")
         except:
@@ -350,169 +205,395 @@ async def cmd_resources(message: Message):
 @dp.message(Command("test"))
 async def cmd_test(message: Message):
     try:
-        logger.info(f"Получена команда /test от пользователя {message.from_user.id}")
+        logger.info("Получена команда /test от пользователя %s", message.from_user.id)
         user_id = message.from_user.id
-        user_data[user_id] = {"current_q": 0, "answers": []}
-        await send_question(message.chat.id, user_id)
-        logger.info(f"Тест начат для пользователя {message.from_user.id}")
+        # Тест проходит целиком на той версии контента, с которой начат
+        await user_data.start(user_id, content.version)
+        async with OutboundBatch(message.bot) as out:
+            await send_question(out, message.chat.id, user_id, message.from_user.language_code)
+        logger.info("Тест начат для пользователя %s", message.from_user.id)
     except Exception as e:
-        logger.error(f"Ошибка при обработке команды /test: {e}")
-        logger.error(f"Traceback: {traceback.format_exc()}")
+        logger.error("Ошибка при обработке команды /test: %s", e)
+        logger.error("Traceback: %s", traceback.format_exc())
         try:
             await message.answer("Произошла ошибка при обработке команды. Пожалуйста, попробуйте позже.")
         except:
             pass
 
 
-async def send_question(chat_id, user_id):
-    state = user_data[user_id]
-    q_index = state['current_q']
-    if q_index < len(questions):
-        question = questions[q_index]
-        await bot.send_message(chat_id, question['text'], reply_markup=get_question_keyboard(q_index))
-        print("Write /reset to restart the test")
+async def send_question(out, chat_id, user_id, language_code=None):
+    state = await user_data.get(user_id)
+    if state is None:
+        return
+    catalog = content.catalog(language_code, state.catalog)
+    q_index = state.current_q
+    if q_index < content.questions and (early_stop is None or not early_stop.decided(state.counts, q_index)):
+        bank = catalog.questions
+        state.order = bank.pick_order(q_index)
+        # Пока вопрос не отправлен, его сообщение неизвестно и кнопки проверяются по нонсу
+        state.message_id = 0
+        await user_data.save(user_id, state)
+
+        async def remember_message(sent):
+            # За время отправки пользователь мог начать тест заново
+            if state.current_q == q_index and await user_data.get(user_id) is state:
+                state.message_id = sent.message_id
+                await user_data.save(user_id, state)
+
+        out.send_message(chat_id, bank[q_index].text, reply_markup=bank.keyboard(q_index, state.nonce, state.order),
+                         key='question', on_sent=remember_message)
     else:
-        counts = defaultdict(int)
-        for answer in state['answers']:
-            counts[answer] += 1
-        result, desc = get_style_summary(counts)
-        text = f"<b>🎉 Your dominant Conflict Resolution Style: {styles[result]}</b>\n\n{desc}\n\n"
-        text += "✅ <b>Tips for you:</b>\n"
-        text += get_advice(result)
-        await bot.send_message(chat_id, text)
-        user_data.pop(user_id)
-
-
-def get_advice(style_code):
-    advice = {
-        'A': "• Use avoiding when issues are minor.\n• Don't avoid important conflicts too often.\n• Try expressing concerns earlier.",
-        'B': "• Good for relationships, but don't neglect your needs.\n• Assert yourself when it matters.\n• Balance harmony with fairness.",
-        'C': "• Works well when time is short.\n• Aim for compromise that feels fair.\n• Use collaboration for complex problems.",
-        'D': "• Excellent for strong partnerships.\n• Invest time to understand all perspectives.\n• Watch for over-analysis paralysis.",
-        'E': "• Useful when urgent action is key.\n• Ensure not to alienate others.\n• Be open to other views when time permits."
-    }
-    return advice[style_code]
+        result = dominant_style(state.scores())
+        out.send_message(chat_id, catalog.results[result], key='question')
+        await user_data.pop(user_id)
+        style_completions[result].inc()
+        results.add(user_id, STYLE_INDEX[result], state.answers)
 
 
 @dp.message(Command("reset"))
 async def cmd_reset(message: Message):
     try:
-        logger.info(f"Получена команда /reset от пользователя {message.from_user.id}")
+        logger.info("Получена команда /reset от пользователя %s", message.from_user.id)
         user_id = message.from_user.id
-        if user_id in user_data:
-            user_data.pop(user_id)
-            await message.answer("Your progress has been reset. Use /test to start a new assessment.")
+        texts = content.catalog(message.from_user.language_code).texts
+        if await user_data.pop(user_id) is not None:
+            await message.answer(texts['reset_done'])
         else:
-            await message.answer("You don't have any active assessment to reset. Use /test to start a new one.")
-        logger.info(f"Сброс прогресса выполнен для пользователя {message.from_user.id}")
+            await message.answer(texts['reset_none'])
+        logger.info("Сброс прогресса выполнен для пользователя %s", message.from_user.id)
     except Exception as e:
-        logger.error(f"Ошибка при обработке команды /reset: {e}")
-        logger.error(f"Traceback: {traceback.format_exc()}")
+        logger.error("Ошибка при обработке команды /reset: %s", e)
+        logger.error("Traceback: %s", traceback.format_exc())
         try:
             await message.answer("An error occurred while resetting. Please try again later.")
         except:
             pass
 
 
+@dp.message(Command("stats"))
+async def cmd_stats(message: Message):
+    try:
+        logger.info("Получена команда /stats от пользователя %s", message.from_user.id)
+        if message.from_user.id not in ADMIN_IDS:
+            await message.answer("This command is only available to administrators.")
+            return
+        # Агрегаты обновляются при каждом завершённом тесте, здесь только их чтение
+        summary = results.summary()
+        completed = summary['completed']
+        text = "<b>📊 Assessment statistics</b>"
+        text += f" <b>(worker {WORKER_INDEX})</b>\n\n" if WORKER_INDEX is not None else "\n\n"
+        text += f"Completed tests: <b>{completed}</b>\n"
+        text += f"Average answers per test: <b>{summary['answers_per_test']:.1f}</b>\n\n"
+        text += "<b>Dominant styles:</b>\n"
+        style_names = content.catalog(message.from_user.language_code).style_names
+        for code, count in summary['styles'].items():
+            share = count / completed if completed else 0.0
+            text += f"• {style_names[code]}: {count} ({share:.0%})\n"
+        text += (
+            f"\nFirst button chosen in <b>{summary['first_button_share']:.0%}</b> of answers "
+            f"({1 / len(STYLE_CODES):.0%} expected without position bias)."
+        )
+        text += f"\nContent version: <b>{content.version}</b>"
+        if WORKER_INDEX is not None:
+            # Воркер кластера видит только пользователей, которых фронт направил к нему
+            text += f"\n\n<i>Worker {WORKER_INDEX} only: each cluster worker counts the users routed to it."
+            if RESULTS_LOG:
+                text += f" For all results run results_log.py, it reads every {RESULTS_LOG_BASE}.* log."
+            text += "</i>"
+        await message.answer(text)
+    except Exception as e:
+        logger.error("Ошибка при обработке команды /stats: %s", e)
+        logger.error("Traceback: %s", traceback.format_exc())
+        try:
+            await message.answer("Произошла ошибка при обработке команды. Пожалуйста, попробуйте позже.")
+        except:
+            pass
+
+
 @dp.callback_query(F.data.startswith("answer:"))
 async def answer_callback(callback: CallbackQuery):
     user_id = callback.from_user.id
-    if user_id not in user_data:
-        await callback.answer("Please start a new test with /test.", show_alert=True)
+    language_code = callback.from_user.language_code
+    state = await user_data.get(user_id)
+    if state is None:
+        await callback.answer(content.catalog(language_code).texts['no_session'], show_alert=True)
         return
-    answer = callback.data.split(":")[1]
-    state = user_data[user_id]
-    q_index = state['current_q']
-    question = questions[q_index]
-    state['answers'].append(answer)
-    state['current_q'] += 1
-    buttons = []
-    for i, (option, mapping) in enumerate(zip(question['options'], question['mapping'])):
-        if mapping == answer:
-            text = f"✅ {option}"
-        else:
-            text = f"⬜ <s>{option}</s>"
-        buttons.append([InlineKeyboardButton(
-            text=text,
-            callback_data=f"answer:{mapping}",
-            disabled=True
-        )])
-        await callback.message.edit_reply_markup(
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons)
-        )
-        await send_question(callback.message.chat.id, user_id)
+    bank = content.catalog(language_code, state.catalog).questions
+    # Нажатие на кнопку старого сообщения или повторное нажатие: проверка и запись
+    # ответа идут без await между ними, поэтому засчитывается только одно.
+    # Нонс в кнопке короткий и повторяется, сообщение вопроса различает тесты надёжно
+    tap = bank.parse_callback(callback.data)
+    if (tap is None or tap.q_index != state.current_q or tap.nonce != state.nonce
+            or state.message_id and callback.message.message_id != state.message_id):
+        await callback.answer()
+        return
+    state.record(tap.mapping, bank.position(tap.q_index, state.order, tap.mapping))
+    markup = bank.answered_keyboard(tap.q_index, tap.mapping)
+    chat_id = callback.message.chat.id
+    async with OutboundBatch(callback.bot) as out:
+        out.edit_reply_markup(chat_id, callback.message.message_id, markup)
+        await send_question(out, chat_id, user_id, language_code)
+
+async def process_update(update):
+    await dp.feed_raw_update(bot, update)
+
+
+WEBHOOK_MODE = os.getenv('WEBHOOK_MODE', 'sync')
+update_dispatcher = UpdateDispatcher(
+    process_update,
+    workers=int(os.getenv('DISPATCH_WORKERS', DEFAULT_WORKERS)),
+    capacity=int(os.getenv('DISPATCH_CAPACITY', DEFAULT_CAPACITY))
+)
+
+update_deduplicator = UpdateDeduplicator(int(os.getenv('DEDUP_WINDOW', DEFAULT_DEDUP_WINDOW)))
+
+metrics.gauge('bot_active_sessions', "Sessions held in memory by user_data", lambda: len(user_data))
+metrics.gauge('bot_webhook_queue_depth', "Updates waiting in the webhook queue", lambda: update_dispatcher.depth)
+metrics.gauge('bot_outbound_queue_depth', "Bot API calls waiting for the flood limits",
+              lambda: outbound_scheduler.depth)
+if loop_monitor.enabled:
+    metrics.gauge('bot_event_loop_lag_seconds', "Lateness of the last event loop lag probe",
+                  lambda: loop_monitor.last_lag)
+
 
 async def webhook(request):
     try:
-        logger.info("Получен вебхук запрос")
+        logger.debug("Получен вебхук запрос")
         update = await request.json()
-        logger.info(f"Содержимое запроса: {update}")
+        log_payload(update)
 
         # Проверяем структуру update
         if not isinstance(update, dict):
-            logger.error(f"Неверный формат update: {type(update)}")
+            logger.error("Неверный формат update: %s", type(update))
             return web.Response(text="Invalid update format", status=400)
 
         # Проверяем наличие необходимых полей
         if 'message' not in update and 'callback_query' not in update:
-            logger.error(f"Отсутствуют необходимые поля в update: {update}")
+            logger.error("Отсутствуют необходимые поля в update: %s", update)
             return web.Response(text="Missing required fields", status=400)
 
+        # Повторная доставка того же update: подтверждаем, но не обрабатываем
+        update_id = update.get('update_id')
+        if update_id is not None and update_deduplicator.seen(update_id):
+            logger.info("Повторный update %s пропущен", update_id)
+            return web.Response(text="OK")
+
+        if WEBHOOK_MODE == 'queue':
+            # Подтверждаем сразу, обработка идёт в фоновых воркерах
+            if await update_dispatcher.enqueue(update):
+                return web.Response(text="OK")
+            if update_id is not None:
+                update_deduplicator.forget(update_id)
+            logger.error("Очередь обновлений переполнена: %s", update_dispatcher.stats())
+            return web.Response(text="Queue is full", status=503)
+
         try:
             await dp.feed_webhook_update(bot, update)
-            logger.info("Запрос успешно обработан")
+            logger.debug("Запрос успешно обработан")
             return web.Response(text="OK")
         except Exception as e:
-            logger.error(f"Ошибка при обработке update: {e}")
-            logger.error(f"Traceback: {traceback.format_exc()}")
+            # 500 просит Telegram доставить update ещё раз, повтор не должен считаться дублем
+            if update_id is not None:
+                update_deduplicator.forget(update_id)
+            logger.error("Ошибка при обработке update: %s", e)
+            logger.error("Traceback: %s", traceback.format_exc())
             return web.Response(text="Error processing update", status=500)
 
     except Exception as e:
-        logger.error(f"Ошибка в вебхуке: {e}")
-        logger.error(f"Traceback: {traceback.format_exc()}")
+        logger.error("Ошибка в вебхуке: %s", e)
+        logger.error("Traceback: %s", traceback.format_exc())
         return web.Response(text="Internal server error", status=500)
 
 
-# async def on_startup(app):
-#     try:
-#         logger.info("Запуск бота...")
-#         logger.info(f"Токен бота: {API_TOKEN[:10]}...")
-#         bot_info = await bot.get_me()
-#         logger.info(f"Информация о боте: {bot_info}")
-#         logger.info("Удаление старого вебхука...")
-#         await bot.delete_webhook(drop_pending_updates=True)
-#         webhook_url = os.getenv('WEBHOOK_URL', 'https://conflictresolutionbot.onrender.com/webhook')
-#         logger.info(f"Установка вебхука на URL: {webhook_url}")
-#         await bot.set_webhook(url=webhook_url)
-#         logger.info("Вебхук успешно установлен")
-#         webhook_info = await bot.get_webhook_info()
-#         logger.info(f"Информация о вебхуке: {webhook_info}")
-#     except Exception as e:
-#         logger.error(f"Ошибка при запуске: {e}")
-#         logger.error(f"Traceback: {traceback.format_exc()}")
-#         raise
-
-
-# async def on_shutdown(app):
-#     try:
-#         logger.info("Остановка бота...")
-#         await bot.session.close()
-#     except Exception as e:
-#         logger.error(f"Ошибка при остановке: {e}")
-#         logger.error(f"Traceback: {traceback.format_exc()}")
+async def metrics_handler(request):
+    return web.Response(body=metrics.render().encode(), headers={'Content-Type': CONTENT_TYPE})
+
+
+async def register_webhook(app):
+    # В кластере вебхук регистрирует только первый воркер
+    if not webhook_registration.url or WORKER_INDEX not in (None, '0'):
+        return
+    try:
+        result = await webhook_registration.ensure(dp.resolve_used_update_types())
+        logger.info("Вебхук %s: %s, запросов к Bot API: %s", webhook_registration.url, result,
+                    webhook_registration.api_calls)
+    except Exception as e:
+        logger.error("Не удалось зарегистрировать вебхук: %s", e)
+        logger.error("Traceback: %s", traceback.format_exc())
+
+
+async def warm_up(app):
+    # Открываем соединение с Bot API заранее, чтобы первое нажатие его не ждало
+    try:
+        bot_info = await bot.get_me()
+        logger.info("Соединение с Bot API готово: @%s, %s", bot_info.username, session.stats())
+    except Exception as e:
+        logger.error("Не удалось прогреть соединение с Bot API: %s", e)
+
+
+async def on_shutdown(app):
+    try:
+        logger.info("Остановка бота...")
+        logger.info("Соединения с Bot API: %s", session.stats())
+        await bot.session.close()
+    except Exception as e:
+        logger.error("Ошибка при остановке: %s", e)
+        logger.error("Traceback: %s", traceback.format_exc())
+
+
+async def open_sessions(app):
+    logger.info("Хранилище сессий: %s", user_data.backend.name)
+    await user_data.open()
+
+
+async def close_sessions(app):
+    await user_data.close()
+
+
+async def open_results(app):
+    await results.open()
+    if results.log is not None:
+        logger.info("Журнал результатов %s: %s записей, пересчитано после контрольной точки: %s",
+                    results.log.path, results.log.count, results.replayed)
+
+
+async def close_results(app):
+    await results.close()
+
+
+async def watch_content(app):
+    logger.info("Контент версии %s: %s", content.version, ', '.join(sorted(content.current)))
+    content.start()
+
+
+async def stop_content(app):
+    await content.close()
+
+
+async def start_loop_monitor(app):
+    if loop_monitor.enabled:
+        logger.info("Контроль задержек цикла событий: порог %s с", loop_monitor.threshold)
+        loop_monitor.start()
+
+
+async def stop_loop_monitor(app):
+    await loop_monitor.close()
+    if loop_monitor.enabled:
+        logger.info("Задержки цикла событий: %s", loop_monitor.stats())
+
+
+async def start_dispatcher(app):
+    if WEBHOOK_MODE == 'queue':
+        logger.info("Фоновая обработка обновлений: %s воркеров", update_dispatcher.workers)
+        update_dispatcher.start()
+
+
+async def stop_dispatcher(app):
+    if WEBHOOK_MODE == 'queue':
+        await update_dispatcher.close()
+        logger.info("Очередь обновлений остановлена: %s", update_dispatcher.stats())
+
+
+async def stop_outbound(app):
+    await outbound_scheduler.close()
+    logger.info("Исходящие запросы остановлены: %s", outbound_scheduler.stats())
+
+
+async def run_polling():
+    runner = PollingRunner(
+        bot,
+        UpdateDispatcher(
+            lambda update: dp.feed_update(bot, update),
+            workers=int(os.getenv('DISPATCH_WORKERS', DEFAULT_WORKERS)),
+            capacity=int(os.getenv('DISPATCH_CAPACITY', DEFAULT_CAPACITY)),
+            enqueue_timeout=None,
+            key=polled_user_id
+        ),
+        deduplicator=update_deduplicator,
+        allowed_updates=dp.resolve_used_update_types()
+    )
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, runner.stop)
+
+    logger.info("Хранилище сессий: %s", user_data.backend.name)
+    await user_data.open()
+    await open_results(None)
+    await watch_content(None)
+    await start_loop_monitor(None)
+    try:
+        # getUpdates не работает, пока установлен вебхук
+        await bot.delete_webhook(drop_pending_updates=False)
+        await asyncio.to_thread(webhook_registration.forget)
+        logger.info("Запуск бота в режиме опроса")
+        await runner.run()
+    finally:
+        logger.info("Опрос остановлен: %s", runner.stats())
+        logger.info("Соединения с Bot API: %s", session.stats())
+        await stop_loop_monitor(None)
+        await stop_content(None)
+        await outbound_scheduler.close()
+        await user_data.close()
+        await close_results(None)
+        await bot.session.close()
+
+
+async def health(request):
+    return web.Response(text="Bot is running")
+
+
+# Хуки жизненного цикла по порядку; boot.py вызывает их сам, когда модуль загружен.
+# aiohttp вызывает on_shutdown до того, как дождётся выполняющихся обработчиков, поэтому
+# исходящие запросы и сессия Bot API закрываются только в on_cleanup
+STARTUP_HOOKS = (open_sessions, open_results, watch_content, start_loop_monitor, start_dispatcher, register_webhook,
+                 warm_up)
+SHUTDOWN_HOOKS = (stop_loop_monitor, stop_content, stop_dispatcher)
+CLEANUP_HOOKS = (stop_outbound, on_shutdown, close_sessions, close_results)
+
+
+def create_app():
+    app = web.Application()
+    app.router.add_post('/webhook', webhook)
+    app.router.add_get('/', health)
+    app.router.add_get('/metrics', metrics_handler)
+    if debug_endpoints is not None:
+        app.router.add_get('/debug/{name}', debug_endpoints.handle)
+    app.on_startup.extend(STARTUP_HOOKS)
+    app.on_shutdown.extend(SHUTDOWN_HOOKS)
+    app.on_cleanup.extend(CLEANUP_HOOKS)
+    return app
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Conflict Resolution Style Test Bot")
+    parser.add_argument(
+        '--mode',
+        choices=('webhook', 'polling'),
+        default=os.getenv('BOT_MODE', 'webhook'),
+        help="webhook: aiohttp server with the /webhook route; polling: getUpdates long polling"
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=int(os.getenv('WEB_WORKERS', DEFAULT_WEB_WORKERS)),
+        help="webhook mode: worker processes behind a front process that routes each user to one worker"
+    )
+    parser.add_argument('--worker-socket', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    host, port = '0.0.0.0', int(os.getenv('PORT', 8000))
     try:
-        app = web.Application()
-        app.router.add_post('/webhook', webhook)
-        app.router.add_get('/', lambda request: web.Response(text="Bot is running"))
-        # app.on_startup.append(on_startup)
-        # app.on_shutdown.append(on_shutdown)
-        web.run_app(app, host='0.0.0.0', port=int(os.getenv('PORT', 8000)))
+        if args.mode == 'polling':
+            asyncio.run(run_polling())
+        elif args.worker_socket:
+            web.run_app(create_app(), path=args.worker_socket, print=None)
+        elif args.workers > 1:
+            cluster = Cluster([sys.executable, os.path.abspath(__file__), '--mode', 'webhook'], workers=args.workers)
+            asyncio.run(cluster.serve(host, port))
+        else:
+            web.run_app(create_app(), host=host, port=port)
     except Exception as e:
-        logger.error(f"Ошибка при запуске приложения: {e}")
-        logger.error(f"Traceback: {traceback.format_exc()}")
+        logger.error("Ошибка при запуске приложения: %s", e)
+        logger.error("Traceback: %s", traceback.format_exc())
         sys.exit(1)
 
 
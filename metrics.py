@@ -0,0 +1,206 @@
+# metrics.py
+import time
+from bisect import bisect_left
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Границы в секундах: от быстрых ответов из кэша до запросов, упёршихся в таймаут
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 15.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class CounterChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class HistogramChild:
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # Последняя ячейка для значений больше всех границ (+Inf)
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _Family:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+
+    def labels(self, *values):
+        """Child for the label values, created once; hot paths keep the child"""
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _header(self, name=None):
+        name = name or self.name
+        return [f'# HELP {name} {self.documentation}', f'# TYPE {name} {self.kind}']
+
+
+class Counter(_Family):
+    kind = 'counter'
+
+    def _new_child(self):
+        return CounterChild()
+
+    def render(self):
+        lines = self._header(f'{self.name}_total')
+        for values, child in self._children.items():
+            lines.append(f'{self.name}_total{_labels(self.labelnames, values)} {_number(child.value)}')
+        return lines
+
+
+class Histogram(_Family):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._le = tuple(f'le="{_number(float(bound))}"' for bound in self.buckets) + ('le="+Inf"',)
+
+    def _new_child(self):
+        return HistogramChild(self.buckets)
+
+    def render(self):
+        lines = self._header()
+        for values, child in self._children.items():
+            cumulative = 0
+            for le, count in zip(self._le, child.counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, values, le)} {cumulative}')
+            labels = _labels(self.labelnames, values)
+            lines.append(f'{self.name}_sum{labels} {_number(child.sum)}')
+            lines.append(f'{self.name}_count{labels} {child.count}')
+        return lines
+
+
+class Gauge(_Family):
+    """Value read by ``function`` at scrape time, so nothing is updated per request"""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, function):
+        super().__init__(name, documentation)
+        self.function = function
+
+    def render(self):
+        return self._header() + [f'{self.name} {_number(self.function())}']
+
+
+class Registry:
+    """Metric families rendered in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self._families = {}
+
+    def _register(self, family):
+        if family.name in self._families:
+            raise ValueError(f"Метрика {family.name} уже зарегистрирована")
+        self._families[family.name] = family
+        return family
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, function):
+        return self._register(Gauge(name, documentation, function))
+
+    def render(self):
+        lines = []
+        for family in self._families.values():
+            lines.extend(family.render())
+        lines.append('')
+        return '\n'.join(lines)
+
+
+class HandlerMetrics(BaseMiddleware):
+    """Inner middleware timing each aiogram handler under the handler's name"""
+
+    def __init__(self, histogram, clock=time.perf_counter):
+        self.histogram = histogram
+        self.clock = clock
+        self._children = {}
+
+    async def __call__(self, handler, event, data):
+        callback = data['handler'].callback
+        child = self._children.get(callback)
+        if child is None:
+            child = self._children[callback] = self.histogram.labels(callback.__name__)
+        started = self.clock()
+        try:
+            return await handler(event, data)
+        finally:
+            child.observe(self.clock() - started)
+
+
+class BotAPIMetrics(BaseRequestMiddleware):
+    """Request middleware timing Bot API calls and counting failures by method.
+
+    Registered after ``OutboundScheduler`` it measures the HTTP call itself,
+    without the time a call waited for its turn.
+    """
+
+    def __init__(self, histogram, errors, clock=time.perf_counter):
+        self.histogram = histogram
+        self.errors = errors
+        self.clock = clock
+        self._children = {}
+
+    async def __call__(self, make_request, bot, method):
+        name = method.__api_method__
+        children = self._children.get(name)
+        if children is None:
+            children = self._children[name] = (self.histogram.labels(name), self.errors.labels(name))
+        started = self.clock()
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            children[1].inc()
+            raise
+        finally:
+            children[0].observe(self.clock() - started)
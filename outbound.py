@@ -0,0 +1,359 @@
+# outbound.py
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+import traceback
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+from aiogram.methods import EditMessageReplyMarkup, EditMessageText
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 0
+BULK = 1
+
+# Лимиты Bot API: около 30 сообщений в секунду всего и 1 в секунду в один чат.
+# Скорость плюс запас корзины не превышают лимит ни в одном окне в 1 секунду
+DEFAULT_GLOBAL_RATE = 25.0
+DEFAULT_GLOBAL_BURST = 5
+DEFAULT_CHAT_RATE = 1.0
+DEFAULT_CHAT_BURST = 2
+DEFAULT_MAX_RETRIES = 5
+# Через столько отправок из памяти убираются корзины чатов, которые давно молчат
+DEFAULT_PURGE_EVERY = 1024
+
+outbound_priority = ContextVar('outbound_priority', default=INTERACTIVE)
+
+# Редактирования одного сообщения, которые можно заменить более новым
+COALESCED_METHODS = (EditMessageReplyMarkup, EditMessageText)
+
+
+class OutboundBatch:
+    """Outgoing actions of one handler, flushed as the smallest set of Bot API calls.
+
+    Handlers queue edits and sends instead of awaiting the Bot API directly.
+    Repeated edits of the same message collapse into one edit of the final
+    markup, and a send queued with a ``key`` replaces an earlier pending send
+    with the same key for the same chat. ``on_sent`` of a send is awaited
+    with the sent message.
+    """
+
+    __slots__ = ('bot', 'calls', '_edits', '_sends')
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.calls = 0
+        self._edits = {}
+        self._sends = []
+
+    def edit_reply_markup(self, chat_id, message_id, reply_markup):
+        self._edits[(chat_id, message_id)] = reply_markup
+
+    def send_message(self, chat_id, text, reply_markup=None, key=None, on_sent=None):
+        if key is not None:
+            self._sends = [item for item in self._sends if item[0] != (chat_id, key)]
+            self._sends.append(((chat_id, key), chat_id, text, reply_markup, on_sent))
+        else:
+            self._sends.append((None, chat_id, text, reply_markup, on_sent))
+
+    def __len__(self):
+        return len(self._edits) + len(self._sends)
+
+    async def flush(self):
+        edits, self._edits = self._edits, {}
+        sends, self._sends = self._sends, []
+
+        for (chat_id, message_id), reply_markup in edits.items():
+            self.calls += 1
+            try:
+                await self.bot.edit_message_reply_markup(
+                    chat_id=chat_id, message_id=message_id, reply_markup=reply_markup
+                )
+            except TelegramAPIError as e:
+                # Неудачное редактирование не должно мешать отправке следующего вопроса
+                logger.error("Ошибка при редактировании сообщения %s в чате %s: %s", message_id, chat_id, e)
+                logger.error("Traceback: %s", traceback.format_exc())
+
+        for _, chat_id, text, reply_markup, on_sent in sends:
+            self.calls += 1
+            message = await self.bot.send_message(chat_id, text, reply_markup=reply_markup)
+            if on_sent is not None:
+                await on_sent(message)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self.flush()
+        return False
+
+
+@contextmanager
+def bulk():
+    """Marks Bot API calls made inside the block as bulk traffic"""
+    token = outbound_priority.set(BULK)
+    try:
+        yield
+    finally:
+        outbound_priority.reset(token)
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = now
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, now):
+        """Seconds until a token is available"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def idle(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _Job:
+    __slots__ = ('make_request', 'bot', 'method', 'chat_id', 'priority', 'future', 'key', 'retries')
+
+    def __init__(self, make_request, bot, method, chat_id, priority, future, key):
+        self.make_request = make_request
+        self.bot = bot
+        self.method = method
+        self.chat_id = chat_id
+        self.priority = priority
+        self.future = future
+        self.key = key
+        self.retries = 0
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """Request middleware that paces Bot API calls within Telegram flood limits.
+
+    Calls addressed to a chat go through a global token bucket and a
+    per-chat one. Each chat keeps its calls in order with at most one in
+    flight, while different chats are sent concurrently. Interactive replies
+    are picked before bulk traffic (see ``bulk()``). A pending edit of a
+    message is replaced by a newer edit of the same message, and both
+    callers get the result of the newer one. On ``RetryAfter`` the call is
+    put back at the head of its chat, which is held for the requested time.
+    Calls without a chat (answerCallbackQuery, getUpdates, ...) pass through.
+    """
+
+    def __init__(self, global_rate=DEFAULT_GLOBAL_RATE, global_burst=DEFAULT_GLOBAL_BURST,
+                 chat_rate=DEFAULT_CHAT_RATE, chat_burst=DEFAULT_CHAT_BURST,
+                 max_retries=DEFAULT_MAX_RETRIES, purge_every=DEFAULT_PURGE_EVERY, clock=time.monotonic):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.purge_every = purge_every
+        self.clock = clock
+        self.sent = 0
+        self.failed = 0
+        self.coalesced = 0
+        self.retried = 0
+        self.throttled = 0
+        self._global = TokenBucket(global_rate, global_burst, clock())
+        self._buckets = {}
+        self._chats = {}
+        self._held = {}
+        self._pending_edits = {}
+        self._scheduled = set()
+        self._in_flight = set()
+        self._ready = []
+        self._delayed = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._sending = set()
+        self._until_purge = purge_every
+
+    @property
+    def depth(self):
+        return sum(len(queue) for queue in self._chats.values())
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, 'chat_id', None)
+        if chat_id is None:
+            return await make_request(bot, method)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return await asyncio.shield(self._submit(make_request, bot, method, chat_id))
+
+    def _submit(self, make_request, bot, method, chat_id):
+        key = None
+        if isinstance(method, COALESCED_METHODS) and method.message_id is not None:
+            key = (chat_id, method.message_id, type(method))
+            job = self._pending_edits.get(key)
+            if job is not None:
+                job.method = method
+                self.coalesced += 1
+                return job.future
+        future = asyncio.get_running_loop().create_future()
+        job = _Job(make_request, bot, method, chat_id, outbound_priority.get(), future, key)
+        if key is not None:
+            self._pending_edits[key] = job
+        self._chats.setdefault(chat_id, deque()).append(job)
+        self._schedule(chat_id, self.clock())
+        return future
+
+    def _schedule(self, chat_id, now):
+        if chat_id in self._scheduled or chat_id in self._in_flight:
+            return
+        queue = self._chats.get(chat_id)
+        if not queue:
+            return
+        bucket = self._buckets.get(chat_id)
+        ready_at = now + bucket.delay(now) if bucket is not None else now
+        ready_at = max(ready_at, self._held.get(chat_id, 0.0))
+        self._scheduled.add(chat_id)
+        if ready_at <= now:
+            heapq.heappush(self._ready, (queue[0].priority, next(self._seq), chat_id))
+        else:
+            self.throttled += 1
+            heapq.heappush(self._delayed, (ready_at, next(self._seq), chat_id))
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            now = self.clock()
+            while self._delayed and self._delayed[0][0] <= now:
+                _, seq, chat_id = heapq.heappop(self._delayed)
+                queue = self._chats.get(chat_id)
+                if queue:
+                    heapq.heappush(self._ready, (queue[0].priority, seq, chat_id))
+                else:
+                    self._scheduled.discard(chat_id)
+
+            if not self._ready:
+                timeout = self._delayed[0][0] - now if self._delayed else None
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            wait = self._global.delay(now)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+
+            _, _, chat_id = heapq.heappop(self._ready)
+            self._scheduled.discard(chat_id)
+            queue = self._chats.get(chat_id)
+            if not queue:
+                continue
+            job = queue.popleft()
+            if job.key is not None:
+                self._pending_edits.pop(job.key, None)
+            if job.future.done():
+                self._schedule(chat_id, now)
+                continue
+
+            bucket = self._buckets.get(chat_id)
+            if bucket is None:
+                bucket = self._buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, now)
+            bucket.take(now)
+            self._global.take(now)
+            self._in_flight.add(chat_id)
+            task = asyncio.create_task(self._send(job))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send(self, job):
+        chat_id = job.chat_id
+        try:
+            result = await job.make_request(job.bot, job.method)
+            self.sent += 1
+            if not job.future.done():
+                job.future.set_result(result)
+        except TelegramRetryAfter as e:
+            self.retried += 1
+            if job.retries < self.max_retries:
+                job.retries += 1
+                logger.warning("Флуд-контроль в чате %s, повтор через %s с", chat_id, e.retry_after)
+                self._held[chat_id] = self.clock() + e.retry_after
+                self._chats.setdefault(chat_id, deque()).appendleft(job)
+                if job.key is not None and job.key not in self._pending_edits:
+                    self._pending_edits[job.key] = job
+            else:
+                self._fail(job, e)
+        except Exception as e:
+            self._fail(job, e)
+        finally:
+            self._in_flight.discard(chat_id)
+            now = self.clock()
+            if self._chats.get(chat_id):
+                self._schedule(chat_id, now)
+            else:
+                self._chats.pop(chat_id, None)
+                if self._held.get(chat_id, 0.0) <= now:
+                    self._held.pop(chat_id, None)
+            # Под постоянной нагрузкой очередь почти никогда не пуста, поэтому
+            # чистим по счётчику; корзины чатов с работой _purge не трогает
+            self._until_purge -= 1
+            if self._until_purge <= 0:
+                self._until_purge = self.purge_every
+                self._purge(now)
+
+    def _fail(self, job, error):
+        self.failed += 1
+        logger.error("Не удалось выполнить %s в чате %s: %s", type(job.method).__name__, job.chat_id, error)
+        if not job.future.done():
+            job.future.set_exception(error)
+
+    def _purge(self, now):
+        # Полные корзины ничего не ограничивают, их можно создать заново
+        idle = [chat_id for chat_id, bucket in self._buckets.items()
+                if chat_id not in self._chats and bucket.idle(now)]
+        for chat_id in idle:
+            del self._buckets[chat_id]
+
+    async def close(self, timeout=10.0):
+        """Waits for queued calls to go out, then stops the scheduler"""
+        deadline = self.clock() + timeout
+        while (self._chats or self._in_flight) and self.clock() < deadline:
+            await asyncio.sleep(0.05)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self):
+        return {
+            'depth': self.depth,
+            'chats': len(self._chats),
+            'buckets': len(self._buckets),
+            'in_flight': len(self._in_flight),
+            'sent': self.sent,
+            'failed': self.failed,
+            'coalesced': self.coalesced,
+            'retried': self.retried,
+            'throttled': self.throttled,
+        }
@@ -0,0 +1,113 @@
+# polling.py
+import asyncio
+import logging
+import traceback
+
+from aiogram.exceptions import TelegramNetworkError, TelegramServerError
+
+from dispatch import UpdateDispatcher
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMIT = 100
+DEFAULT_POLL_TIMEOUT = 30
+MAX_BACKOFF = 5.0
+
+
+def polled_user_id(update):
+    """User of an aiogram Update, used to keep that user's updates in order"""
+    event = update.event
+    user = getattr(event, 'from_user', None)
+    if user is not None:
+        return user.id
+    chat = getattr(event, 'chat', None)
+    if chat is not None:
+        return chat.id
+    return update.update_id
+
+
+class PollingRunner:
+    """Pulls getUpdates in batches and fans them out to the update dispatcher.
+
+    The next batch is requested as soon as the current one is queued, so
+    handlers of a batch run while the following long poll is in flight;
+    the dispatcher's bounded queues stop polling when handlers fall behind.
+    """
+
+    def __init__(self, bot, dispatcher: UpdateDispatcher, deduplicator=None,
+                 limit=DEFAULT_LIMIT, poll_timeout=DEFAULT_POLL_TIMEOUT, allowed_updates=None):
+        self.bot = bot
+        self.dispatcher = dispatcher
+        self.deduplicator = deduplicator
+        self.limit = limit
+        self.poll_timeout = poll_timeout
+        self.allowed_updates = allowed_updates
+        self.batches = 0
+        self.received = 0
+        self.errors = 0
+        self._stopping = asyncio.Event()
+        self._poll_task = None
+
+    def stop(self):
+        self._stopping.set()
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+
+    async def run(self):
+        offset = None
+        backoff = 0.5
+        self.dispatcher.start()
+        try:
+            while not self._stopping.is_set():
+                self._poll_task = asyncio.create_task(self.bot.get_updates(
+                    offset=offset,
+                    limit=self.limit,
+                    timeout=self.poll_timeout,
+                    allowed_updates=self.allowed_updates,
+                    request_timeout=self.poll_timeout + 10
+                ))
+                try:
+                    updates = await self._poll_task
+                except asyncio.CancelledError:
+                    if self._stopping.is_set():
+                        break
+                    raise
+                except (TelegramNetworkError, TelegramServerError) as e:
+                    self.errors += 1
+                    logger.error("Ошибка getUpdates: %s, повтор через %s с", e, backoff)
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, MAX_BACKOFF)
+                    continue
+                finally:
+                    self._poll_task = None
+                backoff = 0.5
+
+                if not updates:
+                    continue
+                self.batches += 1
+                self.received += len(updates)
+                for update in updates:
+                    offset = update.update_id + 1
+                    if self.deduplicator is not None and self.deduplicator.seen(update.update_id):
+                        continue
+                    await self.dispatcher.enqueue(update)
+        except Exception as e:
+            logger.error("Ошибка в цикле опроса: %s", e)
+            logger.error("Traceback: %s", traceback.format_exc())
+            raise
+        finally:
+            await self.dispatcher.close()
+            # Подтверждаем последний пакет, чтобы Telegram не прислал его снова
+            if offset is not None:
+                try:
+                    await self.bot.get_updates(offset=offset, limit=1, timeout=0)
+                except Exception as e:
+                    logger.error("Не удалось подтвердить offset %s: %s", offset, e)
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'received': self.received,
+            'errors': self.errors,
+            'dispatcher': self.dispatcher.stats(),
+        }
@@ -0,0 +1,136 @@
+# question_bank.py
+import random
+from types import MappingProxyType
+from typing import NamedTuple
+
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from sessions import NONCE_SPACE
+
+# Сколько перемешанных вариантов клавиатуры держим на каждый вопрос
+KEYBOARD_POOL_SIZE = 12
+# Нонс кнопок уже отвеченного вопроса, не совпадает ни с одной сессией
+ANSWERED_NONCE = 'x'
+
+
+class CompiledQuestion(NamedTuple):
+    text: str
+    options: tuple
+    mapping: tuple
+    orders: tuple
+    # Для каждого порядка: стиль -> позиция его кнопки
+    positions: tuple
+
+
+class AnswerCallback(NamedTuple):
+    q_index: int
+    nonce: int
+    mapping: str
+
+
+def answer_data(q_index, nonce, mapping):
+    return f"answer:{q_index}:{nonce}:{mapping}"
+
+
+class QuestionBank:
+    """Questions compiled once into ready-to-send texts and keyboards.
+
+    Every question gets a pool of shuffled option orders to pick from and a
+    table of "answered" keyboards keyed by (question index, chosen mapping),
+    so handlers only look objects up and never build markup per tap.
+
+    Buttons carry ``answer:<question>:<nonce>:<mapping>``. Keyboards for a
+    (question, nonce, order) are built on first use and cached; the cache is
+    bounded by the size of the pool and the nonce space. All valid
+    callback_data strings are known up front, so parsing a tap is a single
+    dict lookup.
+    """
+
+    def __init__(self, questions, pool_size=KEYBOARD_POOL_SIZE, rng=None):
+        rng = rng or random.Random()
+        compiled = []
+        answered = {}
+        callbacks = {}
+        for q_index, question in enumerate(questions):
+            pairs = tuple(zip(question['options'], question['mapping']))
+            orders = self._shuffled_orders(pairs, pool_size, rng)
+            compiled.append(CompiledQuestion(
+                text=question['text'],
+                options=tuple(question['options']),
+                mapping=tuple(question['mapping']),
+                orders=orders,
+                positions=tuple(
+                    MappingProxyType({mapping: position for position, (_, mapping) in enumerate(order)})
+                    for order in orders
+                ),
+            ))
+            for chosen in question['mapping']:
+                answered[(q_index, chosen)] = self._answered_keyboard(q_index, pairs, chosen)
+                for nonce in range(NONCE_SPACE):
+                    callbacks[answer_data(q_index, f"{nonce:x}", chosen)] = AnswerCallback(q_index, nonce, chosen)
+        self.questions = tuple(compiled)
+        self.answered = MappingProxyType(answered)
+        self.callbacks = MappingProxyType(callbacks)
+        self._keyboards = {}
+
+    def __len__(self):
+        return len(self.questions)
+
+    def __getitem__(self, q_index):
+        return self.questions[q_index]
+
+    def pick_order(self, q_index):
+        return random.randrange(len(self.questions[q_index].orders))
+
+    def keyboard(self, q_index, nonce, order_index=None):
+        orders = self.questions[q_index].orders
+        if order_index is None:
+            order_index = self.pick_order(q_index)
+        key = (q_index, nonce, order_index)
+        keyboard = self._keyboards.get(key)
+        if keyboard is None:
+            keyboard = self._keyboards[key] = InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(text=option, callback_data=answer_data(q_index, f"{nonce:x}", mapping))]
+                for option, mapping in orders[order_index]
+            ])
+        return keyboard
+
+    def position(self, q_index, order_index, mapping):
+        """Position of the button for ``mapping`` in the given option order"""
+        return self.questions[q_index].positions[order_index][mapping]
+
+    def answered_keyboard(self, q_index, chosen):
+        return self.answered[(q_index, chosen)]
+
+    def parse_callback(self, data):
+        """Question, nonce and mapping of a live answer button, None for anything else"""
+        return self.callbacks.get(data)
+
+    @staticmethod
+    def _shuffled_orders(pairs, pool_size, rng):
+        seen = set()
+        orders = []
+        # Количество различных перестановок может быть меньше размера пула
+        attempts = pool_size * 10
+        while len(orders) < pool_size and attempts:
+            attempts -= 1
+            order = tuple(rng.sample(pairs, len(pairs)))
+            if order in seen:
+                continue
+            seen.add(order)
+            orders.append(order)
+        return tuple(orders)
+
+    @staticmethod
+    def _answered_keyboard(q_index, pairs, chosen):
+        buttons = []
+        for option, mapping in pairs:
+            if mapping == chosen:
+                text = f"✅ {option}"
+            else:
+                text = f"⬜ <s>{option}</s>"
+            buttons.append([InlineKeyboardButton(
+                text=text,
+                callback_data=answer_data(q_index, ANSWERED_NONCE, mapping)
+            )])
+        return InlineKeyboardMarkup(inline_keyboard=buttons)
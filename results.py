@@ -0,0 +1,138 @@
+# results.py
+import asyncio
+import time
+from array import array
+
+from sessions import STYLE_CODES, POSITION_SHIFT, STYLE_MASK
+
+# Байт в столбцах choices и positions для вопроса, на который не отвечали
+NO_ANSWER = 0xFF
+DEFAULT_MAX_ROWS = 1_000_000
+
+
+class ResultsSink:
+    """Completed assessments stored column by column in ``array`` buffers.
+
+    Each result is a user id, a timestamp, the dominant style and, per
+    question, the chosen style and the position of the chosen button
+    (``NO_ANSWER`` for questions the test skipped). Choices and positions
+    are flat row-major arrays of ``questions`` bytes per result, so the
+    columns can be handed to NumPy without copying (see ``analytics``).
+
+    Running aggregates are updated on every ``add``, so summaries never scan
+    the rows. Past ``max_rows`` the oldest rows are overwritten in place,
+    while the aggregates keep counting every result.
+
+    With a ``ResultsLog`` every result is also appended to disk, and
+    ``open`` rebuilds the aggregates from the log's checkpoint plus the
+    records written after it.
+    """
+
+    def __init__(self, questions, max_rows=DEFAULT_MAX_ROWS, clock=time.time, log=None):
+        self.questions = questions
+        self.max_rows = max_rows
+        self.clock = clock
+        self.log = log
+        self.replayed = 0
+        self._next_row = 0
+        self.user_ids = array('q')
+        self.timestamps = array('d')
+        self.styles = array('B')
+        self.choices = array('B')
+        self.positions = array('B')
+        self.total = 0
+        self.answered = 0
+        self.style_counts = [0] * len(STYLE_CODES)
+        self.choice_counts = [[0] * len(STYLE_CODES) for _ in range(questions)]
+        self.position_counts = [[0] * len(STYLE_CODES) for _ in range(questions)]
+
+    def __len__(self):
+        return len(self.styles)
+
+    def add(self, user_id, style, answers):
+        """Records a completed test; ``answers`` are the packed bytes of ``Session.answers``"""
+        choices = array('B', [NO_ANSWER]) * self.questions
+        positions = array('B', [NO_ANSWER]) * self.questions
+        for q_index, packed in enumerate(answers[:self.questions]):
+            choices[q_index] = packed & STYLE_MASK
+            positions[q_index] = packed >> POSITION_SHIFT
+        self._count(style, choices, positions)
+        timestamp = self.clock()
+        if self.log is not None:
+            self.log.append(user_id, timestamp, style, choices.tobytes(), positions.tobytes())
+
+        if len(self.styles) < self.max_rows:
+            self.user_ids.append(user_id)
+            self.timestamps.append(timestamp)
+            self.styles.append(style)
+            self.choices.extend(choices)
+            self.positions.extend(positions)
+        else:
+            row = self._next_row
+            self._next_row = (row + 1) % self.max_rows
+            start = row * self.questions
+            self.user_ids[row] = user_id
+            self.timestamps[row] = timestamp
+            self.styles[row] = style
+            self.choices[start:start + self.questions] = choices
+            self.positions[start:start + self.questions] = positions
+
+    def _count(self, style, choices, positions):
+        for q_index, choice in enumerate(choices):
+            if choice == NO_ANSWER:
+                continue
+            self.choice_counts[q_index][choice] += 1
+            self.position_counts[q_index][positions[q_index]] += 1
+            self.answered += 1
+        self.style_counts[style] += 1
+        self.total += 1
+
+    def counters(self):
+        return {
+            'total': self.total,
+            'answered': self.answered,
+            'styles': self.style_counts,
+            'choices': self.choice_counts,
+            'positions': self.position_counts,
+        }
+
+    def restore(self, counters):
+        self.total = counters['total']
+        self.answered = counters['answered']
+        self.style_counts = list(counters['styles'])
+        self.choice_counts = [list(counts) for counts in counters['choices']]
+        self.position_counts = [list(counts) for counts in counters['positions']]
+
+    async def open(self):
+        if self.log is None:
+            return
+        await self.log.open()
+        records, counters = self.log.read_checkpoint()
+        if counters is not None:
+            self.restore(counters)
+        # Сервер ещё не принимает обновления, агрегаты можно пересчитать в потоке
+        self.replayed = await asyncio.to_thread(self._replay, records)
+
+    def _replay(self, start):
+        replayed = 0
+        for _, _, style, choices, positions in self.log.records(start):
+            self._count(style, choices, positions)
+            replayed += 1
+        return replayed
+
+    async def close(self):
+        if self.log is None:
+            return
+        await self.log.close()
+        await asyncio.to_thread(self.log.write_checkpoint, self.counters())
+
+    def summary(self):
+        """Aggregates over every result recorded since start"""
+        first_button = sum(counts[0] for counts in self.position_counts)
+        return {
+            'completed': self.total,
+            'stored': len(self),
+            'styles': dict(zip(STYLE_CODES, self.style_counts)),
+            'answers_per_test': self.answered / self.total if self.total else 0.0,
+            'first_button_share': first_button / self.answered if self.answered else 0.0,
+        }
@@ -0,0 +1,306 @@
+# results_log.py
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import traceback
+from contextlib import contextmanager
+
+from results import NO_ANSWER
+from sessions import STYLE_CODES
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'CRRL'
+LOG_VERSION = 1
+# Сигнатура, версия формата, число вопросов и размер записи; 16 байт с выравниванием
+HEADER = struct.Struct('<4sHHI4x')
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_BATCH_RECORDS = 1024
+# Сколько записей экспорт и проверка хвоста разбирают за один проход
+CHUNK_RECORDS = 4096
+
+
+def record_struct(questions):
+    """user id, timestamp, style, then one choice byte and one button position byte per question"""
+    return struct.Struct(f'<qdB{questions}s{questions}s')
+
+
+def log_paths(path):
+    """The log at ``path`` and the per-worker logs ``<path>.<n>`` written in cluster mode"""
+    directory, name = os.path.split(path)
+    worker_logs = sorted(
+        (entry for entry in os.listdir(directory or '.')
+         if entry.startswith(f'{name}.') and entry[len(name) + 1:].isdigit()),
+        key=lambda entry: int(entry[len(name) + 1:])
+    )
+    paths = [path] if os.path.exists(path) else []
+    return paths + [os.path.join(directory, entry) for entry in worker_logs]
+
+
+def read_header(path):
+    """Number of questions and of complete records in the log at ``path``"""
+    with open(path, 'rb') as f:
+        header = f.read(HEADER.size)
+        size = os.fstat(f.fileno()).st_size
+    if len(header) < HEADER.size:
+        raise ValueError(f"{path}: нет заголовка журнала результатов")
+    magic, version, questions, record_size = HEADER.unpack(header)
+    if magic != MAGIC or version != LOG_VERSION or record_size != record_struct(questions).size:
+        raise ValueError(f"{path}: неизвестный формат журнала результатов")
+    return questions, (size - HEADER.size) // record_size
+
+
+@contextmanager
+def records_view(path):
+    """Zero-copy memoryview of the complete records, backed by a read-only mmap"""
+    questions, count = read_header(path)
+    if not count:
+        yield questions, memoryview(b'')
+        return
+    record_size = record_struct(questions).size
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)[HEADER.size:HEADER.size + count * record_size]
+    try:
+        yield questions, view
+    finally:
+        view.release()
+        mapped.close()
+
+
+def iter_records(path, start=0):
+    """Records from index ``start`` on as tuples, parsed chunk by chunk"""
+    with records_view(path) as (questions, view):
+        record = record_struct(questions)
+        step = CHUNK_RECORDS * record.size
+        for offset in range(start * record.size, len(view), step):
+            with view[offset:offset + step] as chunk:
+                rows = list(record.iter_unpack(chunk))
+            yield from rows
+
+
+class ResultsLog:
+    """Append-only file of fixed-size result records.
+
+    Appends are buffered in memory and written by a background task every
+    ``flush_interval`` seconds or every ``batch_records`` records, with one
+    fsync per batch; a crash loses at most the unflushed batch. A torn
+    record at the end of the file is cut off on open. Readers map the file
+    (``records_view``) and never load it whole.
+
+    Next to the log a checkpoint keeps aggregate counters together with
+    the number of records they cover, so on startup only records written
+    after the last clean shutdown have to be scanned.
+    """
+
+    def __init__(self, path, questions, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 batch_records=DEFAULT_BATCH_RECORDS):
+        self.path = path
+        self.checkpoint_path = f'{path}.counters'
+        self.questions = questions
+        self.record = record_struct(questions)
+        self.flush_interval = flush_interval
+        self.batch_records = batch_records
+        self.count = 0
+        self.flushes = 0
+        self.truncated = 0
+        self._buffer = bytearray()
+        self._pending = 0
+        self._fd = None
+        self._wakeup = asyncio.Event()
+        self._flush_task = None
+
+    async def open(self):
+        await asyncio.to_thread(self._open_file)
+        self._flush_task = asyncio.create_task(self._flush_loop())
+
+    def _open_file(self):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            size = os.fstat(fd).st_size
+            if size < HEADER.size:
+                os.ftruncate(fd, 0)
+                os.write(fd, HEADER.pack(MAGIC, LOG_VERSION, self.questions, self.record.size))
+                os.fsync(fd)
+                size = HEADER.size
+            else:
+                questions, _ = read_header(self.path)
+                if questions != self.questions:
+                    raise ValueError(
+                        f"{self.path}: журнал записан для {questions} вопросов, а в тесте {self.questions}"
+                    )
+            self.count, torn = divmod(size - HEADER.size, self.record.size)
+            if torn:
+                # Запись, оборванная при падении процесса
+                os.ftruncate(fd, size - torn)
+                os.fsync(fd)
+                self.truncated = torn
+                logger.warning("Обрезана неполная запись в конце %s: %s байт", self.path, torn)
+            os.lseek(fd, 0, os.SEEK_END)
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def append(self, user_id, timestamp, style, choices, positions):
+        self._buffer += self.record.pack(user_id, timestamp, style, choices, positions)
+        self._pending += 1
+        if self._pending >= self.batch_records:
+            self._wakeup.set()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        data, self._buffer = self._buffer, bytearray()
+        pending, self._pending = self._pending, 0
+        try:
+            await asyncio.to_thread(self._write, data)
+        except Exception:
+            # Записи не теряются: порядок сохраняется, новые идут после
+            self._buffer = data + self._buffer
+            self._pending += pending
+            raise
+        self.count += pending
+        self.flushes += 1
+
+    def _write(self, data):
+        start = os.lseek(self._fd, 0, os.SEEK_END)
+        try:
+            view = memoryview(data)
+            while view:
+                written = os.write(self._fd, view)
+                view = view[written:]
+            os.fsync(self._fd)
+        except OSError:
+            # Повтор записывает пачку целиком, частично записанное убираем
+            os.ftruncate(self._fd, start)
+            os.lseek(self._fd, start, os.SEEK_SET)
+            raise
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("Ошибка при записи в журнал результатов %s: %s", self.path, e)
+                logger.error("Traceback: %s", traceback.format_exc())
+
+    def records(self, start=0):
+        return iter_records(self.path, start)
+
+    def read_checkpoint(self):
+        """(records, counters) of the last checkpoint, or (0, None) if it does not match the log"""
+        try:
+            with open(self.checkpoint_path) as f:
+                checkpoint = json.load(f)
+            records = checkpoint['records']
+            counters = checkpoint['counters']
+        except (OSError, ValueError, KeyError, TypeError):
+            return 0, None
+        if not isinstance(records, int) or records > self.count:
+            return 0, None
+        return records, counters
+
+    def write_checkpoint(self, counters):
+        """Stores ``counters`` as covering every record flushed so far"""
+        tmp_path = f'{self.checkpoint_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'records': self.count, 'counters': counters}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def stats(self):
+        return {
+            'path': self.path,
+            'records': self.count,
+            'pending': self._pending,
+            'flushes': self.flushes,
+        }
+
+
+def _codes(values, no_answer):
+    return [STYLE_CODES[value] if value != no_answer else None for value in values]
+
+
+def export(paths, output, fmt='csv'):
+    """Streams the logs at ``paths`` to ``output`` as CSV or JSON lines; returns the record count"""
+    counts = {read_header(path)[0] for path in paths}
+    if len(counts) > 1:
+        raise ValueError(f"Журналы записаны для разного числа вопросов: {sorted(counts)}")
+    questions = counts.pop() if counts else 0
+    count = 0
+    if fmt == 'csv':
+        writer = csv.writer(output)
+        writer.writerow(
+            ['user_id', 'timestamp', 'style']
+            + [f'q{q}_choice' for q in range(1, questions + 1)]
+            + [f'q{q}_position' for q in range(1, questions + 1)]
+        )
+    records = (record for path in paths for record in iter_records(path))
+    for user_id, timestamp, style, choices, positions in records:
+        choice_codes = _codes(choices, NO_ANSWER)
+        button_positions = [position if position != NO_ANSWER else None for position in positions]
+        if fmt == 'csv':
+            writer.writerow(
+                [user_id, f'{timestamp:.3f}', STYLE_CODES[style]]
+                + ['' if code is None else code for code in choice_codes]
+                + ['' if position is None else position for position in button_positions]
+            )
+        else:
+            output.write(json.dumps({
+                'user_id': user_id,
+                'timestamp': timestamp,
+                'style': STYLE_CODES[style],
+                'choices': choice_codes,
+                'positions': button_positions,
+            }))
+            output.write('\n')
+        count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the results log without loading it into memory")
+    parser.add_argument('paths', nargs='*', help="logs to export; by default RESULTS_LOG (results.log) "
+                                                  "and the per-worker logs next to it")
+    parser.add_argument('--format', choices=('csv', 'jsonl'), default='csv')
+    parser.add_argument('--output', '-o', help="file to write, stdout by default")
+    args = parser.parse_args()
+    paths = args.paths or log_paths(os.getenv('RESULTS_LOG', 'results.log'))
+    if not paths:
+        parser.error("no results log found")
+    if args.output:
+        with open(args.output, 'w', newline='') as output:
+            count = export(paths, output, args.format)
+    else:
+        count = export(paths, sys.stdout, args.format)
+    print(f"Exported {count} records from {', '.join(paths)}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+# scoring.py
+from math import comb
+
+from sessions import STYLE_CODES
+
+DEFAULT_CONFIDENCE = 0.99
+DEFAULT_MIN_ANSWERS = 6
+
+
+def dominant_style(scores):
+    """Style with the most answers; a tie goes to the style earlier in STYLE_CODES"""
+    return max(STYLE_CODES, key=lambda code: scores.get(code, 0))
+
+
+def leader_confidence(leader, runner_up):
+    """Probability that the leader's share of the two styles' answers is above one half.
+
+    With a uniform prior the share follows Beta(leader + 1, runner_up + 1),
+    and P(share > 1/2) equals P(Binomial(n, 1/2) < leader + 1) for
+    n = leader + runner_up + 1.
+    """
+    n = leader + runner_up + 1
+    return sum(comb(n, k) for k in range(leader + 1)) / 2 ** n
+
+
+class EarlyStop:
+    """Decides when an assessment can end before its last question.
+
+    The test stops once no other style can reach the leader with the
+    questions that are left, or, after ``min_answers`` answers, once the
+    leader beats the runner-up with ``confidence``. A ``confidence`` above 1
+    keeps only the exact rule, so the result is always the same as after
+    all questions. Confidences are precomputed, a check is a few lookups.
+    """
+
+    def __init__(self, total, confidence=DEFAULT_CONFIDENCE, min_answers=DEFAULT_MIN_ANSWERS):
+        self.total = total
+        self.confidence = confidence
+        self.min_answers = min_answers
+        self._confidence = tuple(
+            tuple(leader_confidence(leader, runner_up) for runner_up in range(total + 1))
+            for leader in range(total + 1)
+        )
+
+    def decided(self, counts, answered):
+        """True when ``counts`` (one per style, in STYLE_CODES order) settle the result"""
+        remaining = self.total - answered
+        leader = max(range(len(counts)), key=counts.__getitem__)
+        lead = counts[leader]
+        runner_up = 0
+        reachable = False
+        for i, count in enumerate(counts):
+            if i == leader:
+                continue
+            if count > runner_up:
+                runner_up = count
+            # При равенстве побеждает стиль, который раньше в STYLE_CODES
+            if count + remaining > lead or (count + remaining == lead and i < leader):
+                reachable = True
+        if not reachable:
+            return True
+        return answered >= self.min_answers and self._confidence[lead][runner_up] >= self.confidence
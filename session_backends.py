@@ -0,0 +1,414 @@
+# session_backends.py
+import asyncio
+import logging
+import sqlite3
+import time
+import traceback
+from collections import deque
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_INTERVAL = 0.5
+DEFAULT_BATCH_SIZE = 256
+
+
+class SessionBackend:
+    """Persistent storage of serialized sessions keyed by user id.
+
+    Sessions are opaque bytes here; SessionStore owns (de)serialization and
+    the in-process cache in front of the backend.
+    """
+
+    name = 'base'
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def load(self, user_id):
+        raise NotImplementedError
+
+    async def save(self, user_id, data):
+        raise NotImplementedError
+
+    async def delete(self, user_id):
+        raise NotImplementedError
+
+    def stats(self):
+        return {'name': self.name}
+
+
+class MemoryBackend(SessionBackend):
+    """No persistence: the SessionStore cache is the only copy."""
+
+    name = 'memory'
+
+    async def load(self, user_id):
+        return None
+
+    async def save(self, user_id, data):
+        pass
+
+    async def delete(self, user_id):
+        pass
+
+
+class WriteBehindBackend(SessionBackend):
+    """Buffers writes and flushes them in batches from a background task.
+
+    Only the latest write per user is kept, so a user tapping through
+    several questions between flushes costs one row write. Pending writes
+    are visible to load() before they reach storage.
+    """
+
+    def __init__(self, flush_interval=DEFAULT_FLUSH_INTERVAL, batch_size=DEFAULT_BATCH_SIZE):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.flushes = 0
+        self.flushed_writes = 0
+        self.coalesced_writes = 0
+        self._pending = {}
+        self._wakeup = asyncio.Event()
+        self._flush_task = None
+
+    async def open(self):
+        await self._open_storage()
+        self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+        await self._close_storage()
+
+    async def load(self, user_id):
+        if user_id in self._pending:
+            return self._pending[user_id]
+        return await self._read(user_id)
+
+    async def save(self, user_id, data):
+        self._queue(user_id, data)
+
+    async def delete(self, user_id):
+        self._queue(user_id, None)
+
+    def _queue(self, user_id, data):
+        if user_id in self._pending:
+            self.coalesced_writes += 1
+        self._pending[user_id] = data
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        try:
+            await self._write_batch(batch)
+        except Exception:
+            # Не теряем записи: более новые значения из _pending имеют приоритет
+            batch.update(self._pending)
+            self._pending = batch
+            raise
+        self.flushes += 1
+        self.flushed_writes += len(batch)
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("Ошибка при записи сессий в %s: %s", self.name, e)
+                logger.error("Traceback: %s", traceback.format_exc())
+
+    def stats(self):
+        return {
+            'name': self.name,
+            'pending': len(self._pending),
+            'flushes': self.flushes,
+            'flushed_writes': self.flushed_writes,
+            'coalesced_writes': self.coalesced_writes,
+        }
+
+    async def _open_storage(self):
+        pass
+
+    async def _close_storage(self):
+        pass
+
+    async def _read(self, user_id):
+        raise NotImplementedError
+
+    async def _write_batch(self, batch):
+        raise NotImplementedError
+
+
+class SQLiteBackend(WriteBehindBackend):
+    """SQLite database in WAL mode; all queries run in a worker thread."""
+
+    name = 'sqlite'
+
+    def __init__(self, path='sessions.db', ttl=None, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.ttl = ttl
+        self._db = None
+
+    async def _open_storage(self):
+        self._db = await asyncio.to_thread(self._connect)
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=NORMAL')
+        db.execute(
+            'CREATE TABLE IF NOT EXISTS sessions ('
+            'user_id INTEGER PRIMARY KEY, data BLOB NOT NULL, updated REAL NOT NULL)'
+        )
+        return db
+
+    async def _close_storage(self):
+        if self._db is not None:
+            await asyncio.to_thread(self._db.close)
+            self._db = None
+
+    async def _read(self, user_id):
+        return await asyncio.to_thread(self._select, user_id)
+
+    def _select(self, user_id):
+        row = self._db.execute(
+            'SELECT data, updated FROM sessions WHERE user_id = ?', (user_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        if self.ttl is not None and time.time() - row[1] > self.ttl:
+            return None
+        return row[0]
+
+    async def _write_batch(self, batch):
+        await asyncio.to_thread(self._write, batch)
+
+    def _write(self, batch):
+        now = time.time()
+        upserts = [(user_id, data, now) for user_id, data in batch.items() if data is not None]
+        deletes = [(user_id,) for user_id, data in batch.items() if data is None]
+        with self._db:
+            self._db.execute('BEGIN')
+            if upserts:
+                self._db.executemany(
+                    'INSERT INTO sessions (user_id, data, updated) VALUES (?, ?, ?) '
+                    'ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated = excluded.updated',
+                    upserts
+                )
+            if deletes:
+                self._db.executemany('DELETE FROM sessions WHERE user_id = ?', deletes)
+            if self.ttl is not None:
+                self._db.execute('DELETE FROM sessions WHERE updated < ?', (now - self.ttl,))
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisConnection:
+    """Minimal pipelined RESP client: replies are matched to requests in order.
+
+    Once the connection breaks, every request still waiting for a reply
+    fails and further requests raise ConnectionError; the owner opens a
+    new connection.
+    """
+
+    def __init__(self, reader, writer):
+        self._reader = reader
+        self._writer = writer
+        self._waiters = deque()
+        self._reader_task = asyncio.create_task(self._read_replies())
+
+    @property
+    def closed(self):
+        return self._reader_task.done() or self._writer.is_closing()
+
+    @classmethod
+    async def connect(cls, host, port, db=0, password=None):
+        reader, writer = await asyncio.open_connection(host, port)
+        connection = cls(reader, writer)
+        if password:
+            await connection.execute('AUTH', password)
+        if db:
+            await connection.execute('SELECT', db)
+        return connection
+
+    @staticmethod
+    def _encode(args):
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if isinstance(arg, str):
+                arg = arg.encode()
+            elif isinstance(arg, int):
+                arg = str(arg).encode()
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        return b''.join(parts)
+
+    def send(self, *args):
+        if self.closed:
+            raise ConnectionError('Redis connection closed')
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        self._writer.write(self._encode(args))
+        return future
+
+    async def drain(self):
+        try:
+            await self._writer.drain()
+        except Exception as e:
+            self._fail(e)
+            raise
+
+    def _fail(self, error):
+        """Fails every request waiting for a reply and closes the socket"""
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_exception(ConnectionError(f'Redis connection lost: {error}'))
+        self._writer.close()
+
+    async def execute(self, *args):
+        future = self.send(*args)
+        await self.drain()
+        return await future
+
+    async def _read_reply(self):
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError('Redis connection closed')
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload.decode()
+        if kind == b'-':
+            return RedisError(payload.decode())
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            length = int(payload)
+            if length < 0:
+                return None
+            return [await self._read_reply() for _ in range(length)]
+        raise RedisError(f'Unexpected reply: {line!r}')
+
+    async def _read_replies(self):
+        try:
+            while True:
+                reply = await self._read_reply()
+                future = self._waiters.popleft()
+                if future.done():
+                    continue
+                if isinstance(reply, RedisError):
+                    future.set_exception(reply)
+                else:
+                    future.set_result(reply)
+        except Exception as e:
+            self._fail(e)
+
+    async def close(self):
+        self._reader_task.cancel()
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except Exception:
+            pass
+
+
+class RedisBackend(WriteBehindBackend):
+    """Redis (or any RESP-compatible server); a batch is sent as one pipeline."""
+
+    name = 'redis'
+
+    def __init__(self, url='redis://localhost:6379/0', ttl=None, prefix='session:', **kwargs):
+        super().__init__(**kwargs)
+        self.url = url
+        self.ttl = ttl
+        self.prefix = prefix
+        self.reconnects = 0
+        self._connection = None
+
+    def _key(self, user_id):
+        return f'{self.prefix}{user_id}'
+
+    async def _open_storage(self):
+        url = urlparse(self.url)
+        db = int(url.path.lstrip('/') or 0)
+        self._connection = await RedisConnection.connect(
+            url.hostname or 'localhost', url.port or 6379, db=db, password=url.password
+        )
+
+    async def _close_storage(self):
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+
+    async def _connected(self):
+        """Live connection; a broken one (restart of Redis, idle timeout) is replaced on first use"""
+        if self._connection is None or self._connection.closed:
+            if self._connection is not None:
+                logger.warning("Соединение с Redis потеряно, переподключение")
+                self.reconnects += 1
+            await self._close_storage()
+            await self._open_storage()
+        return self._connection
+
+    async def _read(self, user_id):
+        connection = await self._connected()
+        return await connection.execute('GET', self._key(user_id))
+
+    async def _write_batch(self, batch):
+        connection = await self._connected()
+        futures = []
+        try:
+            for user_id, data in batch.items():
+                if data is None:
+                    futures.append(connection.send('DEL', self._key(user_id)))
+                elif self.ttl is not None:
+                    futures.append(connection.send('SET', self._key(user_id), data, 'EX', int(self.ttl)))
+                else:
+                    futures.append(connection.send('SET', self._key(user_id), data))
+            await connection.drain()
+        finally:
+            # Ответы забираем все, даже если соединение оборвалось посреди пачки
+            replies = await asyncio.gather(*futures, return_exceptions=True)
+        for reply in replies:
+            if isinstance(reply, Exception):
+                raise reply
+
+    def stats(self):
+        stats = super().stats()
+        stats['reconnects'] = self.reconnects
+        return stats
+
+
+def create_backend(name, ttl=None, sqlite_path='sessions.db', redis_url='redis://localhost:6379/0'):
+    if name == 'memory':
+        return MemoryBackend()
+    if name == 'sqlite':
+        return SQLiteBackend(sqlite_path, ttl=ttl)
+    if name == 'redis':
+        return RedisBackend(redis_url, ttl=ttl)
+    raise ValueError(f'Unknown session backend: {name}')
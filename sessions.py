@@ -0,0 +1,239 @@
+# sessions.py
+import asyncio
+import logging
+import random
+import sys
+import time
+import traceback
+from collections import OrderedDict
+
+STYLE_CODES = 'ABCDE'
+STYLE_INDEX = {code: i for i, code in enumerate(STYLE_CODES)}
+
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_MAX_SIZE = 100_000
+
+# Версия бинарного формата сессии в постоянном хранилище
+SESSION_FORMAT = 1
+# Ответ хранится одним байтом: индекс стиля в младших битах, позиция кнопки в старших
+POSITION_SHIFT = 4
+STYLE_MASK = (1 << POSITION_SHIFT) - 1
+# Нонс сессии попадает в callback_data одной шестнадцатеричной цифрой
+NONCE_SPACE = 16
+
+logger = logging.getLogger(__name__)
+
+
+class Session:
+    """Progress of one user through the test: question index plus a counter per style.
+
+    ``nonce`` tells this test run apart from the user's earlier ones, so
+    buttons of old messages can be recognised; ``message_id`` is the
+    message with the question on screen (0 until it is sent), which tells
+    apart the messages that the nonce alone cannot. ``catalog`` is the
+    content version the test started with. ``order`` is the shuffled option
+    order of the question on screen. ``tally`` holds the style counters
+    followed by one byte per answer with the chosen style and the position
+    of its button; one buffer keeps the session small.
+    """
+
+    __slots__ = ('current_q', 'nonce', 'catalog', 'order', 'message_id', 'tally', 'touched')
+
+    def __init__(self, touched=0.0, nonce=0, catalog=0):
+        self.current_q = 0
+        self.nonce = nonce
+        self.catalog = catalog
+        self.order = 0
+        self.message_id = 0
+        self.tally = bytearray(len(STYLE_CODES))
+        self.touched = touched
+
+    @property
+    def counts(self):
+        return self.tally[:len(STYLE_CODES)]
+
+    @property
+    def answers(self):
+        return self.tally[len(STYLE_CODES):]
+
+    def record(self, style_code, position=0):
+        style = STYLE_INDEX[style_code]
+        self.tally[style] += 1
+        self.tally.append(style | position << POSITION_SHIFT)
+        self.current_q += 1
+
+    def scores(self):
+        return {code: self.tally[i] for i, code in enumerate(STYLE_CODES) if self.tally[i]}
+
+    def to_bytes(self):
+        header = (SESSION_FORMAT, self.current_q, self.nonce, self.order, self.catalog >> 8, self.catalog & 0xFF)
+        return bytes(header) + self.message_id.to_bytes(4, 'big') + self.tally
+
+    @classmethod
+    def from_bytes(cls, data, touched=0.0):
+        if not data or data[0] != SESSION_FORMAT:
+            return None
+        session = cls(touched, data[2], data[4] << 8 | data[5])
+        session.current_q = data[1]
+        session.order = data[3]
+        session.message_id = int.from_bytes(data[6:10], 'big')
+        session.tally[:] = data[10:]
+        return session
+
+
+class SessionStore:
+    """Sessions with idle-TTL and max-size eviction in front of a session backend.
+
+    The in-process map is the hot cache: reads of a cached session never
+    touch the backend, and evicting a session from the cache only drops the
+    local copy. Sessions are kept in least-recently-used order, so both
+    expired and surplus sessions are always at the front and eviction is
+    amortized O(1). Reading a missing user never creates a session.
+    Concurrent reads of a user that is not cached share one backend load,
+    so every handler of that user sees the same Session object.
+
+    With a shared backend each user must still be served by one process at a
+    time, otherwise the cached copies go stale.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, max_size=DEFAULT_MAX_SIZE, clock=time.monotonic, backend=None):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.clock = clock
+        self.backend = backend
+        self.evicted_ttl = 0
+        self.evicted_size = 0
+        self.backend_loads = 0
+        self._sessions = OrderedDict()
+        self._loading = {}
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, user_id):
+        return user_id in self._sessions
+
+    async def get(self, user_id):
+        session = self._cached(user_id)
+        if session is not None or self.backend is None:
+            return session
+        loading = self._loading.get(user_id)
+        if loading is not None:
+            return await asyncio.shield(loading)
+        loading = self._loading[user_id] = asyncio.get_running_loop().create_future()
+        try:
+            self.backend_loads += 1
+            data = await self.backend.load(user_id)
+            if data is not None:
+                session = Session.from_bytes(data, self.clock())
+            # Пока шла загрузка, пользователь мог начать новый тест
+            cached = self._sessions.get(user_id)
+            if cached is not None:
+                session = cached
+            elif session is not None:
+                self._insert(user_id, session)
+            loading.set_result(session)
+        except Exception as e:
+            loading.set_exception(e)
+            # Исключение получает и этот вызов, и все ожидающие загрузки
+            loading.exception()
+            raise
+        finally:
+            del self._loading[user_id]
+        return session
+
+    async def start(self, user_id, catalog=0):
+        previous = await self.get(user_id)
+        if previous is not None:
+            nonce = (previous.nonce + 1) % NONCE_SPACE
+        else:
+            nonce = random.randrange(NONCE_SPACE)
+        session = Session(self.clock(), nonce, catalog)
+        self._insert(user_id, session)
+        await self.save(user_id, session)
+        return session
+
+    async def save(self, user_id, session):
+        if self.backend is not None:
+            await self.backend.save(user_id, session.to_bytes())
+
+    async def pop(self, user_id):
+        session = self._sessions.pop(user_id, None)
+        if self.backend is not None:
+            if session is None:
+                session = await self.get(user_id)
+                self._sessions.pop(user_id, None)
+            await self.backend.delete(user_id)
+        return session
+
+    def _cached(self, user_id):
+        session = self._sessions.get(user_id)
+        if session is None:
+            return None
+        now = self.clock()
+        if now - session.touched > self.ttl:
+            del self._sessions[user_id]
+            self.evicted_ttl += 1
+            return None
+        session.touched = now
+        self._sessions.move_to_end(user_id)
+        return session
+
+    def _insert(self, user_id, session):
+        self._sessions[user_id] = session
+        self._sessions.move_to_end(user_id)
+        self.evict(session.touched)
+
+    def evict(self, now=None):
+        if now is None:
+            now = self.clock()
+        sessions = self._sessions
+        evicted = 0
+        while sessions:
+            user_id, session = next(iter(sessions.items()))
+            if now - session.touched > self.ttl:
+                self.evicted_ttl += 1
+            elif len(sessions) > self.max_size:
+                self.evicted_size += 1
+            else:
+                break
+            del sessions[user_id]
+            evicted += 1
+        return evicted
+
+    async def open(self):
+        if self.backend is not None:
+            await self.backend.open()
+
+    async def close(self):
+        if self.backend is not None:
+            try:
+                await self.backend.close()
+            except Exception as e:
+                logger.error("Ошибка при закрытии хранилища сессий: %s", e)
+                logger.error("Traceback: %s", traceback.format_exc())
+
+    def stats(self):
+        count = len(self._sessions)
+        session_bytes = (
+            sys.getsizeof(Session())
+            # Счётчики и ответы к середине теста
+            + sys.getsizeof(bytearray(len(STYLE_CODES) + 8))
+            + sys.getsizeof(0.0)
+        )
+        # Ключ и запись в OrderedDict (включая узел связного списка)
+        index_bytes = sys.getsizeof(self._sessions) // count if count else 0
+        per_session = session_bytes + index_bytes + sys.getsizeof(2 ** 40)
+        stats = {
+            'sessions': count,
+            'max_size': self.max_size,
+            'ttl': self.ttl,
+            'evicted_ttl': self.evicted_ttl,
+            'evicted_size': self.evicted_size,
+            'bytes_per_session': per_session,
+            'total_bytes': per_session * count,
+            'backend_loads': self.backend_loads,
+        }
+        if self.backend is not None:
+            stats['backend'] = self.backend.stats()
+        return stats
@@ -0,0 +1,26 @@
+# tests/test_catalog.py
+"""Content compiled by different processes must agree on the shuffled keyboards."""
+import os
+
+from catalog import ContentStore
+
+CONTENT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'content')
+
+
+def positions(store):
+    bank = store.catalog().questions
+    return [
+        (q_index, order_index, mapping, bank.position(q_index, order_index, mapping))
+        for q_index, question in enumerate(bank.questions)
+        for order_index in range(len(question.orders))
+        for mapping in question.mapping
+    ]
+
+
+def test_two_compiles_of_the_same_content_give_the_same_positions():
+    first, second = ContentStore(CONTENT_DIR), ContentStore(CONTENT_DIR)
+    first.load()
+    second.load()
+    assert first.version == second.version
+    assert positions(first) == positions(second)
+    assert first.catalog().questions[0].orders == second.catalog().questions[0].orders
@@ -0,0 +1,93 @@
+# tests/test_flood.py
+"""OutboundScheduler against the fake Bot API with flood limits."""
+import asyncio
+
+from aiogram.types import Message
+
+from bench.fake_api import FakeBotAPI, make_bot
+from outbound import OutboundScheduler, bulk
+
+
+def run_scheduled(scenario, scheduler=None, **api_options):
+    async def run():
+        api = await FakeBotAPI(**api_options).start()
+        bot = make_bot(api.url)
+        outbound = scheduler or OutboundScheduler()
+        bot.session.middleware(outbound)
+        try:
+            result = await scenario(api, bot, outbound)
+            await outbound.close()
+            return result
+        finally:
+            await bot.session.close()
+            await api.stop()
+
+    return asyncio.run(run())
+
+
+def test_every_call_is_delivered_under_the_chat_limit():
+    chats = (101, 102, 103)
+
+    async def scenario(api, bot, scheduler):
+        sends = [bot.send_message(chat_id, f"message {n}") for n in range(3) for chat_id in chats]
+        results = await asyncio.gather(*sends)
+        assert all(isinstance(result, Message) for result in results)
+        assert api.counts['sendMessage'] == len(sends)
+        assert scheduler.failed == 0
+
+    run_scheduled(scenario, chat_limit=1)
+
+
+def test_retry_after_is_retried_until_it_succeeds():
+    async def scenario(api, bot, scheduler):
+        # Корзина чата пропускает два сообщения подряд, а сервер только одно в секунду
+        first, second = await asyncio.gather(bot.send_message(201, "first"), bot.send_message(201, "second"))
+        assert isinstance(first, Message) and isinstance(second, Message)
+        assert api.flooded['sendMessage'] > 0
+        assert scheduler.retried > 0
+        assert scheduler.sent == 2 and scheduler.failed == 0
+
+    run_scheduled(scenario, chat_limit=1)
+
+
+def test_pending_edits_of_one_message_are_coalesced():
+    async def scenario(api, bot, scheduler):
+        # Пока сообщение в полёте, обе правки ждут в очереди чата
+        await asyncio.gather(
+            bot.send_message(301, "question"),
+            bot.edit_message_reply_markup(chat_id=301, message_id=7),
+            bot.edit_message_reply_markup(chat_id=301, message_id=7),
+        )
+        assert api.counts['editMessageReplyMarkup'] == 1
+        assert scheduler.coalesced == 1
+
+    run_scheduled(scenario)
+
+
+def test_interactive_calls_go_before_bulk():
+    bulk_chats = (401, 402, 403, 404)
+
+    async def scenario(api, bot, scheduler):
+        with bulk():
+            broadcast = [asyncio.create_task(bot.send_message(chat_id, "news")) for chat_id in bulk_chats]
+        # Первая рассылка уходит сразу, остальные ждут общую корзину
+        await asyncio.sleep(0.05)
+        await bot.send_message(400, "reply")
+        await asyncio.gather(*broadcast)
+        order = [int(params['chat_id']) for method, params in api.calls if method == 'sendMessage']
+        assert order[:2] == [bulk_chats[0], 400]
+
+    run_scheduled(scenario, OutboundScheduler(global_rate=4.0, global_burst=1))
+
+
+def test_idle_chat_buckets_are_purged_while_other_chats_are_busy():
+    async def scenario(api, bot, scheduler):
+        await asyncio.gather(*(bot.send_message(chat_id, "hello") for chat_id in range(501, 511)))
+        # Один чат всё ещё занят, а молчащие чаты не должны копить корзины
+        busy = asyncio.create_task(bot.send_message(600, "busy"))
+        await asyncio.sleep(0.1)
+        await asyncio.gather(*(bot.send_message(600, f"more {n}") for n in range(3)))
+        await busy
+        assert set(scheduler._buckets) <= {600}
+
+    run_scheduled(scenario, OutboundScheduler(chat_rate=1000.0, purge_every=4))
@@ -0,0 +1,105 @@
+# tests/test_outbound.py
+"""Bot API calls per answer tap, counted by the fake Bot API."""
+import asyncio
+import itertools
+
+from bench.fake_api import FakeBotAPI, make_bot
+from bench.updates import message_update, callback_update
+import main
+
+# main.user_data общий для всех тестов, поэтому у каждого теста свой пользователь
+_update_ids = itertools.count(1_000_000)
+
+
+def run_with_api(scenario):
+    async def run():
+        api = await FakeBotAPI().start()
+        bot = make_bot(api.url)
+        try:
+            return await scenario(api, bot)
+        finally:
+            await bot.session.close()
+            await api.stop()
+
+    return asyncio.run(run())
+
+
+async def start_test(api, bot, user_id):
+    await main.dp.feed_webhook_update(bot, message_update(next(_update_ids), '/test', user_id))
+
+
+async def tap(api, bot, user_id, data, message_id=None):
+    if message_id is None:
+        message_id = api.last_message_ids[user_id]
+    await main.dp.feed_webhook_update(bot, callback_update(next(_update_ids), data, message_id, user_id))
+
+
+def test_each_tap_edits_once_and_sends_once():
+    user_id = 2001
+
+    async def scenario(api, bot):
+        await start_test(api, bot, user_id)
+        assert dict(api.counts) == {'sendMessage': 1}
+        taps = 0
+        while user_id in main.user_data:
+            data = api.last_question(user_id)
+            api.counts.clear()
+            await tap(api, bot, user_id, data[0])
+            taps += 1
+            # Последнее нажатие тоже одна правка и одно сообщение, только с результатом
+            assert dict(api.counts) == {'editMessageReplyMarkup': 1, 'sendMessage': 1}
+        return taps
+
+    assert run_with_api(scenario) == main.content.questions
+
+
+def test_double_tap_is_only_acknowledged():
+    user_id = 2002
+
+    async def scenario(api, bot):
+        await start_test(api, bot, user_id)
+        data = api.last_question(user_id)
+        message_id = api.last_message_ids[user_id]
+        await tap(api, bot, user_id, data[0], message_id)
+        api.counts.clear()
+        await tap(api, bot, user_id, data[1], message_id)
+        assert dict(api.counts) == {'answerCallbackQuery': 1}
+        assert (await main.user_data.get(user_id)).current_q == 1
+
+    run_with_api(scenario)
+
+
+def test_tap_on_an_earlier_question_is_only_acknowledged():
+    user_id = 2003
+
+    async def scenario(api, bot):
+        await start_test(api, bot, user_id)
+        first = api.last_question(user_id)
+        first_message_id = api.last_message_ids[user_id]
+        await tap(api, bot, user_id, first[0])
+        await tap(api, bot, user_id, api.last_question(user_id)[0])
+        api.counts.clear()
+        await tap(api, bot, user_id, first[1], first_message_id)
+        assert dict(api.counts) == {'answerCallbackQuery': 1}
+        assert (await main.user_data.get(user_id)).current_q == 2
+
+    run_with_api(scenario)
+
+
+def test_button_of_an_earlier_test_is_only_acknowledged():
+    user_id = 2004
+
+    async def scenario(api, bot):
+        await start_test(api, bot, user_id)
+        old_message_id = api.last_message_ids[user_id]
+        await start_test(api, bot, user_id)
+        # Те же callback_data, что у нового вопроса: нонс совпал, как бывает в 1 случае из 16
+        data = api.last_question(user_id)
+        api.counts.clear()
+        await tap(api, bot, user_id, data[0], old_message_id)
+        assert dict(api.counts) == {'answerCallbackQuery': 1}
+        assert (await main.user_data.get(user_id)).current_q == 0
+        await tap(api, bot, user_id, data[0])
+        assert (await main.user_data.get(user_id)).current_q == 1
+
+    run_with_api(scenario)
@@ -0,0 +1,207 @@
+# tests/test_results_log.py
+"""Results log on disk: worker logs, crash recovery and the checkpoint."""
+import asyncio
+import csv
+import io
+import os
+
+import pytest
+
+from results import ResultsSink
+from results_log import ResultsLog, HEADER, CHUNK_RECORDS, export, iter_records, log_paths, read_header
+from sessions import POSITION_SHIFT
+
+QUESTIONS = 3
+
+
+def write_log(path, user_ids, questions=QUESTIONS):
+    async def write():
+        log = ResultsLog(str(path), questions)
+        await log.open()
+        for user_id in user_ids:
+            log.append(user_id, 1.0, user_id % 5, bytes([user_id % 5] * questions), bytes(range(questions)))
+        await log.close()
+
+    asyncio.run(write())
+
+
+def test_export_reads_the_worker_logs_of_a_cluster(tmp_path):
+    base = tmp_path / 'results.log'
+    write_log(f'{base}.0', [1, 2])
+    write_log(f'{base}.1', [3])
+    write_log(f'{base}.10', [4])
+    # Контрольные точки и временные файлы рядом с журналами не журналы
+    (tmp_path / 'results.log.0.counters').write_text('{}')
+    (tmp_path / 'results.log.0.counters.tmp').write_text('{}')
+    paths = log_paths(str(base))
+    assert paths == [f'{base}.0', f'{base}.1', f'{base}.10']
+
+    output = io.StringIO()
+    assert export(paths, output) == 4
+    rows = list(csv.reader(io.StringIO(output.getvalue())))
+    assert [row[0] for row in rows[1:]] == ['1', '2', '3', '4']
+
+
+def test_single_process_log_comes_first(tmp_path):
+    base = tmp_path / 'results.log'
+    write_log(base, [1])
+    write_log(f'{base}.0', [2])
+    assert log_paths(str(base)) == [str(base), f'{base}.0']
+
+
+def crash(log):
+    """Stops the log like a killed process: flushed records stay, no checkpoint, no close"""
+    log._flush_task.cancel()
+    os.close(log._fd)
+    log._fd = None
+
+
+def packed_answers(n):
+    # Стиль в младших битах, позиция кнопки в старших, как в Session.answers
+    return bytes(((n + q) % 5) | ((n * 3 + q) % 5) << POSITION_SHIFT for q in range(QUESTIONS))
+
+
+def add_results(sink, numbers):
+    for n in numbers:
+        sink.add(n, n % 5, packed_answers(n))
+
+
+def expected_counters(numbers):
+    sink = ResultsSink(QUESTIONS)
+    add_results(sink, numbers)
+    return sink.counters()
+
+
+def test_torn_tail_record_is_cut_on_open(tmp_path):
+    path = str(tmp_path / 'results.log')
+
+    async def scenario():
+        log = ResultsLog(path, QUESTIONS)
+        await log.open()
+        for n in range(5):
+            log.append(n, 1.0, 0, bytes(QUESTIONS), bytes(QUESTIONS))
+        await log.flush()
+        crash(log)
+        # Процесс упал посреди записи следующей записи
+        with open(path, 'ab') as f:
+            f.write(log.record.pack(5, 1.0, 0, bytes(QUESTIONS), bytes(QUESTIONS))[:7])
+
+        reopened = ResultsLog(path, QUESTIONS)
+        await reopened.open()
+        try:
+            assert (reopened.count, reopened.truncated) == (5, 7)
+            assert os.path.getsize(path) == HEADER.size + 5 * reopened.record.size
+            assert [record[0] for record in reopened.records()] == [0, 1, 2, 3, 4]
+        finally:
+            await reopened.close()
+
+    asyncio.run(scenario())
+
+
+def test_log_for_a_different_question_count_is_refused(tmp_path):
+    path = tmp_path / 'results.log'
+    write_log(path, [1, 2])
+
+    async def scenario():
+        log = ResultsLog(str(path), QUESTIONS + 1)
+        with pytest.raises(ValueError):
+            await log.open()
+        assert log._fd is None
+
+    asyncio.run(scenario())
+    assert read_header(str(path)) == (QUESTIONS, 2)
+
+
+def test_partial_write_is_rolled_back_and_retried(tmp_path, monkeypatch):
+    path = str(tmp_path / 'results.log')
+    real_write = os.write
+    failures = []
+
+    def write_half_then_fail(fd, data):
+        if not failures:
+            # Половина пачки успевает попасть в файл, потом диск заканчивается
+            failures.append(real_write(fd, data[:len(data) // 2]))
+            raise OSError(28, 'No space left on device')
+        return real_write(fd, data)
+
+    async def scenario():
+        log = ResultsLog(path, QUESTIONS)
+        await log.open()
+        try:
+            for n in range(4):
+                log.append(n, 1.0, 0, bytes(QUESTIONS), bytes(QUESTIONS))
+            monkeypatch.setattr(os, 'write', write_half_then_fail)
+            with pytest.raises(OSError):
+                await log.flush()
+            assert os.path.getsize(path) == HEADER.size
+            assert (log.count, log._pending) == (0, 4)
+
+            log.append(4, 1.0, 0, bytes(QUESTIONS), bytes(QUESTIONS))
+            await log.flush()
+            assert log.count == 5
+            assert [record[0] for record in log.records()] == [0, 1, 2, 3, 4]
+        finally:
+            await log.close()
+
+    asyncio.run(scenario())
+
+
+def test_counters_come_from_the_checkpoint_plus_the_records_after_it(tmp_path):
+    path = str(tmp_path / 'results.log')
+
+    async def scenario():
+        sink = ResultsSink(QUESTIONS, log=ResultsLog(path, QUESTIONS))
+        await sink.open()
+        add_results(sink, range(10))
+        await sink.close()
+
+        sink = ResultsSink(QUESTIONS, log=ResultsLog(path, QUESTIONS))
+        await sink.open()
+        assert sink.replayed == 0
+        assert sink.counters() == expected_counters(range(10))
+        add_results(sink, range(10, 16))
+        await sink.log.flush()
+        crash(sink.log)
+
+        # Контрольная точка покрывает 10 записей, остальные 6 пересчитываются
+        sink = ResultsSink(QUESTIONS, log=ResultsLog(path, QUESTIONS))
+        await sink.open()
+        try:
+            assert sink.replayed == 6
+            assert sink.counters() == expected_counters(range(16))
+        finally:
+            await sink.close()
+
+    asyncio.run(scenario())
+
+
+def test_checkpoint_newer_than_the_log_is_ignored(tmp_path):
+    path = str(tmp_path / 'results.log')
+
+    async def scenario():
+        sink = ResultsSink(QUESTIONS, log=ResultsLog(path, QUESTIONS))
+        await sink.open()
+        add_results(sink, range(8))
+        await sink.close()
+        # Журнал восстановлен из более старой копии, а контрольная точка осталась
+        with open(path, 'r+b') as f:
+            f.truncate(HEADER.size + 3 * sink.log.record.size)
+
+        sink = ResultsSink(QUESTIONS, log=ResultsLog(path, QUESTIONS))
+        await sink.open()
+        try:
+            assert sink.replayed == 3
+            assert sink.counters() == expected_counters(range(3))
+        finally:
+            await sink.close()
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize('count', [CHUNK_RECORDS - 1, CHUNK_RECORDS, CHUNK_RECORDS + 1, 2 * CHUNK_RECORDS + 3])
+def test_records_are_read_across_chunk_boundaries(tmp_path, count):
+    path = tmp_path / 'results.log'
+    write_log(path, range(count))
+    assert [record[0] for record in iter_records(str(path))] == list(range(count))
+    for start in (0, 1, CHUNK_RECORDS - 1, CHUNK_RECORDS, count - 1, count):
+        assert [record[0] for record in iter_records(str(path), start)] == list(range(start, count))
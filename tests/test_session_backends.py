@@ -0,0 +1,254 @@
+# tests/test_session_backends.py
+"""SessionStore over the SQLite and Redis backends, Redis played by bench.fake_redis."""
+import asyncio
+import time
+
+import pytest
+
+from bench.fake_redis import FakeRedis
+from session_backends import SQLiteBackend, RedisBackend, RedisConnection, RedisError
+from sessions import SessionStore
+
+BACKENDS = ('sqlite', 'redis')
+
+
+def backend_for(name, tmp_path, redis=None, **options):
+    if name == 'sqlite':
+        return SQLiteBackend(str(tmp_path / 'sessions.db'), **options)
+    return RedisBackend(redis.url, **options)
+
+
+def run_with_redis(scenario):
+    async def run():
+        redis = await FakeRedis().start()
+        try:
+            return await scenario(redis)
+        finally:
+            await redis.stop()
+
+    return asyncio.run(run())
+
+
+async def opened_store(backend):
+    store = SessionStore(backend=backend)
+    await store.open()
+    return store
+
+
+@pytest.mark.parametrize('name', BACKENDS)
+def test_saved_session_is_reloaded_by_a_new_store(name, tmp_path):
+    async def scenario(redis):
+        store = await opened_store(backend_for(name, tmp_path, redis))
+        session = await store.start(1, catalog=7)
+        session.record('B', 2)
+        session.message_id = 42
+        await store.save(1, session)
+        await store.close()
+
+        store = await opened_store(backend_for(name, tmp_path, redis))
+        try:
+            loaded = await store.get(1)
+            assert (loaded.current_q, loaded.nonce, loaded.catalog, loaded.message_id) == (1, session.nonce, 7, 42)
+            assert loaded.tally == session.tally
+            assert store.backend_loads == 1
+        finally:
+            await store.close()
+
+    run_with_redis(scenario)
+
+
+@pytest.mark.parametrize('name', BACKENDS)
+def test_popped_session_is_gone_after_reload(name, tmp_path):
+    async def scenario(redis):
+        store = await opened_store(backend_for(name, tmp_path, redis))
+        await store.start(2)
+        await store.backend.flush()
+        await store.pop(2)
+        await store.close()
+
+        store = await opened_store(backend_for(name, tmp_path, redis))
+        try:
+            assert await store.get(2) is None
+        finally:
+            await store.close()
+
+    run_with_redis(scenario)
+
+
+@pytest.mark.parametrize('name', BACKENDS)
+def test_writes_of_one_user_are_coalesced_into_one(name, tmp_path):
+    async def scenario(redis):
+        backend = backend_for(name, tmp_path, redis)
+        await backend.open()
+        try:
+            for n in range(5):
+                await backend.save(3, bytes([n]))
+            assert await backend.load(3) == bytes([4])
+            await backend.flush()
+            assert (backend.flushed_writes, backend.coalesced_writes) == (1, 4)
+            assert await backend._read(3) == bytes([4])
+        finally:
+            await backend.close()
+
+    run_with_redis(scenario)
+
+
+@pytest.mark.parametrize('name', BACKENDS)
+def test_failed_flush_keeps_the_writes_and_newer_ones_win(name, tmp_path):
+    async def scenario(redis):
+        backend = backend_for(name, tmp_path, redis)
+        await backend.open()
+        write_batch = backend._write_batch
+
+        async def failing_write(batch):
+            # Пока пачка пишется, пользователь успевает сохранить новое состояние
+            await backend.save(4, b'newer')
+            raise OSError('disk full')
+
+        try:
+            await backend.save(4, b'older')
+            await backend.save(5, b'kept')
+            backend._write_batch = failing_write
+            with pytest.raises(OSError):
+                await backend.flush()
+            assert backend._pending == {4: b'newer', 5: b'kept'}
+            assert await backend.load(4) == b'newer'
+
+            backend._write_batch = write_batch
+            await backend.flush()
+            assert backend._pending == {}
+            assert (await backend._read(4), await backend._read(5)) == (b'newer', b'kept')
+        finally:
+            await backend.close()
+
+    run_with_redis(scenario)
+
+
+def test_sqlite_drops_sessions_older_than_the_ttl(tmp_path):
+    async def scenario():
+        backend = SQLiteBackend(str(tmp_path / 'sessions.db'), ttl=0.05)
+        await backend.open()
+        try:
+            await backend.save(6, b'old')
+            await backend.flush()
+            await asyncio.sleep(0.1)
+            assert await backend.load(6) is None
+            # Устаревшие строки удаляет следующая запись
+            await backend.save(7, b'new')
+            await backend.flush()
+            rows = backend._db.execute('SELECT user_id FROM sessions').fetchall()
+            assert rows == [(7,)]
+        finally:
+            await backend.close()
+
+    asyncio.run(scenario())
+
+
+def test_redis_batch_is_one_pipeline_with_expiry():
+    async def scenario(redis):
+        backend = RedisBackend(redis.url, ttl=60)
+        await backend.open()
+        try:
+            for user_id in range(100, 150):
+                await backend.save(user_id, b'x')
+            await backend.delete(100)
+            await backend.flush()
+            assert len(redis.data) == 49
+            data, expires = redis.data[b'session:101']
+            assert data == b'x' and expires > time.monotonic()
+            assert backend.flushes == 1
+        finally:
+            await backend.close()
+
+    run_with_redis(scenario)
+
+
+def test_redis_backend_reconnects_after_a_server_restart():
+    async def scenario(redis):
+        backend = RedisBackend(redis.url)
+        await backend.open()
+        try:
+            await backend.save(8, b'before')
+            await backend.flush()
+
+            await redis.stop()
+            await asyncio.sleep(0.05)
+            # Сервер лежит: запись не теряется и уходит со следующей пачкой
+            await backend.save(9, b'during')
+            with pytest.raises(OSError):
+                await backend.flush()
+            assert backend._pending == {9: b'during'}
+
+            await redis.start()
+            await backend.flush()
+            assert await backend._read(8) == b'before'
+            assert await backend._read(9) == b'during'
+            assert backend.reconnects == 1
+        finally:
+            await backend.close()
+
+    run_with_redis(scenario)
+
+
+async def scripted_server(replies):
+    """Server that answers every command with the next of ``replies`` (None: never answers)"""
+    replies = iter(replies)
+    connections = []
+
+    async def serve(reader, writer):
+        connections.append(writer)
+        try:
+            while await reader.read(4096):
+                reply = next(replies, None)
+                if reply is not None:
+                    writer.write(reply)
+                    await writer.drain()
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(serve, '127.0.0.1', 0)
+    return server, connections
+
+
+def test_redis_replies_are_parsed_and_matched_in_order():
+    async def scenario():
+        server, _ = await scripted_server([
+            b'+OK\r\n:5\r\n$3\r\nabc\r\n$-1\r\n*2\r\n$1\r\na\r\n:1\r\n-ERR wrong type\r\n$0\r\n\r\n'
+        ])
+        connection = await RedisConnection.connect(*server.sockets[0].getsockname()[:2])
+        try:
+            futures = [connection.send('PING') for _ in range(7)]
+            await connection.drain()
+            replies = await asyncio.gather(*futures, return_exceptions=True)
+            assert replies[:5] == ['OK', 5, b'abc', None, [b'a', 1]]
+            assert isinstance(replies[5], RedisError) and str(replies[5]) == 'ERR wrong type'
+            assert replies[6] == b''
+        finally:
+            await connection.close()
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(scenario())
+
+
+def test_redis_waiters_fail_when_the_connection_drops():
+    async def scenario():
+        server, connections = await scripted_server([])
+        connection = await RedisConnection.connect(*server.sockets[0].getsockname()[:2])
+        try:
+            futures = [connection.send('GET', 'a'), connection.send('GET', 'b')]
+            await connection.drain()
+            await asyncio.sleep(0.05)
+            connections[0].close()
+            for future in futures:
+                with pytest.raises(ConnectionError):
+                    await asyncio.wait_for(future, 1)
+            assert connection.closed
+            with pytest.raises(ConnectionError):
+                connection.send('GET', 'c')
+        finally:
+            await connection.close()
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(scenario())
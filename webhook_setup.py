@@ -0,0 +1,77 @@
+# webhook_setup.py
+import asyncio
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = '.webhook.json'
+DEFAULT_CACHE_TTL = 24 * 60 * 60
+
+
+class WebhookRegistration:
+    """Sets the bot's webhook only when Telegram does not have it already.
+
+    The last known ``getWebhookInfo`` (url and allowed updates, with the bot
+    id, the Bot API server and the time it was checked) is cached in a
+    small JSON file. A boot with a matching, fresh cache makes no Bot API
+    calls; otherwise one ``getWebhookInfo`` tells whether ``setWebhook`` is
+    needed. Pending updates are never dropped.
+    """
+
+    def __init__(self, bot, url, cache_path=DEFAULT_CACHE_PATH, cache_ttl=DEFAULT_CACHE_TTL):
+        self.bot = bot
+        self.url = url
+        self.cache_path = cache_path
+        self.cache_ttl = cache_ttl
+        self.api_calls = 0
+
+    def _key(self):
+        # Один и тот же бот может смотреть на разные серверы Bot API (локальный, тестовый)
+        return {'bot_id': self.bot.id, 'api': self.bot.session.api.base}
+
+    def _wanted(self, allowed_updates):
+        return dict(self._key(), url=self.url, allowed_updates=sorted(allowed_updates or ()))
+
+    def _read_cache(self):
+        try:
+            with open(self.cache_path) as f:
+                cached = json.load(f)
+            checked = cached.pop('checked')
+        except (OSError, ValueError, KeyError, AttributeError):
+            return None
+        if not isinstance(checked, (int, float)) or time.time() - checked > self.cache_ttl:
+            return None
+        return cached
+
+    def _write_cache(self, info):
+        tmp_path = f'{self.cache_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(dict(info, checked=time.time()), f)
+        os.replace(tmp_path, self.cache_path)
+
+    async def ensure(self, allowed_updates=None):
+        """Returns 'cached', 'unchanged' or 'set' depending on what it took"""
+        wanted = self._wanted(allowed_updates)
+        if await asyncio.to_thread(self._read_cache) == wanted:
+            return 'cached'
+        info = await self.bot.get_webhook_info()
+        self.api_calls += 1
+        current = dict(self._key(), url=info.url, allowed_updates=sorted(info.allowed_updates or ()))
+        if current == wanted:
+            result = 'unchanged'
+        else:
+            await self.bot.set_webhook(self.url, allowed_updates=wanted['allowed_updates'], drop_pending_updates=False)
+            self.api_calls += 1
+            result = 'set'
+        await asyncio.to_thread(self._write_cache, wanted)
+        return result
+
+    def forget(self):
+        """Drops the cache, e.g. after the webhook was deleted for polling"""
+        try:
+            os.unlink(self.cache_path)
+        except FileNotFoundError:
+            pass